@@ -0,0 +1,40 @@
+#
+#   Copyright 2021  Adriano Cofrancesco
+#   Open-Source-Ecosystem-for-Remote-Control is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#   Open-Source-Ecosystem-for-Remote-Control is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+# Stand-in for pyserial as the opener of PortProbe: ports open after a delay, fail, or
+# hang like a dead Bluetooth COM port. Exercises the probe on machines without those ports:
+#   probe = PortProbe(['COM1', 'COM2'], FakePortBackend(['COM1'], hanging=['COM2']))
+
+import time
+
+import serial
+
+
+class FakePortBackend:
+
+    def __init__(self, available=(), delay=0.0, hanging=(), hang_time=30):
+        self.available = set(available)
+        self.delay = delay
+        self.hanging = set(hanging)
+        self.hang_time = hang_time
+        # every port the probe tried, in order
+        self.opened = []
+
+    def __call__(self, port, timeout):
+        if port in self.hanging:
+            time.sleep(self.hang_time)
+        time.sleep(self.delay)
+        self.opened.append(port)
+        if port not in self.available:
+            raise serial.SerialException("could not open port {}".format(port))
@@ -0,0 +1,307 @@
+#
+#   Copyright 2021  Adriano Cofrancesco
+#   Open-Source-Ecosystem-for-Remote-Control is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#   Open-Source-Ecosystem-for-Remote-Control is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+# Programmable serial device behind a pseudo-terminal, for benchmarks and tests
+# without hardware. The scenario sets the timing of the device:
+#   baudrate          bytes are paced at baudrate / 10 per second, both ways (0: no pacing)
+#   terminator        end of a command, reply_terminator ends every line sent
+#   delay             time before a reply: a number or {distribution: fixed|uniform|normal|
+#                     exponential, value, min, max, mean, stddev}, seeded by 'seed'
+#   responses         [{match: text | regex: pattern, reply: text | [texts], delay}], the
+#                     reply may use the regex groups as {0}, {1}, ... and a list is cycled
+#   echo / default    reply to unmatched commands: the command itself, or 'default'
+#   bursts            [{every, data, lines, delay}] unsolicited output, 'every' like 'delay'
+#   link              symlink created to the pty, for tools that want a fixed port name
+# A Python scenario file defines 'scenario' (a dict) and may define respond(command),
+# called first for every command: a str or bytes reply, or None to go on with the rules.
+# As a fixture:
+#   with SerialEmulator(load_scenario('scenarios/instrument.yaml')) as device:
+#       session = SerialSession(device.port)
+# or standalone, printing the port to use until Ctrl-C:
+#   python3 SerialEmulator.py [scenarios/instrument.yaml] [--link /tmp/ttyEMU0]
+
+import argparse
+import os
+import random
+import re
+import runpy
+import threading
+import time
+import tty
+
+import yaml
+
+defaultScenario = {
+    'baudrate': 0,
+    'terminator': '\n',
+    'reply_terminator': '\n',
+    'delay': 0,
+    'seed': None,
+    'echo': True,
+    'default': 'ERROR',
+    'responses': [],
+    'bursts': [],
+    'link': None,
+    'respond': None,
+}
+
+
+def load_scenario(path):
+    if path.endswith('.py'):
+        namespace = runpy.run_path(path)
+        scenario = dict(namespace.get('scenario') or {})
+        if 'respond' in namespace:
+            scenario['respond'] = namespace['respond']
+        return scenario
+
+    with open(path) as file:
+        return yaml.safe_load(file) or {}
+
+
+# a function returning a delay in seconds from the random generator of the device
+def make_delay(spec):
+    if spec is None:
+        return lambda rng: 0.0
+    if isinstance(spec, (int, float)):
+        return lambda rng: float(spec)
+
+    distribution = spec.get('distribution', 'fixed')
+    if distribution == 'fixed':
+        value = float(spec.get('value', 0))
+        return lambda rng: value
+    if distribution == 'uniform':
+        low, high = float(spec['min']), float(spec['max'])
+        return lambda rng: rng.uniform(low, high)
+    if distribution == 'normal':
+        mean, stddev = float(spec['mean']), float(spec['stddev'])
+        return lambda rng: max(0.0, rng.gauss(mean, stddev))
+    if distribution == 'exponential':
+        mean = float(spec['mean'])
+        return lambda rng: rng.expovariate(1 / mean) if mean > 0 else 0.0
+
+    raise ValueError("Unknown delay distribution: {}".format(distribution))
+
+
+def encode(text):
+    return text if isinstance(text, bytes) else str(text).encode('utf-8')
+
+
+class Response:
+
+    def __init__(self, spec):
+        self.match = spec.get('match')
+        self.regex = re.compile(spec['regex']) if 'regex' in spec else None
+        replies = spec.get('reply', '')
+        self.replies = replies if isinstance(replies, list) else [replies]
+        self.next_reply = 0
+        self.delay = make_delay(spec['delay']) if 'delay' in spec else None
+
+    # the reply to a command, None when this rule does not apply
+    def reply(self, command):
+        groups = ()
+        if self.regex is not None:
+            found = self.regex.fullmatch(command)
+            if found is None:
+                return None
+            groups = found.groups()
+        elif command != self.match:
+            return None
+
+        reply = self.replies[self.next_reply % len(self.replies)]
+        self.next_reply += 1
+        return str(reply).format(*groups)
+
+
+class SerialEmulator:
+
+    def __init__(self, scenario=None, **overrides):
+        scenario = dict(defaultScenario, **(scenario or {}))
+        scenario.update(overrides)
+
+        self.baudrate = scenario['baudrate']
+        self.terminator = encode(scenario['terminator'])
+        self.reply_terminator = encode(scenario['reply_terminator'])
+        self.delay = make_delay(scenario['delay'])
+        self.rng = random.Random(scenario['seed'])
+        self.echo = scenario['echo']
+        self.default = scenario['default']
+        self.responses = [Response(spec) for spec in scenario['responses']]
+        self.bursts = scenario['bursts']
+        self.link = scenario['link']
+        self.respond = scenario['respond']
+
+        self.master = None
+        self.slave = None
+        self.port = None
+        self.running = False
+        self.threads = []
+        # replies and bursts are interleaved line by line, never inside a line
+        self.write_lock = threading.Lock()
+
+        self.commands = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    # seconds the device needs to send or receive size bytes, 8N1 framing
+    def wire_time(self, size):
+        return size * 10 / self.baudrate if self.baudrate else 0.0
+
+    def start(self):
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.master)
+        tty.setraw(self.slave)
+        # the slave end stays open so the pty survives the serial port being closed
+        self.port = os.ttyname(self.slave)
+        if self.link:
+            if os.path.islink(self.link):
+                os.remove(self.link)
+            os.symlink(self.port, self.link)
+
+        self.running = True
+        self.threads = [threading.Thread(target=self.serve, daemon=True)]
+        for burst in self.bursts:
+            self.threads.append(threading.Thread(target=self.burst, args=(burst,), daemon=True))
+        for thread in self.threads:
+            thread.start()
+
+        return self
+
+    def close(self):
+        self.running = False
+        for fd in (self.slave, self.master):
+            if fd is not None:
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+        self.slave = self.master = None
+
+        if self.link and os.path.islink(self.link):
+            os.remove(self.link)
+
+    # commands are handled one after the other, like a device with a single command parser
+    def serve(self):
+        buffer = bytearray()
+        while self.running:
+            try:
+                data = os.read(self.master, 65536)
+            except OSError:
+                return
+            if not data:
+                return
+            received = time.monotonic()
+            self.bytes_in += len(data)
+            buffer += data
+
+            while True:
+                index = buffer.find(self.terminator)
+                if index < 0:
+                    break
+                command = bytes(buffer[:index])
+                del buffer[:index + len(self.terminator)]
+                # the command is complete once its last byte went through the wire
+                received += self.wire_time(len(command) + len(self.terminator))
+                self.handle(command, received)
+
+    def handle(self, command, received):
+        self.commands += 1
+        reply, delay = self.reply_for(command.decode('utf-8', 'replace'))
+        if reply is None:
+            return
+
+        wait = received + delay(self.rng) - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        self.send(encode(reply) + self.reply_terminator)
+
+    def reply_for(self, command):
+        if self.respond is not None:
+            reply = self.respond(command)
+            if reply is not None:
+                return reply, self.delay
+
+        for response in self.responses:
+            reply = response.reply(command)
+            if reply is not None:
+                return reply, response.delay or self.delay
+
+        if self.echo:
+            return command, self.delay
+        return self.default, self.delay
+
+    # write at the pace of the baud rate, in chunks of about a millisecond
+    def send(self, data):
+        with self.write_lock:
+            if not self.baudrate:
+                self.write(data)
+                return
+
+            chunk = max(1, self.baudrate // 10000)
+            start = time.monotonic()
+            for offset in range(0, len(data), chunk):
+                wait = start + self.wire_time(offset) - time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+                self.write(data[offset:offset + chunk])
+
+    def write(self, data):
+        view = memoryview(data)
+        while view:
+            try:
+                view = view[os.write(self.master, view):]
+            except (OSError, TypeError):
+                # device closed while writing
+                return
+        self.bytes_out += len(data)
+
+    def burst(self, spec):
+        every = make_delay(spec.get('every', 1))
+        delay = make_delay(spec.get('delay', 0))
+        lines = spec.get('lines', 1)
+        data = encode(spec.get('data', ''))
+        while self.running:
+            time.sleep(every(self.rng))
+            if not self.running:
+                return
+            for _ in range(lines):
+                self.send(data + self.reply_terminator)
+                time.sleep(delay(self.rng))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Programmable serial device behind a pseudo-terminal")
+    parser.add_argument('scenario', nargs='?', help="yaml or python scenario file (default: echo)")
+    parser.add_argument('--link', help="symlink to the pty, overrides the scenario")
+    args = parser.parse_args()
+
+    try:
+        scenario = load_scenario(args.scenario) if args.scenario else {}
+    except OSError as error:
+        parser.error("cannot read scenario: {}".format(error))
+    if args.link:
+        scenario['link'] = args.link
+
+    with SerialEmulator(scenario) as device:
+        print("Emulated device on {}{}".format(device.port, " ({})".format(device.link) if device.link else ""))
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            print("Commands: {}, bytes in: {}, bytes out: {}".format(device.commands, device.bytes_in, device.bytes_out))
@@ -0,0 +1,127 @@
+#
+#   Copyright 2021  Adriano Cofrancesco
+#   Open-Source-Ecosystem-for-Remote-Control is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#   Open-Source-Ecosystem-for-Remote-Control is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+# Image loading of the GUIs at startup: the old pic2str module (base64 strings
+# imported with main.py) versus the lazy assets.bundle. Every run is a fresh
+# interpreter so the import cost is measured as the GUI sees it:
+#   python3 assetBenchmark.py [--runs 20] [--json results.json]
+# The QPixmap decoding is measured too when PyQt5 is installed.
+
+import argparse
+import base64
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+
+guiPath = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'raspberryGUI', 'serviceGUI_Raspberry')
+sys.path.insert(0, guiPath)
+
+from pictureConverter import images
+
+names = [name for name, path in images]
+
+legacyCode = '''
+import base64, time
+start = time.perf_counter()
+import pic2str
+images = [base64.b64decode(getattr(pic2str, name)) for name in {names!r}]
+print(time.perf_counter() - start)
+'''
+
+bundleCode = '''
+import time
+start = time.perf_counter()
+from AssetBundle import assets
+images = [assets.read(name) for name in {names!r}]
+print(time.perf_counter() - start)
+'''
+
+pixmapCode = '''
+import time
+from PyQt5.QtWidgets import QApplication
+app = QApplication(['bench', '-platform', 'offscreen'])
+start = time.perf_counter()
+from AssetBundle import assets
+pixmaps = [assets.pixmap(name) for name in {names!r}]
+first = time.perf_counter() - start
+start = time.perf_counter()
+pixmaps = [assets.pixmap(name) for name in {names!r}]
+print(first, time.perf_counter() - start)
+'''
+
+
+# the module pictureConverter.py used to generate, with every image added four times
+def write_legacy_module(directory, copies=4):
+    with open(os.path.join(directory, 'pic2str.py'), 'w') as file:
+        for _ in range(copies):
+            for name, path in images:
+                with open(os.path.join(guiPath, path), 'rb') as image:
+                    file.write('{} = {}\n'.format(name, base64.b64encode(image.read())))
+
+
+def run(code, path, runs):
+    env = dict(os.environ, PYTHONPATH=path)
+    # the first run writes the .pyc files, like the first start of the GUI
+    subprocess.run([sys.executable, '-c', code], env=env, check=True, capture_output=True)
+    times = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', code], env=env, check=True, capture_output=True, text=True)
+        times.append([float(value) for value in output.stdout.split()])
+
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GUI asset loading benchmark")
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--json', help="write results to this file")
+    args = parser.parse_args()
+
+    results = {'platform': platform.platform(), 'python': platform.python_version(), 'runs': args.runs,
+               'bundle_bytes': os.path.getsize(os.path.join(guiPath, 'assets.bundle'))}
+
+    with tempfile.TemporaryDirectory() as directory:
+        write_legacy_module(directory)
+        results['legacy_module_bytes'] = os.path.getsize(os.path.join(directory, 'pic2str.py'))
+        legacy = run(legacyCode.format(names=names), directory, args.runs)
+    results['legacy_ms'] = statistics.median(times[0] for times in legacy) * 1000
+
+    bundle = run(bundleCode.format(names=names), guiPath, args.runs)
+    results['bundle_ms'] = statistics.median(times[0] for times in bundle) * 1000
+
+    print("pic2str module {} bytes, import and decode {:.2f} ms".format(results['legacy_module_bytes'],
+                                                                       results['legacy_ms']))
+    print("assets.bundle  {} bytes, index and read   {:.2f} ms".format(results['bundle_bytes'],
+                                                                       results['bundle_ms']))
+
+    try:
+        pixmaps = run(pixmapCode.format(names=names), guiPath, args.runs)
+        results['pixmap_first_ms'] = statistics.median(times[0] for times in pixmaps) * 1000
+        results['pixmap_cached_ms'] = statistics.median(times[1] for times in pixmaps) * 1000
+        print("QPixmap decode {:.2f} ms, cached {:.4f} ms".format(results['pixmap_first_ms'],
+                                                                  results['pixmap_cached_ms']))
+    except subprocess.CalledProcessError:
+        print("PyQt5 not available, QPixmap decoding not measured")
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
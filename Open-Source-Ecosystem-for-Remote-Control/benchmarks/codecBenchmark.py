@@ -0,0 +1,89 @@
+#
+#   Copyright 2021  Adriano Cofrancesco
+#   Open-Source-Ecosystem-for-Remote-Control is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#   Open-Source-Ecosystem-for-Remote-Control is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+# Encode/decode cost per control message type for every codec.
+# Run it on the target device, e.g. on the Pi:
+#   python3 codecBenchmark.py [--number 2000] [--json results.json]
+
+import argparse
+import json
+import os
+import platform
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scriptsRaspberry'))
+
+import yaml
+from MessageCodec import YAML, BINARY, supported_codecs
+
+
+class PureYamlCodec:
+    name = 'yaml-pure'
+
+    # what every endpoint used before the codec layer
+    def encode(self, message):
+        return yaml.dump(message).encode('utf-8')
+
+    def decode(self, data):
+        return yaml.load(data.decode('utf-8'), Loader=yaml.FullLoader)
+
+
+PUBKEY = "-----BEGIN PUBLIC KEY-----\n" + "\n".join(["A" * 64] * 6) + "\n-----END PUBLIC KEY-----"
+
+messages = {
+    'GET_PORTS': {'msg': 'GET_PORTS', 'codecs': supported_codecs},
+    'OPEN_CONNECTION': {'msg': 'OPEN_CONNECTION', 'comPort': '/dev/ttyUSB0', 'codecs': supported_codecs},
+    'CHECK': {'msg': 'CHECK'},
+    'check': {'check': '1234\n'},
+    'pubkey': {'pubkey': PUBKEY, 'session': ['AES-GCM'], 'codecs': supported_codecs},
+    'comPorts': {'comPorts': ['/dev/ttyAMA0', '/dev/ttyUSB0', '/dev/ttyUSB1', '/dev/ttyACM0']},
+}
+
+
+def measure(codec, message, number):
+    data = codec.encode(message)
+    encode = timeit.timeit(lambda: codec.encode(message), number=number) / number
+    decode = timeit.timeit(lambda: codec.decode(data), number=number) / number
+
+    return {'bytes': len(data), 'encode_us': encode * 1e6, 'decode_us': decode * 1e6}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Control message codec benchmark")
+    parser.add_argument('--number', type=int, default=2000, help="iterations per measure")
+    parser.add_argument('--json', help="write results to this file")
+    args = parser.parse_args()
+
+    codecs = [PureYamlCodec(), YAML, BINARY]
+    YAML.load_yaml()
+    results = {'platform': platform.platform(), 'python': platform.python_version(),
+               'yaml_loader': YAML.loader.__name__, 'messages': {}}
+
+    print("{:<16} {:<10} {:>7} {:>11} {:>11}".format("message", "codec", "bytes", "encode us", "decode us"))
+    for name, message in messages.items():
+        results['messages'][name] = {}
+        for codec in codecs:
+            result = measure(codec, message, args.number)
+            results['messages'][name][codec.name] = result
+            print("{:<16} {:<10} {:>7} {:>11.1f} {:>11.1f}".format(
+                name, codec.name, result['bytes'], result['encode_us'], result['decode_us']))
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,249 @@
+#
+#   Copyright 2021  Adriano Cofrancesco
+#   Open-Source-Ecosystem-for-Remote-Control is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#   Open-Source-Ecosystem-for-Remote-Control is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+# Round trip of the serial data paths over loopback, against a pseudo-terminal
+# standing in for the serial device. No hardware needed, plain Linux:
+#   python3 loopbackBenchmark.py [--modes plain,plain-async,session,rsa]
+#                                [--sizes 16,256,1024,4096] [--count 300] [--json results.json]
+#                                [--scenario scenarios/instrument.yaml] [--endpoints tcp,unix]
+# plain and plain-async drive ServerTCP (wireguard setup) with framed messages,
+# session and rsa play the server side of TCPClientRSASerial: one AES-GCM key for
+# the session, or the old RSA + AES-EAX envelope on every message. The device echoes
+# every line unless a SerialEmulator.py scenario gives it another behaviour.
+# --endpoints runs every mode over TCP loopback and over a unix: endpoint, a Unix
+# domain socket, to compare the two for hops on the same machine.
+
+import argparse
+import base64
+import contextlib
+import json
+import os
+import platform
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scriptsRaspberry'))
+
+from Cryptodome.Cipher import AES, PKCS1_OAEP
+from Cryptodome.PublicKey import RSA
+from Cryptodome.Random import get_random_bytes
+
+from Framing import MessageStream
+from KeyStore import KeyStore
+from MessageCodec import YAML, decode_message, supported_codecs
+from SerialEmulator import SerialEmulator, load_scenario
+from ServerTCP import ServerTCP
+from ServiceStatus import StatusReporter
+from SessionCipher import SessionCipher, SESSION_MODE
+from TCPClientRSASerialRaspberry import TCPClientRSASerial
+
+modes = ['plain', 'plain-async', 'session', 'rsa']
+endpoints = ['tcp', 'unix']
+
+
+def ignore_status(message):
+    pass
+
+
+def no_delay(sock):
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return sock
+
+
+# the envelope TCPClientRSASerial uses without session mode, seen from the server
+def rsa_encrypt(public_key, data):
+    session_key = get_random_bytes(16)
+    enc_session_key = PKCS1_OAEP.new(public_key).encrypt(session_key)
+    cipher_aes = AES.new(session_key, AES.MODE_EAX)
+    cipher_text, tag = cipher_aes.encrypt_and_digest(data)
+
+    return enc_session_key + cipher_aes.nonce + tag + cipher_text
+
+
+def rsa_decrypt(private_key, data):
+    nonce_index = private_key.size_in_bytes()
+    tag_index = nonce_index + 16
+    text_index = tag_index + 16
+    session_key = PKCS1_OAEP.new(private_key).decrypt(data[:nonce_index])
+    cipher_aes = AES.new(session_key, AES.MODE_EAX, data[nonce_index:tag_index])
+
+    return cipher_aes.decrypt_and_verify(data[text_index:], data[tag_index:text_index])
+
+
+# ServerTCP on a free port or a socket file, the benchmark is its client
+def plain_path(device, use_async, unix_path):
+    server = ServerTCP('unix:' + unix_path if unix_path else '127.0.0.1', 0, device.port)
+    server.status = StatusReporter('ServerTCP', callback=ignore_status)
+    threading.Thread(target=server.run_async if use_async else server.run, daemon=True).start()
+
+    if unix_path:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(unix_path)
+    else:
+        sock = no_delay(socket.create_connection(server.socket.getsockname()))
+    stream = MessageStream(sock, framed=True, idle_timeout=10)
+
+    def roundtrip(payload):
+        stream.send(payload)
+        return stream.recv().rstrip(b'\n')
+
+    def close():
+        sock.close()
+        if not use_async:
+            server.socket.close()
+
+    return roundtrip, close
+
+
+# TCPClientRSASerial connects to the benchmark, which plays the remote server
+def rsa_path(device, session, unix_path, server_key, key_store):
+    if unix_path:
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(unix_path)
+        listener.listen()
+        host, port = 'unix:' + unix_path, 0
+    else:
+        listener = socket.create_server(('127.0.0.1', 0))
+        host, port = listener.getsockname()
+    client = TCPClientRSASerial(host, port, device.port, key_store,
+                                StatusReporter('TCPClientRSASerialRaspberry', callback=ignore_status))
+    thread = threading.Thread(target=client.run, daemon=True)
+    thread.start()
+
+    conn = listener.accept()[0]
+    if not unix_path:
+        no_delay(conn)
+    listener.close()
+    stream = MessageStream(conn, framed=True, idle_timeout=10)
+
+    hello = {'pubkey': server_key.publickey().export_key().decode('utf-8'), 'codecs': supported_codecs}
+    if session:
+        hello['session'] = [SESSION_MODE]
+    stream.send(YAML.encode(hello))
+
+    packet = decode_message(rsa_decrypt(server_key, stream.recv()))
+    client_key = RSA.import_key(packet['pubkey'])
+    cipher = None
+    if session:
+        cipher = SessionCipher(base64.b64decode(packet['sessionKey']), initiator=False)
+
+    def roundtrip(payload):
+        if cipher is not None:
+            stream.send(cipher.encrypt(payload))
+            return cipher.decrypt(stream.recv())
+
+        stream.send(rsa_encrypt(client_key, payload))
+        return rsa_decrypt(server_key, stream.recv())
+
+    def close():
+        conn.close()
+        thread.join(5)
+
+    return roundtrip, close
+
+
+def measure(roundtrip, size, count, warmup):
+    payload = b'x' * size
+    for _ in range(warmup):
+        reply = roundtrip(payload)
+    if reply != payload:
+        raise RuntimeError("Unexpected reply of {} bytes".format(len(reply)))
+
+    times = []
+    start = time.perf_counter()
+    for _ in range(count):
+        sent = time.perf_counter()
+        roundtrip(payload)
+        times.append(time.perf_counter() - sent)
+    total = time.perf_counter() - start
+
+    percentiles = statistics.quantiles(times, n=100)
+    return {'size': size, 'count': count,
+            'p50_ms': percentiles[49] * 1000, 'p99_ms': percentiles[98] * 1000,
+            'mean_ms': statistics.mean(times) * 1000, 'max_ms': max(times) * 1000,
+            'cmds_per_s': count / total}
+
+
+def run_mode(mode, endpoint, sizes, count, warmup, keys, scenario, directory):
+    unix_path = None
+    if endpoint == 'unix':
+        unix_path = os.path.join(directory, '{}.sock'.format(mode))
+    device = SerialEmulator(scenario).start()
+    try:
+        if mode in ('plain', 'plain-async'):
+            roundtrip, close = plain_path(device, mode == 'plain-async', unix_path)
+        else:
+            roundtrip, close = rsa_path(device, mode == 'session', unix_path, *keys)
+
+        try:
+            return [dict(measure(roundtrip, size, count, warmup), mode=mode, endpoint=endpoint) for size in sizes]
+        finally:
+            close()
+    finally:
+        device.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serial data path loopback benchmark")
+    parser.add_argument('--modes', default=','.join(modes), help="comma separated, among {}".format(', '.join(modes)))
+    parser.add_argument('--sizes', default='16,256,1024,4096', help="payload sizes in bytes")
+    parser.add_argument('--count', type=int, default=300, help="commands per payload size")
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--endpoints', default='tcp', help="comma separated, among {}".format(', '.join(endpoints)))
+    parser.add_argument('--scenario', help="device scenario, yaml or python (default: echo)")
+    parser.add_argument('--verbose', action='store_true', help="keep the output of the servers")
+    parser.add_argument('--json', help="write results to this file")
+    args = parser.parse_args()
+
+    selected = args.modes.split(',')
+    for mode in selected:
+        if mode not in modes:
+            parser.error("unknown mode {}".format(mode))
+    selected_endpoints = args.endpoints.split(',')
+    for endpoint in selected_endpoints:
+        if endpoint not in endpoints:
+            parser.error("unknown endpoint {}".format(endpoint))
+    sizes = [int(size) for size in args.sizes.split(',')]
+    scenario = load_scenario(args.scenario) if args.scenario else None
+
+    results = {'platform': platform.platform(), 'python': platform.python_version(),
+               'count': args.count, 'scenario': args.scenario, 'results': []}
+
+    with tempfile.TemporaryDirectory() as directory:
+        keys = None
+        if 'session' in selected or 'rsa' in selected:
+            keys = (RSA.generate(2048), KeyStore(os.path.join(directory, 'identity_key.pem')))
+
+        # the servers print every message, that is not what is measured here
+        output = sys.stdout if args.verbose else open(os.devnull, 'w')
+        with contextlib.redirect_stdout(output):
+            for mode in selected:
+                for endpoint in selected_endpoints:
+                    results['results'] += run_mode(mode, endpoint, sizes, args.count, args.warmup, keys, scenario, directory)
+
+    print("{:<12} {:<8} {:>7} {:>9} {:>9} {:>9} {:>10}".format("mode", "endpoint", "bytes", "p50 ms", "p99 ms", "mean ms", "cmds/s"))
+    for result in results['results']:
+        print("{mode:<12} {endpoint:<8} {size:>7} {p50_ms:>9.3f} {p99_ms:>9.3f} {mean_ms:>9.3f} {cmds_per_s:>10.0f}".format(**result))
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
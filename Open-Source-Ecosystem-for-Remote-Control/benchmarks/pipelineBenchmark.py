@@ -0,0 +1,200 @@
+#
+#   Copyright 2021  Adriano Cofrancesco
+#   Open-Source-Ecosystem-for-Remote-Control is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#   Open-Source-Ecosystem-for-Remote-Control is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+# Pipelined data path against one command at a time, over a link with added latency:
+# operator -> relay -> delay link -> TCPClientRSASerial -> emulated serial device.
+#   python3 pipelineBenchmark.py [--rtts 0,20,50] [--count 200] [--size 16]
+#                                [--baudrate 115200] [--window 32] [--json results.json]
+# The delay link holds every chunk for half the round trip in each direction, like a
+# VPN to a remote site. One command at a time is bound by 1/RTT, the pipelined mode
+# should get close to the serial bound: baudrate / 10 bytes per second, both ways.
+
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import platform
+import queue
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+here = os.path.dirname(os.path.abspath(__file__))
+relay_dir = os.path.join(here, '..', 'relayServer')
+sys.path.insert(0, os.path.join(here, '..', 'scriptsRaspberry'))
+
+from KeyStore import KeyStore
+from SerialEmulator import SerialEmulator
+from ServiceStatus import StatusReporter
+from TCPClientRSASerialRaspberry import TCPClientRSASerial
+
+sys.path.insert(0, relay_dir)
+
+from RelayOperator import RelayOperator
+
+from relayBenchmark import free_port, wait_port, write_operators
+
+
+def ignore_status(message):
+    pass
+
+
+def run_delay_link(port, target_port, delay):
+    listener = socket.create_server(('127.0.0.1', port))
+    while True:
+        conn, address = listener.accept()
+        target = socket.create_connection(('127.0.0.1', target_port))
+        for sock in (conn, target):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        for source, sink in ((conn, target), (target, conn)):
+            chunks = queue.Queue()
+            threading.Thread(target=receive, args=(source, chunks, delay), daemon=True).start()
+            threading.Thread(target=deliver, args=(sink, chunks), daemon=True).start()
+
+
+def receive(sock, chunks, delay):
+    while True:
+        try:
+            data = sock.recv(65536)
+        except OSError:
+            data = b''
+        chunks.put((time.monotonic() + delay, data))
+        if not data:
+            return
+
+
+# chunks leave in order once their delay is over, the end of stream too
+def deliver(sock, chunks):
+    while True:
+        due, data = chunks.get()
+        wait = due - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        try:
+            if not data:
+                sock.shutdown(socket.SHUT_WR)
+                return
+            sock.sendall(data)
+        except OSError:
+            return
+
+
+def run_device(port, com_port, key_file):
+    sys.stdout = open(os.devnull, 'w')
+    client = TCPClientRSASerial('127.0.0.1', port, com_port, KeyStore(key_file),
+                                StatusReporter('pipelineBenchmark', callback=ignore_status))
+    client.run()
+
+
+def run_rtt(rtt, relay_ports, directory, emulator, args):
+    port, device_port = relay_ports
+    spawn = multiprocessing.get_context('spawn')
+
+    link_port = free_port()
+    link = spawn.Process(target=run_delay_link, args=(link_port, device_port, rtt / 2000), daemon=True)
+    link.start()
+    wait_port(link_port)
+    device = spawn.Process(target=run_device, args=(link_port, emulator.port, os.path.join(directory, 'device.pem')),
+                           daemon=True)
+    device.start()
+    # interpreter start and key load are not part of the measure
+    time.sleep(args.settle)
+
+    operator = RelayOperator('127.0.0.1', port, device='bench', key_store=KeyStore(os.path.join(directory, 'operator.pem')))
+    operator.wait = 30
+    operator.pipeline_window = args.window
+    operator.connect()
+    if not operator.pipelined:
+        raise RuntimeError("The device did not accept the pipelined mode")
+
+    payload = b'x' * args.size
+    commands = [payload] * args.count
+    operator.pipeline_commands(commands[:args.warmup])
+
+    start = time.perf_counter()
+    for data in commands:
+        operator.command(data)
+    serial = time.perf_counter() - start
+
+    start = time.perf_counter()
+    replies = operator.pipeline_commands(commands)
+    pipelined = time.perf_counter() - start
+    if replies != commands:
+        raise RuntimeError("Unexpected pipelined replies")
+
+    operator.close()
+    device.join(5)
+    for child in (device, link):
+        if child.is_alive():
+            child.kill()
+
+    result = {'rttMs': rtt, 'oneAtATimePerS': round(args.count / serial, 1),
+              'pipelinedPerS': round(args.count / pipelined, 1)}
+    print("RTT {:5.1f} ms  one at a time {:8.1f} commands/s  pipelined {:8.1f} commands/s".format(
+        rtt, result['oneAtATimePerS'], result['pipelinedPerS']))
+    return result
+
+
+def run(args):
+    # a command and its echo cross the serial line one after the other
+    serial_bound = args.baudrate / 10 / (2 * (args.size + 1)) if args.baudrate else None
+    results = {'python': platform.python_version(), 'count': args.count, 'size': args.size,
+               'baudrate': args.baudrate, 'window': args.window, 'serialBoundPerS': serial_bound, 'rtts': []}
+    if serial_bound:
+        print("serial bound {:.1f} commands/s".format(serial_bound))
+
+    with tempfile.TemporaryDirectory() as directory:
+        # both keys made once, so the pairing is only the handshake
+        with contextlib.redirect_stdout(open(os.devnull, 'w')):
+            for name in ('device.pem', 'operator.pem'):
+                KeyStore(os.path.join(directory, name)).get_key()
+            operators = write_operators(directory, KeyStore(os.path.join(directory, 'operator.pem')).get_key())
+
+        relay_ports = free_port(), free_port()
+        relay = subprocess.Popen([sys.executable, os.path.join(relay_dir, 'RelayServer.py'), '--host', '127.0.0.1',
+                                  '--port', str(relay_ports[0]), '--device', 'bench={}'.format(relay_ports[1]),
+                                  '--operators', operators],
+                                 stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        emulator = SerialEmulator(baudrate=args.baudrate).start()
+        try:
+            wait_port(relay_ports[0])
+            for rtt in args.rtts:
+                results['rtts'].append(run_rtt(rtt, relay_ports, directory, emulator, args))
+        finally:
+            emulator.close()
+            relay.terminate()
+            relay.wait()
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=2)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Pipelined serial data path against one command at a time")
+    parser.add_argument('--rtts', type=lambda value: [float(rtt) for rtt in value.split(',')], default=[0, 20, 50],
+                        help="added round trip times in ms, comma separated")
+    parser.add_argument('--count', type=int, default=200, help="commands per run")
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--settle', type=float, default=2, help="seconds for the device to start before pairing")
+    parser.add_argument('--size', type=int, default=16, help="bytes per command")
+    parser.add_argument('--baudrate', type=int, default=115200, help="serial line speed, 0 for no pacing")
+    parser.add_argument('--window', type=int, default=32, help="pipelined commands in flight")
+    parser.add_argument('--json', help="write the results to this file")
+    run(parser.parse_args())
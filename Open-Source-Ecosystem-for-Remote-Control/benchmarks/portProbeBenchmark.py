@@ -0,0 +1,102 @@
+#
+#   Copyright 2021  Adriano Cofrancesco
+#   Open-Source-Ecosystem-for-Remote-Control is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#   Open-Source-Ecosystem-for-Remote-Control is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+# COM port discovery of the Windows GUIs against a fake port backend: the old
+# one-port-after-the-other loop versus the threaded PortProbe. Runs anywhere:
+#   python3 portProbeBenchmark.py [--delay 0.02] [--hang-time 3] [--json results.json]
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'windowsWithWireguard', 'serviceGUI'))
+
+import serial
+from FakePortBackend import FakePortBackend
+from PortProbe import PortProbe
+
+candidates = ['COM%s' % (i + 1) for i in range(256)]
+available = ['COM1', 'COM3', 'COM4', 'COM17']
+hanging = ['COM5', 'COM12']
+
+
+# what populateAvailableSerialPorts did before the probe engine
+def sequential(backend):
+    start = time.perf_counter()
+    first = None
+    found = []
+    for port in candidates:
+        try:
+            backend(port, None)
+            found.append(port)
+            if first is None:
+                first = time.perf_counter() - start
+        except (OSError, serial.SerialException):
+            pass
+
+    return {'total_s': time.perf_counter() - start, 'first_port_s': first, 'found': found}
+
+
+def threaded(backend, workers, port_timeout, cache_file):
+    probe = PortProbe(candidates, backend, cache_file, workers, port_timeout)
+    times = []
+    start = time.perf_counter()
+    probe.on_found = lambda port: times.append(time.perf_counter() - start)
+    found = probe.probe()
+
+    return {'total_s': time.perf_counter() - start, 'first_port_s': times[0] if times else None, 'found': found}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="COM port probe benchmark")
+    parser.add_argument('--delay', type=float, default=0.02, help="fake open time per port, seconds")
+    parser.add_argument('--hang-time', type=float, default=3, help="time a hanging port blocks, seconds")
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--port-timeout', type=float, default=1)
+    parser.add_argument('--json', help="write results to this file")
+    args = parser.parse_args()
+
+    results = {'platform': platform.platform(), 'python': platform.python_version(),
+               'candidates': len(candidates), 'delay_s': args.delay, 'hang_time_s': args.hang_time}
+
+    results['sequential'] = sequential(FakePortBackend(available, args.delay, hanging, args.hang_time))
+
+    with tempfile.TemporaryDirectory() as directory:
+        cache_file = os.path.join(directory, 'serial_ports.yaml')
+        results['threaded'] = threaded(FakePortBackend(available, args.delay, hanging, args.hang_time),
+                                       args.workers, args.port_timeout, cache_file)
+
+        # what the window shows before any probe result arrives
+        start = time.perf_counter()
+        cached = PortProbe(cache_file=cache_file).cached_ports()
+        results['cached'] = {'total_s': time.perf_counter() - start, 'found': cached}
+
+    print("{:<12} {:>10} {:>14}  {}".format("mode", "total s", "first port s", "ports"))
+    for mode in ('sequential', 'threaded', 'cached'):
+        result = results[mode]
+        first = result.get('first_port_s')
+        print("{:<12} {:>10.3f} {:>14}  {}".format(mode, result['total_s'],
+                                                 "-" if first is None else "{:.3f}".format(first), result['found']))
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
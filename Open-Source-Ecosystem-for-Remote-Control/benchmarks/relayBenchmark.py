@@ -0,0 +1,362 @@
+# Cost of the relay behind <IP_SERVER>: memory and CPU of thousands of idle devices,
+# time to pair an operator with a device, and round trip through the relay, raw and
+# with a real TCPClientRSASerial in front of an emulated serial device:
+#   python3 relayBenchmark.py [--devices 2000] [--count 300] [--idle 5] [--json results.json]
+#                             [--workers 1,2,4] [--pairs 64] [--duration 3]
+# --workers then measures the forwarding throughput of a sharded relay, --pairs echo
+# devices and operators spread over one load process per core.
+# The relay runs in its own process so its memory and CPU can be read from /proc, the
+# idle devices in another one so this process stays under the select() descriptor limit.
+
+import argparse
+import asyncio
+import contextlib
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+here = os.path.dirname(os.path.abspath(__file__))
+relay_dir = os.path.join(here, '..', 'relayServer')
+sys.path.insert(0, os.path.join(here, '..', 'scriptsRaspberry'))
+
+from Framing import MessageStream, frame_header
+from KeyStore import KeyStore
+from MessageCodec import BINARY, decode_message
+from SerialEmulator import SerialEmulator
+from ServiceStatus import StatusReporter
+from StartupProfile import lazy_import
+from TCPClientRSASerialRaspberry import TCPClientRSASerial
+
+sys.path.insert(0, relay_dir)
+
+from OperatorAuth import key_fingerprint, sign_challenge
+from RelayOperator import RelayOperator
+
+RSA = lazy_import('Cryptodome.PublicKey.RSA')
+
+
+def ignore_status(message):
+    pass
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_port(port, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), 0.2).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError("Relay did not start on port {}".format(port))
+
+
+# the relay pairs only the operators whose key is in its --operators file
+def write_operators(directory, *keys):
+    path = os.path.join(directory, 'operators')
+    with open(path, 'w') as file:
+        for key in keys:
+            file.write(key_fingerprint(key.publickey()) + '\n')
+    return path
+
+
+# what RelayOperator sends before the pairing, for the operators without one
+def operator_request(key, wait):
+    return BINARY.encode({'relay': 'operator', 'device': 'default', 'wait': wait,
+                          'pubkey': key.publickey().export_key().decode('utf-8')})
+
+
+def rss_kb(pid):
+    with open('/proc/{}/status'.format(pid)) as file:
+        for line in file:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+
+def cpu_seconds(pid):
+    with open('/proc/{}/stat'.format(pid)) as file:
+        fields = file.read().rsplit(')', 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+def percentiles(samples):
+    samples = [sample * 1000 for sample in samples]
+    cuts = statistics.quantiles(samples, n=100) if len(samples) > 1 else samples * 99
+    return {'p50': round(cuts[49], 3), 'p99': round(cuts[98], 3), 'mean': round(statistics.fmean(samples), 3)}
+
+
+# a device that echoes whatever the relay forwards, to time the relay alone
+def echo_device(port):
+    sock = socket.create_connection(('127.0.0.1', port))
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def serve():
+        with sock:
+            while True:
+                data = sock.recv(65536)
+                if not data:
+                    return
+                sock.sendall(data)
+
+    threading.Thread(target=serve, daemon=True).start()
+    return sock
+
+
+# hold the idle devices until the parent closes the pipe
+def hold_devices(port, count, pipe):
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    start = time.perf_counter()
+    devices = [socket.create_connection(('127.0.0.1', port)) for _ in range(count)]
+    pipe.send(time.perf_counter() - start)
+    try:
+        pipe.recv()
+    except EOFError:
+        pass
+    for sock in devices:
+        sock.close()
+
+
+def raw_round_trip(port, count, size, key):
+    sock = socket.create_connection(('127.0.0.1', port))
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    with sock:
+        stream = MessageStream(sock, framed=True, idle_timeout=10)
+        start = time.perf_counter()
+        stream.send(operator_request(key, 5))
+        reply = decode_message(stream.recv() or b'')
+        if reply.get('relay') == 'challenge':
+            stream.send(BINARY.encode(sign_challenge(key, reply)))
+            reply = decode_message(stream.recv() or b'')
+        pairing = time.perf_counter() - start
+        if reply.get('relay') != 'paired':
+            raise RuntimeError("Pairing failed: {}".format(reply))
+
+        payload = os.urandom(size)
+        samples = []
+        for _ in range(count):
+            start = time.perf_counter()
+            stream.send(payload)
+            stream.recv()
+            samples.append(time.perf_counter() - start)
+    return pairing, samples
+
+
+def start_relay(port, device_port, operators, workers=1):
+    relay = subprocess.Popen([sys.executable, os.path.join(relay_dir, 'RelayServer.py'), '--host', '127.0.0.1',
+                              '--port', str(port), '--device', 'bench={}'.format(device_port),
+                              '--operators', operators, '--workers', str(workers)],
+                             stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    wait_port(port)
+    return relay
+
+
+async def read_message(reader):
+    header = await reader.readexactly(frame_header.size)
+    return await reader.readexactly(frame_header.unpack(header)[0])
+
+
+async def echo_pair(port, size, deadline, ready, key):
+    device_reader, device_writer = await asyncio.open_connection('127.0.0.1', port)
+    # echo the operator's bytes until the relay closes the device
+    async def echo():
+        while True:
+            data = await device_reader.read(65536)
+            if not data:
+                return
+            device_writer.write(data)
+
+    echo_task = asyncio.ensure_future(echo())
+    await ready
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    request = operator_request(key, 10)
+    writer.write(frame_header.pack(len(request)) + request)
+    proof = BINARY.encode(sign_challenge(key, decode_message(await read_message(reader))))
+    writer.write(frame_header.pack(len(proof)) + proof)
+    await read_message(reader)
+
+    payload = os.urandom(size)
+    count = 0
+    try:
+        while time.monotonic() < deadline:
+            writer.write(payload)
+            await reader.readexactly(size)
+            count += 1
+    except (asyncio.IncompleteReadError, ConnectionError):
+        # the device belonged to a load process that already stopped
+        pass
+    writer.close()
+    device_writer.close()
+    await echo_task
+    return count
+
+
+# every load process starts and stops at the same time, operators may get the devices of another
+async def drive_pairs(port, pairs, size, start, deadline, key):
+    ready = asyncio.get_running_loop().create_future()
+    tasks = [asyncio.ensure_future(echo_pair(port, size, deadline, ready, key)) for _ in range(pairs)]
+    # devices are told apart by their silence
+    await asyncio.sleep(start - time.monotonic())
+    ready.set_result(None)
+    return sum(await asyncio.gather(*tasks))
+
+
+# the operator key comes as PEM, a key object does not cross to a spawned process
+def load_process(port, pairs, size, start, deadline, key_pem, pipe):
+    key = RSA.import_key(key_pem)
+    pipe.send(asyncio.run(drive_pairs(port, pairs, size, start, deadline, key)))
+
+
+def throughput(workers, pairs, size, duration, processes, key, operators):
+    port, device_port = free_port(), free_port()
+    relay = start_relay(port, device_port, operators, workers)
+    try:
+        pipes = []
+        # one second to connect every device
+        start = time.monotonic() + 1.5
+        for index in range(processes):
+            pipe, child_pipe = multiprocessing.Pipe()
+            share = pairs // processes + (index < pairs % processes)
+            multiprocessing.Process(target=load_process, args=(port, share, size, start, start + duration,
+                                                               key.export_key(), child_pipe), daemon=True).start()
+            child_pipe.close()
+            pipes.append(pipe)
+        return sum(pipe.recv() for pipe in pipes) / duration
+    finally:
+        relay.terminate()
+        relay.wait()
+
+
+def device_round_trip(relay_port, device_port, key_stores, count, size, session):
+    emulator = SerialEmulator().start()
+    client = TCPClientRSASerial('127.0.0.1', device_port, emulator.port, key_stores[0],
+                                StatusReporter('relayBenchmark', callback=ignore_status))
+    threading.Thread(target=client.run, daemon=True).start()
+    # let the device register so only pairing and handshake are timed
+    time.sleep(1)
+
+    operator = RelayOperator('127.0.0.1', relay_port, device='bench', key_store=key_stores[1], session=session)
+    start = time.perf_counter()
+    operator.connect()
+    pairing = time.perf_counter() - start
+
+    payload = b'x' * size
+    samples = []
+    for _ in range(count):
+        start = time.perf_counter()
+        operator.command(payload)
+        samples.append(time.perf_counter() - start)
+    operator.close()
+    emulator.close()
+    return pairing, samples
+
+
+def run(args):
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if args.devices + 100 > hard:
+        raise SystemExit("Need {} descriptors, the limit is {}".format(args.devices + 100, hard))
+
+    with tempfile.TemporaryDirectory() as key_dir:
+        with contextlib.redirect_stdout(open(os.devnull, 'w')):
+            key_stores = [KeyStore(os.path.join(key_dir, name)) for name in ('device.pem', 'operator.pem')]
+            for key_store in key_stores:
+                key_store.get_key()
+        operators = write_operators(key_dir, key_stores[1].get_key())
+        return measure(args, key_stores, operators)
+
+
+def measure(args, key_stores, operators):
+    operator_key = key_stores[1].get_key()
+    port, device_port = free_port(), free_port()
+    relay = start_relay(port, device_port, operators)
+    results = {'python': platform.python_version(), 'devices': args.devices, 'count': args.count,
+               'size': args.size}
+    devices = []
+    holder = None
+    try:
+        time.sleep(0.5)
+        base_rss = rss_kb(relay.pid)
+
+        # the oldest idle device is the one handed to the first operator
+        devices.append(echo_device(port))
+        pipe, child_pipe = multiprocessing.Pipe()
+        holder = multiprocessing.Process(target=hold_devices, args=(port, args.devices - 1, child_pipe), daemon=True)
+        holder.start()
+        connect_time = pipe.recv()
+        # every device is classified after the relay's grace period
+        time.sleep(1.5)
+
+        rss = rss_kb(relay.pid)
+        cpu = cpu_seconds(relay.pid)
+        time.sleep(args.idle)
+        idle_cpu = (cpu_seconds(relay.pid) - cpu) / args.idle
+
+        results['idle'] = {'connectSeconds': round(connect_time, 3), 'baseRssKb': base_rss, 'rssKb': rss,
+                           'kbPerDevice': round((rss - base_rss) / args.devices, 2),
+                           'cpuPercent': round(idle_cpu * 100, 3)}
+        print("{} idle devices: {:.1f} kB each, {:.2f}% CPU while idle, connected in {:.2f} s".format(
+            args.devices, (rss - base_rss) / args.devices, idle_cpu * 100, connect_time))
+
+        pairing, samples = raw_round_trip(port, args.count, args.size, operator_key)
+        results['raw'] = dict(percentiles(samples), pairingMs=round(pairing * 1000, 3))
+        print("raw     pairing {:7.2f} ms  p50 {p50:7.3f} ms  p99 {p99:7.3f} ms".format(pairing * 1000, **results['raw']))
+
+        with contextlib.redirect_stdout(open(os.devnull, 'w')):
+            for mode, session in (('session', True), ('rsa', False)):
+                pairing, samples = device_round_trip(port, device_port, key_stores, args.count, args.size, session)
+                results[mode] = dict(percentiles(samples), pairingMs=round(pairing * 1000, 3))
+                print("{:7} pairing {:7.2f} ms  p50 {p50:7.3f} ms  p99 {p99:7.3f} ms".format(
+                    mode, pairing * 1000, **results[mode]), file=sys.__stdout__)
+    finally:
+        for sock in devices:
+            sock.close()
+        if holder is not None:
+            holder.kill()
+        relay.terminate()
+        relay.wait()
+
+    if args.workers:
+        processes = args.processes or os.cpu_count() or 1
+        results['throughput'] = {'pairs': args.pairs, 'processes': processes, 'cores': os.cpu_count(),
+                                 'perSecond': {}}
+        base = None
+        for workers in args.workers:
+            rate = throughput(workers, args.pairs, args.size, args.duration, processes, operator_key, operators)
+            base = base or rate
+            results['throughput']['perSecond'][workers] = round(rate)
+            print("{} workers: {:9.0f} round trips/s  x{:.2f}".format(workers, rate, rate / base))
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=2)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Relay idle cost and round trip")
+    parser.add_argument('--devices', type=int, default=2000, help="idle devices kept connected")
+    parser.add_argument('--count', type=int, default=300, help="round trips per mode")
+    parser.add_argument('--size', type=int, default=64, help="bytes per command")
+    parser.add_argument('--idle', type=float, default=5, help="seconds to measure the idle CPU over")
+    parser.add_argument('--workers', type=lambda value: [int(workers) for workers in value.split(',') if workers],
+                        default=[1, 2, 4], help="relay processes to measure the throughput with, '' skips it")
+    parser.add_argument('--pairs', type=int, default=64, help="operator and device pairs for the throughput")
+    parser.add_argument('--duration', type=float, default=3, help="seconds of traffic per worker count")
+    parser.add_argument('--processes', type=int, help="load processes, one per core by default")
+    parser.add_argument('--json', help="write the results to this file")
+    run(parser.parse_args())
@@ -0,0 +1,39 @@
+#
+#   Copyright 2021  Adriano Cofrancesco
+#   Open-Source-Ecosystem-for-Remote-Control is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#   Open-Source-Ecosystem-for-Remote-Control is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+# Python scenario for SerialEmulator.py: a device keeping a counter, slow to
+# answer on a 9600 baud link
+#   python3 SerialEmulator.py scenarios/counter.py
+
+scenario = {
+    'baudrate': 9600,
+    'seed': 7,
+    'delay': {'distribution': 'exponential', 'mean': 0.01},
+    'echo': False,
+}
+
+count = 0
+
+
+def respond(command):
+    global count
+    if command == 'INC':
+        count += 1
+        return str(count)
+    if command == 'GET':
+        return str(count)
+    if command == 'RESET':
+        count = 0
+        return 'OK'
+    return None
@@ -0,0 +1,166 @@
+#
+#   Copyright 2021  Adriano Cofrancesco
+#   Open-Source-Ecosystem-for-Remote-Control is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#   Open-Source-Ecosystem-for-Remote-Control is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+# Streaming mode: unsolicited device output pushed to the operator through the relay.
+#   python3 streamBenchmark.py [--delays 0,0.005,0.02,0.1] [--duration 5]
+#                              [--line-size 48] [--lines-per-s 1000] [--json results.json]
+# The emulated device prints telemetry lines on its own. For every frame delay of the
+# device (--delays, in seconds) the output is followed for --duration seconds, then the
+# bytes received are checked against the bytes the device wrote. Frames and device CPU
+# per MB show what the coalescing saves; the one command at a time mode gets none of it.
+
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+here = os.path.dirname(os.path.abspath(__file__))
+relay_dir = os.path.join(here, '..', 'relayServer')
+sys.path.insert(0, os.path.join(here, '..', 'scriptsRaspberry'))
+
+from KeyStore import KeyStore
+from SerialEmulator import SerialEmulator
+from ServiceStatus import StatusReporter
+from TCPClientRSASerialRaspberry import TCPClientRSASerial
+
+sys.path.insert(0, relay_dir)
+
+from RelayOperator import RelayOperator
+
+from relayBenchmark import cpu_seconds, free_port, wait_port, write_operators
+
+
+def ignore_status(message):
+    pass
+
+
+def run_device(port, com_port, key_file, frame_delay, frame_size):
+    sys.stdout = open(os.devnull, 'w')
+    client = TCPClientRSASerial('127.0.0.1', port, com_port, KeyStore(key_file),
+                                StatusReporter('streamBenchmark', callback=ignore_status))
+    client.stream_frame_delay = frame_delay
+    client.stream_frame_size = frame_size
+    client.run()
+
+
+def run_delay(delay, relay_ports, directory, args):
+    port, device_port = relay_ports
+    # ten lines every burst, sleeping less than a few ms is not reliable
+    burst = {'every': 10 / args.lines_per_s, 'lines': 10, 'data': 'T' * (args.line_size - 1)}
+    emulator = SerialEmulator(echo=False, default='').start()
+
+    device = multiprocessing.get_context('spawn').Process(
+        target=run_device, args=(device_port, emulator.port, os.path.join(directory, 'device.pem'), delay, args.frame_size),
+        daemon=True)
+    device.start()
+    time.sleep(args.settle)
+
+    operator = RelayOperator('127.0.0.1', port, device='bench', key_store=KeyStore(os.path.join(directory, 'operator.pem')),
+                             stream_output=True)
+    operator.wait = 30
+    operator.connect()
+    if not operator.streaming:
+        raise RuntimeError("The device did not accept the streaming mode")
+    # opening the port flushes what the device printed before, the bursts start once
+    # a command went through
+    operator.command(b'')
+    threading.Thread(target=emulator.burst, args=(burst,), daemon=True).start()
+
+    received = 0
+    frames = 0
+    cpu = cpu_seconds(device.pid)
+    deadline = time.monotonic() + args.duration
+    while time.monotonic() < deadline:
+        received += len(operator.read_output())
+        frames += 1
+    emulator.running = False
+    # a burst already started is written to the end
+    time.sleep(0.1)
+    emitted = emulator.bytes_out
+
+    # what is still on its way, the device is quiet from now on
+    operator.stream.idle_timeout = 1
+    try:
+        while received < emitted:
+            received += len(operator.read_output())
+            frames += 1
+    except socket.timeout:
+        pass
+    cpu = cpu_seconds(device.pid) - cpu
+
+    operator.close()
+    emulator.close()
+    device.join(5)
+    if device.is_alive():
+        device.kill()
+
+    result = {'frameDelay': delay, 'emittedBytes': emitted, 'receivedBytes': received, 'frames': frames,
+              'bytesPerFrame': round(received / frames, 1) if frames else 0,
+              'deviceCpuMsPerMB': round(cpu * 1000 / (received / 1e6), 1) if received else None}
+    return result
+
+
+def run(args):
+    results = {'python': platform.python_version(), 'duration': args.duration, 'lineSize': args.line_size,
+               'linesPerS': args.lines_per_s, 'frameSize': args.frame_size, 'delays': []}
+    with tempfile.TemporaryDirectory() as directory:
+        # both keys made once, so the pairing is only the handshake
+        with contextlib.redirect_stdout(open(os.devnull, 'w')):
+            for name in ('device.pem', 'operator.pem'):
+                KeyStore(os.path.join(directory, name)).get_key()
+            operators = write_operators(directory, KeyStore(os.path.join(directory, 'operator.pem')).get_key())
+
+        relay_ports = free_port(), free_port()
+        relay = subprocess.Popen([sys.executable, os.path.join(relay_dir, 'RelayServer.py'), '--host', '127.0.0.1',
+                                  '--port', str(relay_ports[0]), '--device', 'bench={}'.format(relay_ports[1]),
+                                  '--operators', operators],
+                                 stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_port(relay_ports[0])
+            for delay in args.delays:
+                # the operator prints its pairing
+                with contextlib.redirect_stdout(open(os.devnull, 'w')):
+                    result = run_delay(delay, relay_ports, directory, args)
+                results['delays'].append(result)
+                print("delay {frameDelay:6.3f} s  received {receivedBytes:8d}/{emittedBytes:8d} bytes  {frames:6d} frames  "
+                      "{bytesPerFrame:8.1f} bytes/frame  device CPU {deviceCpuMsPerMB} ms/MB".format(**result))
+        finally:
+            relay.terminate()
+            relay.wait()
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=2)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Streaming of unsolicited device output")
+    parser.add_argument('--delays', type=lambda value: [float(delay) for delay in value.split(',')],
+                        default=[0, 0.005, 0.02, 0.1], help="frame delays of the device in seconds, comma separated")
+    parser.add_argument('--duration', type=float, default=5, help="seconds of output followed per delay")
+    parser.add_argument('--settle', type=float, default=2, help="seconds for the device to start before pairing")
+    parser.add_argument('--line-size', type=int, default=48, help="bytes per telemetry line")
+    parser.add_argument('--lines-per-s', type=int, default=1000)
+    parser.add_argument('--frame-size', type=int, default=4096, help="largest frame of the device")
+    parser.add_argument('--json', help="write the results to this file")
+    run(parser.parse_args())
@@ -0,0 +1,211 @@
+#
+#   Copyright 2021  Adriano Cofrancesco
+#   Open-Source-Ecosystem-for-Remote-Control is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#   Open-Source-Ecosystem-for-Remote-Control is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Cost of the wstunnel hop: a TCPClientRSASerial session through a local forwarder that
+# does what `wstunnel -L 127.0.0.1:65001:...` does, against the same session using the
+# in-process WebSocket transport, both over TLS to a local relay:
+#   python3 tunnelBenchmark.py [--count 500] [--size 64] [--json results.json]
+# wstunnel itself is not needed, the hop is played by a python forwarder so the numbers
+# show the extra loopback connection and process copy, not wstunnel's own speed. The
+# device side (client and forwarder) runs in child processes whose CPU is read from /proc.
+# Needs the openssl command to make a throwaway certificate.
+
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import platform
+import socket
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+here = os.path.dirname(os.path.abspath(__file__))
+relay_dir = os.path.join(here, '..', 'relayServer')
+sys.path.insert(0, os.path.join(here, '..', 'scriptsRaspberry'))
+
+from KeyStore import KeyStore
+from SerialEmulator import SerialEmulator
+from ServiceStatus import StatusReporter
+from TCPClientRSASerialRaspberry import TCPClientRSASerial
+from WebSocket import WebSocket
+
+sys.path.insert(0, relay_dir)
+
+from RelayOperator import RelayOperator
+
+from relayBenchmark import cpu_seconds, free_port, percentiles, wait_port, write_operators
+
+modes = ['tcp', 'wstunnel-hop', 'in-process']
+
+
+def ignore_status(message):
+    pass
+
+
+def make_certificate(directory):
+    cert, key = os.path.join(directory, 'cert.pem'), os.path.join(directory, 'key.pem')
+    subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-keyout', key, '-out', cert,
+                    '-days', '1', '-subj', '/CN=localhost', '-addext', 'subjectAltName=DNS:localhost'],
+                   check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return cert, key
+
+
+def client_context(cafile):
+    return ssl.create_default_context(cafile=cafile)
+
+
+# the local end of wstunnel: every TCP connection is carried by its own WebSocket
+def run_forwarder(port, url, cafile):
+    listener = socket.create_server(('127.0.0.1', port))
+    while True:
+        conn, address = listener.accept()
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        tunnel = WebSocket(url, 10, client_context(cafile))
+        tunnel.connect()
+        threading.Thread(target=pump, args=(conn.recv, tunnel.sendall, conn, tunnel), daemon=True).start()
+        threading.Thread(target=pump, args=(tunnel.recv, conn.sendall, conn, tunnel), daemon=True).start()
+
+
+# either side closing closes the other, like wstunnel does
+def pump(recv, send, conn, tunnel):
+    try:
+        while True:
+            data = recv(65536)
+            if not data:
+                break
+            send(data)
+    except OSError:
+        pass
+    for sock in (conn, tunnel):
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+def run_device(host, port, url, cafile, com_port, key_file):
+    sys.stdout = open(os.devnull, 'w')
+    client = TCPClientRSASerial(host, port, com_port, KeyStore(key_file),
+                                StatusReporter('tunnelBenchmark', callback=ignore_status))
+    if url:
+        client.tunnel_url = url
+        client.tunnel_ssl_context = client_context(cafile)
+    client.run()
+
+
+def run_mode(mode, relay_ports, directory, emulator, args):
+    port, device_port, ws_port = relay_ports
+    cafile = os.path.join(directory, 'cert.pem')
+    url = 'wss://localhost:{}/bench'.format(ws_port)
+    spawn = multiprocessing.get_context('spawn')
+    children = []
+    forwarder = None
+
+    if mode == 'tcp':
+        device = spawn.Process(target=run_device, args=('127.0.0.1', device_port, None, None, emulator.port,
+                                                        os.path.join(directory, 'device.pem')))
+    elif mode == 'wstunnel-hop':
+        hop_port = free_port()
+        forwarder = spawn.Process(target=run_forwarder, args=(hop_port, url, cafile), daemon=True)
+        forwarder.start()
+        children.append(forwarder)
+        wait_port(hop_port)
+        device = spawn.Process(target=run_device, args=('127.0.0.1', hop_port, None, None, emulator.port,
+                                                        os.path.join(directory, 'device.pem')))
+    else:
+        device = spawn.Process(target=run_device, args=(None, None, url, cafile, emulator.port,
+                                                        os.path.join(directory, 'device.pem')))
+    device.daemon = True
+    device.start()
+    children.append(device)
+    # interpreter start and key load are not part of the pairing
+    time.sleep(args.settle)
+
+    operator = RelayOperator('127.0.0.1', port, device='bench', key_store=KeyStore(os.path.join(directory, 'operator.pem')))
+    operator.wait = 30
+    start = time.perf_counter()
+    operator.connect()
+    pairing = time.perf_counter() - start
+
+    payload = b'x' * args.size
+    for _ in range(args.warmup):
+        operator.command(payload)
+
+    cpu = sum(cpu_seconds(child.pid) for child in children)
+    samples = []
+    for _ in range(args.count):
+        start = time.perf_counter()
+        operator.command(payload)
+        samples.append(time.perf_counter() - start)
+    cpu = sum(cpu_seconds(child.pid) for child in children) - cpu
+
+    operator.close()
+    device.join(5)
+    for child in children:
+        if child.is_alive():
+            child.kill()
+
+    result = dict(percentiles(samples), pairingMs=round(pairing * 1000, 1),
+                  deviceCpuMsPerCommand=round(cpu * 1000 / args.count, 3))
+    print("{:13} pairing {:7.1f} ms  p50 {p50:6.3f} ms  p99 {p99:6.3f} ms  device CPU {deviceCpuMsPerCommand:.3f} ms/command".format(
+        mode, pairing * 1000, **result))
+    return result
+
+
+def run(args):
+    results = {'python': platform.python_version(), 'count': args.count, 'size': args.size, 'modes': {}}
+    with tempfile.TemporaryDirectory() as directory:
+        cert, key = make_certificate(directory)
+        # both keys made once, so the pairing times are the handshakes only
+        with contextlib.redirect_stdout(open(os.devnull, 'w')):
+            for name in ('device.pem', 'operator.pem'):
+                KeyStore(os.path.join(directory, name)).get_key()
+            operators = write_operators(directory, KeyStore(os.path.join(directory, 'operator.pem')).get_key())
+
+        relay_ports = free_port(), free_port(), free_port()
+        relay = subprocess.Popen([sys.executable, os.path.join(relay_dir, 'RelayServer.py'), '--host', '127.0.0.1',
+                                  '--port', str(relay_ports[0]), '--device', 'bench={}'.format(relay_ports[1]),
+                                  '--operators', operators,
+                                  '--ws-port', str(relay_ports[2]), '--tls-cert', cert, '--tls-key', key],
+                                 stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        emulator = SerialEmulator().start()
+        try:
+            wait_port(relay_ports[0])
+            for mode in args.modes:
+                results['modes'][mode] = run_mode(mode, relay_ports, directory, emulator, args)
+        finally:
+            emulator.close()
+            relay.terminate()
+            relay.wait()
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=2)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="In-process WebSocket transport against a wstunnel hop")
+    parser.add_argument('--modes', type=lambda value: value.split(','), default=modes,
+                        help="comma separated, from {}".format(','.join(modes)))
+    parser.add_argument('--count', type=int, default=500, help="commands per mode")
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--settle', type=float, default=2, help="seconds for the device to start before pairing")
+    parser.add_argument('--size', type=int, default=64, help="bytes per command")
+    parser.add_argument('--json', help="write the results to this file")
+    run(parser.parse_args())
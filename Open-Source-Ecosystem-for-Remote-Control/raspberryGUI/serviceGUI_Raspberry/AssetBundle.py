@@ -0,0 +1,79 @@
+#
+#   Copyright 2021  Adriano Cofrancesco
+#   Open-Source-Ecosystem-for-Remote-Control is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#   Open-Source-Ecosystem-for-Remote-Control is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+import os
+import struct
+
+bundleFileName = 'assets.bundle'
+
+# RCAB, version, entry count, then for every entry: name length, name, offset, size.
+# Entries with the same content share one blob.
+bundleHeader = struct.Struct('>4sBH')
+bundleEntry = struct.Struct('>II')
+BUNDLE_MAGIC = b'RCAB'
+BUNDLE_VERSION = 1
+
+
+# images of the GUI, read from the bundle written by pictureConverter.py.
+# Only the index is read up front, every image is decoded by Qt on first use and
+# the QPixmap is kept for the next callers
+class AssetBundle:
+
+    def __init__(self, bundle_file=None):
+        if bundle_file is None:
+            bundle_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), bundleFileName)
+        self.bundle_file = bundle_file
+        self.index = None
+        self.pixmaps = {}
+
+    def load_index(self):
+        if self.index is not None:
+            return self.index
+
+        index = {}
+        with open(self.bundle_file, 'rb') as file:
+            magic, version, count = bundleHeader.unpack(file.read(bundleHeader.size))
+            if magic != BUNDLE_MAGIC or version != BUNDLE_VERSION:
+                raise ValueError("{} is not an asset bundle".format(self.bundle_file))
+
+            for _ in range(count):
+                name = file.read(file.read(1)[0]).decode('utf-8')
+                index[name] = bundleEntry.unpack(file.read(bundleEntry.size))
+
+        self.index = index
+        return index
+
+    def names(self):
+        return list(self.load_index())
+
+    def read(self, name):
+        offset, size = self.load_index()[name]
+        with open(self.bundle_file, 'rb') as file:
+            file.seek(offset)
+            return file.read(size)
+
+    def pixmap(self, name):
+        pixmap = self.pixmaps.get(name)
+        if pixmap is None:
+            from PyQt5.QtGui import QPixmap
+
+            pixmap = QPixmap()
+            if not pixmap.loadFromData(self.read(name)):
+                raise ValueError("Asset {} is not an image".format(name))
+            self.pixmaps[name] = pixmap
+
+        return pixmap
+
+
+assets = AssetBundle()
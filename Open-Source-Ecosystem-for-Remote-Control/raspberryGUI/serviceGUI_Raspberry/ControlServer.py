@@ -0,0 +1,233 @@
+#
+#   Copyright 2021  Adriano Cofrancesco
+#   Open-Source-Ecosystem-for-Remote-Control is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#   Open-Source-Ecosystem-for-Remote-Control is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+from concurrent.futures import Future, TimeoutError
+import itertools
+import socket
+import threading
+import time
+
+from TCPServer import TCPServer, replyKeys
+from Framing import MessageStream
+from MessageCodec import YAML, decode_message, negotiate_codec
+
+CHANNEL_VERSION = 1
+
+
+# Keeps port 65001 open for the whole GUI session.
+# Agents announcing themselves with a 'hello' get a persistent channel: requests carry an
+# 'id', several can be in flight and replies are matched by that id, a PING every few
+# seconds keeps the channel alive and reveals dead agents. Old agents send nothing, they
+# are parked and served one command per connection as TCPServer always did.
+class ControlServer(TCPServer):
+
+    def __init__(self, host='0.0.0.0', port=65001, max_clients=3):
+        super().__init__(host, port, max_clients)
+        self.socket.settimeout(None)
+        self.hello_timeout = 1
+        self.heartbeat_interval = 5
+        self.heartbeat_timeout = 15
+
+        self.channel = None
+        self.codec = YAML
+        self.legacy_clients = []
+        self.pending = {}
+        self.request_ids = itertools.count(1)
+        self.condition = threading.Condition()
+        self.send_lock = threading.Lock()
+        self.running = False
+        # whole reply of the last command on the channel
+        self.last_reply = None
+        # called with every message of the agent that is not a reply
+        self.on_event = None
+
+    def start(self):
+        self.running = True
+        print("Server {} listening on port {}".format(self.host, self.port))
+        threading.Thread(target=self.acceptLoop, daemon=True).start()
+
+    def acceptLoop(self):
+        while self.running:
+            try:
+                client, address = self.socket.accept()
+            except OSError:
+                break
+
+            threading.Thread(target=self.handshake, args=(client, address), daemon=True).start()
+
+    def handshake(self, client, address):
+        print("Connected by: {}".format(address))
+        stream = MessageStream(client, None, self.socket_buffer, self.hello_timeout)
+        try:
+            data = stream.recv()
+            message = decode_message(data) if data else None
+        except socket.timeout:
+            message = None
+        except Exception as error:
+            print("Server recv error: {}".format(error))
+            stream.close()
+            client.close()
+            return
+
+        if isinstance(message, dict) and 'hello' in message:
+            codec = negotiate_codec(message.get('codecs'))
+            stream.framed = True
+            stream.idle_timeout = self.heartbeat_timeout
+            try:
+                stream.send(YAML.encode({'hello': CHANNEL_VERSION, 'codec': codec.name}))
+            except OSError as error:
+                print("Server send error: {}".format(error))
+                stream.close()
+                client.close()
+                return
+            self.runChannel(stream, codec, address)
+        else:
+            # old agent, it waits for a single command. Only the newest connection is
+            # kept, the older ones belong to attempts the agent already gave up on.
+            # runServer reads it with its own stream, only the selector is released here
+            stream.close()
+            with self.condition:
+                for old_client, old_address in self.legacy_clients:
+                    old_client.close()
+                self.legacy_clients = [(client, address)]
+                self.condition.notify_all()
+
+    def runChannel(self, stream, codec, address):
+        print("Persistent channel with {} ({})".format(address, codec.name))
+        with self.condition:
+            if self.channel is not None:
+                self.dropChannel()
+            self.channel = stream
+            self.codec = codec
+            self.condition.notify_all()
+
+        threading.Thread(target=self.heartbeat, args=(stream,), daemon=True).start()
+
+        while True:
+            try:
+                data = stream.recv()
+            except Exception as error:
+                print("Server recv error: {}".format(error))
+                break
+
+            if not data:
+                print("Closing connection with Client: {}".format(address))
+                break
+
+            try:
+                message = decode_message(data)
+            except Exception as error:
+                print("Error: {}".format(error))
+                continue
+
+            future = None
+            if isinstance(message, dict):
+                with self.condition:
+                    future = self.pending.pop(message.get('id'), None)
+            if future is not None:
+                future.set_result(message)
+            elif self.on_event is not None:
+                self.on_event(message)
+
+        with self.condition:
+            if self.channel is stream:
+                self.dropChannel()
+        stream.close()
+        stream.sock.close()
+
+    # called with the condition held: the channel is forgotten, its requests fail and
+    # its reader wakes up on EOF, closing the stream and the socket is left to the reader
+    def dropChannel(self):
+        stream, self.channel = self.channel, None
+        pending, self.pending = self.pending, {}
+        for future in pending.values():
+            future.set_exception(ConnectionError("control channel closed"))
+        try:
+            stream.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def heartbeat(self, stream):
+        while self.channel is stream:
+            time.sleep(self.heartbeat_interval)
+            if self.channel is not stream:
+                break
+            try:
+                self.submit({'msg': "PING"})
+            except ConnectionError:
+                break
+
+    # send a request on the persistent channel, the future resolves with the agent's reply
+    def submit(self, packet):
+        with self.condition:
+            stream = self.channel
+            if stream is None:
+                raise ConnectionError("no control channel")
+            request_id = next(self.request_ids)
+            future = Future()
+            self.pending[request_id] = future
+
+        try:
+            with self.send_lock:
+                stream.send(self.codec.encode(dict(packet, id=request_id)))
+        except OSError as error:
+            with self.condition:
+                self.pending.pop(request_id, None)
+            raise ConnectionError(error)
+
+        return future
+
+    # same result as TCPServer.run, over whatever connection the agent offers
+    def command(self, packet, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        self.last_reply = None
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while self.channel is None and not self.legacy_clients:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    print("Closing Server")
+                    return None
+                self.condition.wait(remaining)
+
+            legacy = None if self.channel is not None else self.legacy_clients.pop()
+
+        if legacy is None:
+            try:
+                reply = self.submit(packet).result(max(deadline - time.monotonic(), 0))
+            except (ConnectionError, TimeoutError) as error:
+                print("Error: {}".format(error))
+                return None
+
+            self.last_reply = reply
+            for key in replyKeys:
+                if key in reply:
+                    return reply[key]
+            return None
+
+        client, address = legacy
+        self.result = None
+        self.runServer(client, address, packet, max(deadline - time.monotonic(), 0.1))
+        return self.result
+
+    def close(self):
+        print("Closing Server...")
+        self.running = False
+        self.socket.close()
+        with self.condition:
+            if self.channel is not None:
+                self.dropChannel()
+            for client, address in self.legacy_clients:
+                client.close()
+            self.legacy_clients = []
@@ -0,0 +1,180 @@
+#
+#   Copyright 2021  Adriano Cofrancesco
+#   Open-Source-Ecosystem-for-Remote-Control is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#   Open-Source-Ecosystem-for-Remote-Control is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Idle devices waiting for an operator. DeviceRegistry serves one relay process,
+# SharedRegistry lets the workers of a sharded relay hand devices to each other
+# through RelayBroker: the device socket itself is passed to the operator's worker,
+# so no byte of a paired session crosses a second process.
+
+import asyncio
+import itertools
+import socket
+
+from MessageCodec import BINARY, decode_message
+
+# control messages between a worker and the broker, one per packet
+CHANNEL_PACKET = 65536
+
+
+# idle devices by name, oldest first, and the operators waiting for one
+class DeviceRegistry:
+
+    def __init__(self):
+        self.devices = {}
+        self.waiters = {}
+
+    def add(self, peer):
+        waiters = self.waiters.get(peer.name)
+        while waiters:
+            future = waiters.pop(0)
+            if not future.done():
+                future.set_result(peer)
+                return
+        self.park(peer)
+
+    def park(self, peer):
+        self.devices.setdefault(peer.name, {})[peer] = None
+
+    # a device left the idle ones: taken, gone or handed to another worker
+    def unparked(self, peer):
+        pass
+
+    def remove(self, peer):
+        devices = self.devices.get(peer.name)
+        if devices and peer in devices:
+            del devices[peer]
+            self.unparked(peer)
+
+    # devices that went away while idle are dropped here
+    def take(self, name):
+        devices = self.devices.get(name)
+        while devices:
+            peer = next(iter(devices))
+            del devices[peer]
+            self.unparked(peer)
+            if peer.is_alive():
+                return peer
+        return None
+
+    async def wait(self, name, timeout):
+        peer = self.take(name)
+        if peer is not None or not timeout:
+            return peer
+
+        future = asyncio.get_running_loop().create_future()
+        waiters = self.waiters.setdefault(name, [])
+        waiters.append(future)
+        try:
+            return await self.wait_future(future, timeout)
+        finally:
+            if future in waiters:
+                waiters.remove(future)
+
+    async def wait_future(self, future, timeout):
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            # a device may have been handed over just as the timeout expired
+            if future.done():
+                return future.result()
+            future.cancel()
+            return None
+
+    def idle(self):
+        return sum(len(devices) for devices in self.devices.values())
+
+
+# worker side of the registry shared by the workers of a sharded relay. Parked devices
+# and waiting operators are announced to the broker, which asks the worker holding a
+# device to pass its socket to the worker of the operator.
+class SharedRegistry(DeviceRegistry):
+
+    def __init__(self, channel):
+        super().__init__()
+        # SOCK_SEQPACKET socket to the broker
+        self.channel = channel
+        self.keys = itertools.count()
+        self.parked = {}
+        self.wanted = {}
+        # called with (name, socket, want) for a device handed over by another worker
+        self.adopt = None
+
+    def send(self, message, fds=()):
+        data = BINARY.encode(message)
+        if fds:
+            socket.send_fds(self.channel, [data], fds)
+        else:
+            self.channel.send(data)
+
+    def park(self, peer):
+        super().park(peer)
+        peer.key = next(self.keys)
+        self.parked[peer.key] = peer
+        self.send({'op': 'add', 'name': peer.name, 'key': peer.key})
+
+    def unparked(self, peer):
+        if self.parked.pop(peer.key, None) is not None:
+            self.send({'op': 'remove', 'name': peer.name, 'key': peer.key})
+
+    # a local device first, then any device the broker finds on another worker
+    async def wait(self, name, timeout):
+        peer = self.take(name)
+        if peer is not None or not timeout:
+            return peer
+
+        future = asyncio.get_running_loop().create_future()
+        waiters = self.waiters.setdefault(name, [])
+        waiters.append(future)
+        want = next(self.keys)
+        self.wanted[want] = future
+        self.send({'op': 'want', 'name': name, 'want': want})
+        try:
+            return await self.wait_future(future, timeout)
+        finally:
+            if future in waiters:
+                waiters.remove(future)
+            del self.wanted[want]
+            self.send({'op': 'cancel', 'name': name, 'want': want})
+
+    # the operator that asked for a handed over device gets it, if it is still waiting
+    def deliver(self, peer, want):
+        future = self.wanted.get(want)
+        if future is None or future.done():
+            return False
+        future.set_result(peer)
+        return True
+
+    # read by the event loop whenever the broker wrote to the channel
+    def receive(self):
+        data, fds, flags, address = socket.recv_fds(self.channel, CHANNEL_PACKET, 1)
+        if not data:
+            raise ConnectionError("Relay broker closed the channel")
+        message = decode_message(data)
+
+        if message['op'] == 'give':
+            self.give(message)
+        elif message['op'] == 'device' and fds:
+            self.adopt(message['name'], socket.socket(fileno=fds[0]), message['want'])
+
+    # pass an idle device to the worker of the operator that asked for it
+    def give(self, message):
+        reply = {'to': message['to'], 'name': message['name'], 'want': message['want']}
+        peer = self.parked.pop(message['key'], None)
+        if peer is None or not peer.is_alive():
+            self.send(dict(reply, op='gone'))
+            return
+
+        self.devices[peer.name].pop(peer, None)
+        self.send(dict(reply, op='handover'), [peer.writer.get_extra_info('socket').fileno()])
+        # the other worker owns the connection now, closing our descriptor leaves it open
+        peer.close()
@@ -0,0 +1,42 @@
+#
+#   Copyright 2021  Adriano Cofrancesco
+#   Open-Source-Ecosystem-for-Remote-Control is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#   Open-Source-Ecosystem-for-Remote-Control is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+from StartupProfile import lazy_import
+
+AES = lazy_import('Cryptodome.Cipher.AES')
+PKCS1_OAEP = lazy_import('Cryptodome.Cipher.PKCS1_OAEP')
+Random = lazy_import('Cryptodome.Random')
+
+session_key_size = 16
+
+
+# RSA + AES-EAX envelope of the clients: encrypted session key, nonce, tag, cipher text
+def seal(public_key, data):
+    session_key = Random.get_random_bytes(session_key_size)
+    enc_session_key = PKCS1_OAEP.new(public_key).encrypt(session_key)
+    cipher_aes = AES.new(session_key, AES.MODE_EAX)
+    cipher_text, tag = cipher_aes.encrypt_and_digest(data)
+
+    return enc_session_key + cipher_aes.nonce + tag + cipher_text
+
+
+def unseal(private_key, data):
+    nonce_index = private_key.size_in_bytes()
+    tag_index = nonce_index + session_key_size
+    text_index = tag_index + session_key_size
+
+    session_key = PKCS1_OAEP.new(private_key).decrypt(data[:nonce_index])
+    cipher_aes = AES.new(session_key, AES.MODE_EAX, data[nonce_index:tag_index])
+
+    return cipher_aes.decrypt_and_verify(data[text_index:], data[tag_index:text_index])
@@ -0,0 +1,65 @@
+#
+#   Copyright 2021  Adriano Cofrancesco
+#   Open-Source-Ecosystem-for-Remote-Control is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#   Open-Source-Ecosystem-for-Remote-Control is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+# Operators prove they hold a key the relay knows before they get a device:
+#   operator -> relay  {'relay': 'operator', 'device': ..., 'wait': ..., 'pubkey': PEM}
+#   relay -> operator  {'relay': 'challenge', 'challenge': base64}, only for allowed keys
+#   operator -> relay  {'relay': 'proof', 'signature': base64 RSA-PSS of the challenge}
+# The allow-list holds the key fingerprints, the same ones that name the WireGuard
+# configurations. An operator needs its identity key, an ephemeral one is never allowed.
+
+import base64
+import hashlib
+import os
+
+from StartupProfile import lazy_import
+
+pss = lazy_import('Cryptodome.Signature.pss')
+SHA256 = lazy_import('Cryptodome.Hash.SHA256')
+
+challenge_size = 32
+
+
+def key_fingerprint(public_key):
+    return hashlib.sha256(public_key.export_key(format='DER')).hexdigest()[:32]
+
+
+# one fingerprint per line, # starts a comment
+def load_operator_keys(path):
+    keys = set()
+    with open(path) as file:
+        for line in file:
+            fingerprint = line.split('#', 1)[0].strip()
+            if fingerprint:
+                keys.add(fingerprint.lower())
+    return keys
+
+
+def new_challenge():
+    return {'relay': 'challenge', 'challenge': base64.b64encode(os.urandom(challenge_size)).decode('ascii')}
+
+
+def sign_challenge(private_key, message):
+    challenge = base64.b64decode(message['challenge'])
+    signature = pss.new(private_key).sign(SHA256.new(challenge))
+    return {'relay': 'proof', 'signature': base64.b64encode(signature).decode('ascii')}
+
+
+def check_proof(public_key, challenge, proof):
+    try:
+        signature = base64.b64decode(proof['signature'], validate=True)
+        pss.new(public_key).verify(SHA256.new(base64.b64decode(challenge['challenge'])), signature)
+        return True
+    except (KeyError, TypeError, ValueError):
+        return False
@@ -0,0 +1,126 @@
+#
+#   Copyright 2021  Adriano Cofrancesco
+#   Open-Source-Ecosystem-for-Remote-Control is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#   Open-Source-Ecosystem-for-Remote-Control is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Broker of a sharded relay: keeps the idle devices and waiting operators of every
+# worker and matches them. The device socket travels from the worker holding it to
+# the operator's worker through here, the sessions themselves never do.
+
+import os
+import selectors
+import socket
+import time
+
+from DeviceRegistry import CHANNEL_PACKET
+from MessageCodec import BINARY, decode_message
+
+
+class RelayBroker:
+
+    def __init__(self, channels, stats_interval=0):
+        # SOCK_SEQPACKET socket to each worker, by worker number
+        self.channels = channels
+        self.stats_interval = stats_interval
+        # idle devices by name, oldest first, as (worker, key)
+        self.devices = {}
+        # waiting operators by name, oldest first, as (worker, want)
+        self.wants = {}
+        self.loads = {}
+        self.handovers = 0
+
+    def run(self):
+        selector = selectors.DefaultSelector()
+        for worker, channel in self.channels.items():
+            selector.register(channel, selectors.EVENT_READ, worker)
+
+        next_report = time.monotonic() + self.stats_interval
+        while self.channels:
+            timeout = max(next_report - time.monotonic(), 0) if self.stats_interval else None
+            for key, events in selector.select(timeout):
+                if not self.receive(key.data, key.fileobj):
+                    selector.unregister(key.fileobj)
+                    self.drop(key.data)
+
+            if self.stats_interval and time.monotonic() >= next_report:
+                self.report_load()
+                next_report = time.monotonic() + self.stats_interval
+
+    def send(self, worker, message, fds=()):
+        channel = self.channels.get(worker)
+        if channel is None:
+            return
+        data = BINARY.encode(message)
+        if fds:
+            socket.send_fds(channel, [data], fds)
+        else:
+            channel.send(data)
+
+    def receive(self, worker, channel):
+        try:
+            data, fds, flags, address = socket.recv_fds(channel, CHANNEL_PACKET, 1)
+        except ConnectionError:
+            data, fds = b'', []
+        if not data:
+            return False
+
+        message = decode_message(data)
+        op = message['op']
+        name = message.get('name')
+        if op == 'add':
+            self.devices.setdefault(name, {})[(worker, message['key'])] = None
+            self.match(name)
+        elif op == 'remove':
+            self.devices.get(name, {}).pop((worker, message['key']), None)
+        elif op == 'want':
+            self.wants.setdefault(name, []).append((worker, message['want']))
+            self.match(name)
+        elif op == 'cancel':
+            wants = self.wants.get(name)
+            if wants and (worker, message['want']) in wants:
+                wants.remove((worker, message['want']))
+        elif op == 'gone':
+            # that device went away meanwhile, the operator keeps its turn
+            self.wants.setdefault(name, []).insert(0, (message['to'], message['want']))
+            self.match(name)
+        elif op == 'handover':
+            for fd in fds:
+                self.send(message['to'], {'op': 'device', 'name': name, 'want': message['want']}, [fd])
+                os.close(fd)
+                self.handovers += 1
+        elif op == 'load':
+            self.loads[worker] = message['load']
+        return True
+
+    def match(self, name):
+        devices = self.devices.get(name)
+        wants = self.wants.get(name)
+        while devices and wants:
+            owner, key = next(iter(devices))
+            del devices[(owner, key)]
+            worker, want = wants.pop(0)
+            self.send(owner, {'op': 'give', 'key': key, 'name': name, 'to': worker, 'want': want})
+
+    def drop(self, worker):
+        print("Relay worker {} stopped".format(worker))
+        self.channels.pop(worker).close()
+        self.loads.pop(worker, None)
+        for devices in self.devices.values():
+            for device in [device for device in devices if device[0] == worker]:
+                del devices[device]
+        for wants in self.wants.values():
+            wants[:] = [want for want in wants if want[0] != worker]
+
+    def report_load(self):
+        loads = [self.loads[worker] for worker in sorted(self.loads)]
+        total = {'idle': sum(load['idle'] for load in loads), 'pairs': sum(load['pairs'] for load in loads),
+                 'handovers': self.handovers}
+        print("Load: {} workers: {}".format(total, loads))
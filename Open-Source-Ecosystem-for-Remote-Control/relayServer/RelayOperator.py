@@ -0,0 +1,190 @@
+#
+#   Copyright 2021  Adriano Cofrancesco
+#   Open-Source-Ecosystem-for-Remote-Control is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#   Open-Source-Ecosystem-for-Remote-Control is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+# Operator side of a relayed session: asks the relay for a device, then plays the
+# server for that device's TCPClientRSASerial. Encryption is end to end, the relay
+# only forwards the bytes. The fingerprint of the identity key must be in the relay's
+# --operators list.
+#   with RelayOperator('<IP_SERVER>', device='default') as operator:
+#       reply = operator.command(b'*IDN?')
+#       replies = operator.pipeline_commands([b'MEAS:VOLT?'] * 100)
+# or to follow the device console:
+#   with RelayOperator('<IP_SERVER>', device='default', stream_output=True) as operator:
+#       while True:
+#           sys.stdout.buffer.write(operator.read_output())
+
+import base64
+import collections
+import socket
+
+from Envelope import seal, unseal
+from Framing import MessageStream
+from KeyStore import KeyStore
+from MessageCodec import BINARY, YAML, decode_message, supported_codecs
+from OperatorAuth import sign_challenge
+from Pipeline import MAX_REQUEST_ID, PIPELINE_MODE, REPLY_OK, REPLY_STREAM, STREAM_MODE, pack_request, unpack_reply
+from SessionCipher import SessionCipher, SESSION_MODE
+from StartupProfile import lazy_import
+
+RSA = lazy_import('Cryptodome.PublicKey.RSA')
+
+
+class RelayOperator:
+
+    def __init__(self, host='127.0.0.1', port=65001, device='default', key_store=None, session=True,
+                 stream_output=False):
+        self.host = host
+        self.port = port
+        self.device = device
+        self.key_store = key_store if key_store is not None else KeyStore()
+        # offer one AES-GCM key for the session, False keeps the RSA envelope on every message
+        self.session = session
+        # offer the pipelined mode, commands in flight at once are limited to pipeline_window:
+        # window * command size should fit in the socket buffers of both ends
+        self.pipeline = True
+        self.pipeline_window = 32
+        # ask for the streaming mode: commands get an empty reply once written and
+        # everything the device prints is read with read_output()
+        self.stream_output = stream_output
+        self.timeout = 30
+        # time the relay may keep us waiting for a free device
+        self.wait = 10
+
+        self.private_key = None
+        self.device_key = None
+        self.session_cipher = None
+        self.pipelined = False
+        self.streaming = False
+        # device output received while waiting for replies
+        self.output = collections.deque()
+        self.next_request = 0
+        self.socket = None
+        self.stream = None
+
+    def __enter__(self):
+        return self.connect()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def connect(self):
+        self.private_key = self.key_store.get_key()
+
+        self.socket = socket.create_connection((self.host, self.port), self.timeout)
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.stream = MessageStream(self.socket, framed=True, idle_timeout=self.timeout + self.wait)
+
+        public_key = self.private_key.publickey().export_key().decode('utf-8')
+        self.stream.send(BINARY.encode({'relay': 'operator', 'device': self.device, 'wait': self.wait,
+                                        'pubkey': public_key}))
+        reply = decode_message(self.stream.recv() or b'')
+        if isinstance(reply, dict) and reply.get('relay') == 'challenge':
+            self.stream.send(BINARY.encode(sign_challenge(self.private_key, reply)))
+            reply = decode_message(self.stream.recv() or b'')
+        if not isinstance(reply, dict) or reply.get('relay') != 'paired':
+            self.close()
+            raise ConnectionError((reply or {}).get('error', "Relay closed the connection"))
+        self.stream.idle_timeout = self.timeout
+
+        # from here on the device takes us for its server
+        hello = {'pubkey': public_key, 'codecs': supported_codecs}
+        if self.session:
+            hello['session'] = [SESSION_MODE]
+        if self.pipeline:
+            hello['pipeline'] = [PIPELINE_MODE]
+            if self.stream_output:
+                hello['stream'] = [STREAM_MODE]
+        self.stream.send(YAML.encode(hello))
+
+        packet = decode_message(unseal(self.private_key, self.stream.recv()))
+        self.device_key = RSA.import_key(packet['pubkey'])
+        if packet.get('session') == SESSION_MODE:
+            self.session_cipher = SessionCipher(base64.b64decode(packet['sessionKey']), initiator=False)
+        self.pipelined = packet.get('pipeline') == PIPELINE_MODE
+        self.streaming = packet.get('stream') == STREAM_MODE
+        print("Paired with device {} through {}:{}".format(self.device, self.host, self.port))
+
+        return self
+
+    # send one command to the device serial port and return its reply
+    def command(self, data):
+        if self.pipelined:
+            return self.pipeline_commands([data])[0]
+
+        self.stream.send(self.encrypt(data))
+        return self.decrypt(self.stream.recv())
+
+    # many commands in flight at once, the link round trip is paid once per window
+    # instead of once per command. Replies are returned in the order of the commands,
+    # a device without the pipelined mode runs them one at a time
+    def pipeline_commands(self, commands):
+        commands = list(commands)
+        if not self.pipelined:
+            return [self.command(data) for data in commands]
+
+        request_ids = []
+        replies = {}
+        failed = None
+        while len(replies) < len(commands):
+            while len(request_ids) < len(commands) and len(request_ids) - len(replies) < self.pipeline_window:
+                request_id = self.next_request
+                self.next_request = (request_id + 1) & MAX_REQUEST_ID
+                self.stream.send(self.encrypt(pack_request(request_id, commands[len(request_ids)])))
+                request_ids.append(request_id)
+
+            request_id, status, data = self.recv_reply()
+            if status == REPLY_STREAM:
+                self.output.append(data)
+                continue
+            # the other replies are still read, the stream stays usable
+            if status != REPLY_OK and failed is None:
+                failed = (request_id, data.decode('utf-8', 'replace'))
+            replies[request_id] = data
+
+        if failed is not None:
+            raise OSError("Command {} failed on the device: {}".format(*failed))
+        return [replies[request_id] for request_id in request_ids]
+
+    # streaming mode: the next piece of device output, socket.timeout when the device
+    # stayed quiet for timeout seconds
+    def read_output(self):
+        if not self.streaming:
+            raise RuntimeError("Device {} did not accept the streaming mode".format(self.device))
+        if self.output:
+            return self.output.popleft()
+        # no command is waiting for its reply here, only output can come
+        return self.recv_reply()[2]
+
+    def recv_reply(self):
+        message = self.stream.recv()
+        if not message:
+            raise ConnectionError("Device closed the connection")
+        return unpack_reply(self.decrypt(message))
+
+    def encrypt(self, data):
+        if self.session_cipher is not None:
+            return self.session_cipher.encrypt(data)
+        return seal(self.device_key, data)
+
+    def decrypt(self, message):
+        if self.session_cipher is not None:
+            return self.session_cipher.decrypt(message)
+        return unseal(self.private_key, message)
+
+    def close(self):
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+        if self.stream is not None:
+            self.stream.close()
@@ -0,0 +1,417 @@
+#
+#   Copyright 2021  Adriano Cofrancesco
+#   Open-Source-Ecosystem-for-Remote-Control is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#   Open-Source-Ecosystem-for-Remote-Control is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+# Relay behind <IP_SERVER>. Every client connects to the same port and is told apart
+# by its first message:
+#   {'pubkey': ...}               TCPClientRSA asking for its WireGuard configuration,
+#                                 sealed with its key, found by key fingerprint
+#   {'relay': 'operator', ...}    an operator asking for a device, it signs a challenge
+#                                 with a key of the --operators list (see OperatorAuth),
+#                                 bytes are then forwarded both ways without being decrypted
+#   nothing                       TCPClientRSASerial waiting for the server hello: a device,
+#                                 kept idle until an operator asks for it
+#   python3 RelayServer.py [--port 65001] [--device NAME=PORT ...] [--configs DIR] [--operators FILE] [--stats 10]
+#                          [--workers 4] [--ws-port 443 --tls-cert FILE --tls-key FILE]
+# With several workers every one of them listens on the same ports with SO_REUSEPORT,
+# and RelayBroker pairs an operator with an idle device held by any of them.
+# --ws-port takes clients over WebSocket, TLS with a certificate, in place of a wstunnel
+# server. The URL path names the device: wss://<IP_SERVER>/NAME, / is 'default'.
+
+import argparse
+import asyncio
+import functools
+import math
+import multiprocessing
+import os
+import socket
+
+from DeviceRegistry import DeviceRegistry, SharedRegistry
+from Envelope import seal
+from Framing import AsyncMessageStream, FrameDecoder
+from MessageCodec import decode_message, detect_codec
+from OperatorAuth import check_proof, key_fingerprint, load_operator_keys, new_challenge
+from RelayBroker import RelayBroker
+from StartupProfile import lazy_import
+from WebSocket import WebSocketReader, WebSocketWriter, accept_websocket
+
+RSA = lazy_import('Cryptodome.PublicKey.RSA')
+ssl = lazy_import('ssl')
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+DEFAULT_DEVICE = 'default'
+
+
+# thousands of idle devices need as many descriptors
+def raise_file_limit():
+    if resource is None:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+class Peer:
+
+    def __init__(self, reader, writer, name=DEFAULT_DEVICE):
+        self.reader = reader
+        self.writer = writer
+        self.name = name
+        self.address = writer.get_extra_info('peername')
+        self.partner = None
+        # set by a shared registry while the device is idle
+        self.key = None
+
+    def is_alive(self):
+        return not self.reader.at_eof() and not self.writer.is_closing()
+
+    def close(self):
+        if not self.writer.is_closing():
+            self.writer.close()
+
+
+class RelayServer:
+
+    def __init__(self, host='0.0.0.0', port=65001, device_ports=None, config_dir=None):
+        self.host = host
+        self.port = port
+        # extra ports whose devices get the port name instead of 'default'
+        self.device_ports = device_ports or {}
+        self.config_dir = config_dir
+        self.backlog = 4096
+        self.buffer_size = 65536
+        self.first_buffer = 2048
+        # a client silent for this long is a device waiting for the server hello
+        self.device_grace = 0.3
+        # longest time an operator may wait for a device
+        self.pair_timeout = 30
+        # fingerprints of the operator keys allowed to pair, no list refuses every operator
+        self.operator_keys = set()
+        self.auth_timeout = 10
+        self.stats_interval = 0
+        # processes sharing the ports, 1 keeps everything in this one
+        self.workers = 1
+        # WebSocket listener, TLS when a certificate is given
+        self.ws_port = None
+        self.tls_cert = None
+        self.tls_key = None
+        self.upgrade_timeout = 10
+
+        self.registry = DeviceRegistry()
+        self.pairs = 0
+        self.total_pairs = 0
+        self.configs_sent = 0
+
+    def run(self):
+        raise_file_limit()
+        if self.workers > 1:
+            if self.ws_port:
+                # TLS and WebSocket state cannot follow a socket handed to another worker
+                raise SystemExit("--ws-port needs a single worker")
+            self.run_workers()
+            return
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            print("Closing Relay")
+
+    # the kernel spreads the connections over the workers, this process becomes the broker
+    def run_workers(self):
+        if not hasattr(socket, 'SO_REUSEPORT'):
+            raise SystemExit("Several workers need SO_REUSEPORT")
+
+        channels = {}
+        processes = []
+        for worker in range(self.workers):
+            channel, worker_channel = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+            process = multiprocessing.Process(target=self.run_worker, args=(worker_channel,), daemon=True)
+            process.start()
+            worker_channel.close()
+            channels[worker] = channel
+            processes.append(process)
+
+        try:
+            RelayBroker(channels, self.stats_interval).run()
+        except KeyboardInterrupt:
+            print("Closing Relay")
+        finally:
+            for process in processes:
+                process.terminate()
+
+    def run_worker(self, channel):
+        self.registry = SharedRegistry(channel)
+        self.registry.adopt = self.adopt_device
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            pass
+
+    async def serve(self):
+        servers = []
+        for name, port in [(DEFAULT_DEVICE, self.port)] + list(self.device_ports.items()):
+            server = await asyncio.start_server(functools.partial(self.handle, name), self.host, port,
+                                                backlog=self.backlog, reuse_address=True,
+                                                reuse_port=self.workers > 1 or None)
+            servers.append(server)
+            print("Relay {} listening on port {} ({}, pid {})".format(self.host, port, name, os.getpid()))
+
+        if self.ws_port:
+            context = None
+            if self.tls_cert:
+                context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+                context.load_cert_chain(self.tls_cert, self.tls_key)
+            server = await asyncio.start_server(self.handle_websocket, self.host, self.ws_port, ssl=context,
+                                                backlog=self.backlog, reuse_address=True)
+            servers.append(server)
+            print("Relay {} listening on port {} ({})".format(self.host, self.ws_port, "wss" if context else "ws"))
+
+        if self.stats_interval:
+            asyncio.get_running_loop().create_task(self.report_load())
+        tasks = [asyncio.ensure_future(server.serve_forever()) for server in servers]
+        if isinstance(self.registry, SharedRegistry):
+            tasks.append(asyncio.ensure_future(self.follow_broker()))
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+
+    # a worker takes the handovers from the broker and stops with it
+    async def follow_broker(self):
+        loop = asyncio.get_running_loop()
+        closed = loop.create_future()
+        loop.add_reader(self.registry.channel, self.read_broker, closed)
+        await closed
+        loop.remove_reader(self.registry.channel)
+        print("Relay broker is gone, worker {} stops".format(os.getpid()))
+
+    def read_broker(self, closed):
+        try:
+            self.registry.receive()
+        except (OSError, ConnectionError):
+            if not closed.done():
+                closed.set_result(None)
+
+    def load(self):
+        return {'pid': os.getpid(), 'idle': self.registry.idle(), 'pairs': self.pairs,
+                'totalPairs': self.total_pairs, 'configs': self.configs_sent}
+
+    async def report_load(self):
+        while True:
+            await asyncio.sleep(self.stats_interval)
+            if isinstance(self.registry, SharedRegistry):
+                self.registry.send({'op': 'load', 'load': self.load()})
+            else:
+                print("Load: {}".format(self.load()))
+
+    async def handle(self, name, reader, writer):
+        sock = writer.get_extra_info('socket')
+        if sock is not None:
+            # a device that vanished while idle is found out without any traffic
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+
+        peer = Peer(reader, writer, name)
+        stream = AsyncMessageStream(reader, writer)
+        # first messages are small and most clients are idle devices, the default 64 KiB
+        # buffer would be most of their memory. It grows for larger frames.
+        stream.decoder = FrameDecoder(self.first_buffer)
+        try:
+            try:
+                message = await asyncio.wait_for(stream.recv(), self.device_grace)
+            except asyncio.TimeoutError:
+                await self.handle_device(peer)
+                return
+
+            if not message:
+                return
+
+            try:
+                request = decode_message(message)
+            except Exception:
+                request = None
+
+            if isinstance(request, dict) and request.get('relay') == 'operator':
+                await self.handle_operator(peer, stream, request, detect_codec(message))
+            elif isinstance(request, dict) and 'pubkey' in request:
+                await self.send_config(stream, request)
+            else:
+                print("Unknown first message from {}".format(peer.address))
+        except (OSError, ConnectionError) as error:
+            print("Relay error with {}: {}".format(peer.address, error))
+        finally:
+            peer.close()
+
+    async def handle_websocket(self, reader, writer):
+        try:
+            path = await asyncio.wait_for(accept_websocket(reader, writer), self.upgrade_timeout)
+        except (asyncio.TimeoutError, OSError):
+            path = None
+        if path is None:
+            writer.close()
+            return
+
+        name = path.strip('/') or DEFAULT_DEVICE
+        await self.handle(name, WebSocketReader(reader, writer), WebSocketWriter(writer))
+
+    async def handle_device(self, peer, want=None):
+        # a device handed over by another worker goes to the operator that asked for it
+        if want is None or not self.registry.deliver(peer, want):
+            self.registry.add(peer)
+        try:
+            await self.forward(peer)
+        finally:
+            self.registry.remove(peer)
+            self.unpair(peer)
+
+    def adopt_device(self, name, sock, want):
+        asyncio.get_running_loop().create_task(self.handle_adopted(name, sock, want))
+
+    async def handle_adopted(self, name, sock, want):
+        reader, writer = await asyncio.open_connection(sock=sock)
+        await self.handle_device(Peer(reader, writer, name), want)
+
+    async def handle_operator(self, peer, stream, request, codec):
+        name = request.get('device') or DEFAULT_DEVICE
+        wait = request.get('wait', self.pair_timeout)
+        if not isinstance(name, str) or isinstance(wait, bool) or not isinstance(wait, (int, float)) \
+                or math.isnan(wait) or wait < 0:
+            await stream.send(codec.encode({'relay': 'error', 'error': "Wrong operator request"}))
+            return
+        if not await self.authenticate_operator(peer, stream, request, codec):
+            return
+
+        device = await self.registry.wait(name, min(wait, self.pair_timeout))
+        if device is None:
+            await stream.send(codec.encode({'relay': 'error', 'error': "No device available on '{}'".format(name)}))
+            return
+
+        peer.partner = device
+        device.partner = peer
+        self.pairs += 1
+        self.total_pairs += 1
+        print("Operator {} paired with device {} ({})".format(peer.address, device.address, name))
+        try:
+            await stream.send(codec.encode({'relay': 'paired', 'device': name}))
+            # the operator's hello may already be behind its request
+            if stream.decoder.pending():
+                device.writer.write(stream.decoder.take_all())
+            await self.forward(peer)
+        finally:
+            self.pairs -= 1
+            self.unpair(peer)
+
+    # an idle device takes any key in the hello that follows the pairing, so only operators
+    # holding a key of the allow-list get that far
+    async def authenticate_operator(self, peer, stream, request, codec):
+        try:
+            public_key = RSA.import_key(request['pubkey'])
+        except (KeyError, ValueError, IndexError, TypeError):
+            public_key = None
+        fingerprint = key_fingerprint(public_key) if public_key is not None else None
+        if fingerprint is None or fingerprint not in self.operator_keys:
+            print("Operator {} refused, key {}".format(peer.address, fingerprint))
+            await stream.send(codec.encode({'relay': 'error', 'error': "Operator key not allowed"}))
+            return False
+
+        challenge = new_challenge()
+        await stream.send(codec.encode(challenge))
+        try:
+            message = await asyncio.wait_for(stream.recv(), self.auth_timeout)
+            proof = decode_message(message) if message else None
+        except asyncio.TimeoutError:
+            proof = None
+        except Exception as error:
+            print("Operator {} proof error: {}".format(peer.address, error))
+            proof = None
+        if not isinstance(proof, dict) or not check_proof(public_key, challenge, proof):
+            print("Operator {} failed the challenge of key {}".format(peer.address, fingerprint))
+            await stream.send(codec.encode({'relay': 'error', 'error': "Operator key not proven"}))
+            return False
+
+        return True
+
+    # copy bytes to the partner as they come, frames and encryption are left untouched
+    async def forward(self, source):
+        while True:
+            data = await source.reader.read(self.buffer_size)
+            if not data:
+                return
+
+            target = source.partner
+            if target is None:
+                print("Unexpected data from unpaired device {}".format(source.address))
+                return
+            target.writer.write(data)
+            await target.writer.drain()
+
+    def unpair(self, peer):
+        partner = peer.partner
+        peer.partner = None
+        peer.close()
+        if partner is not None:
+            partner.partner = None
+            partner.close()
+
+    async def send_config(self, stream, request):
+        try:
+            public_key = RSA.import_key(request['pubkey'])
+        except (ValueError, IndexError, TypeError) as error:
+            print("Wrong RSA key: {}".format(error))
+            return
+
+        fingerprint = key_fingerprint(public_key)
+        path = os.path.join(self.config_dir, fingerprint + '.conf') if self.config_dir else None
+        if path is None or not os.path.isfile(path):
+            print("No WireGuard configuration for key {}".format(fingerprint))
+            return
+
+        with open(path, 'rb') as file:
+            config = file.read()
+        await stream.send(seal(public_key, config))
+        self.configs_sent += 1
+        print("WireGuard configuration sent to key {}".format(fingerprint))
+
+
+def parse_device(value):
+    name, _, port = value.partition('=')
+    if not name or not port.isdigit():
+        raise argparse.ArgumentTypeError("expected NAME=PORT, got {}".format(value))
+    return name, int(port)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Relay between operators and devices")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=65001)
+    parser.add_argument('--device', type=parse_device, action='append', default=[],
+                        help="extra port for the devices called NAME")
+    parser.add_argument('--configs', help="directory of WireGuard configurations, <key fingerprint>.conf")
+    parser.add_argument('--operators', help="operator key fingerprints allowed to pair, one per line")
+    parser.add_argument('--stats', type=float, default=0, help="print the load every STATS seconds")
+    parser.add_argument('--workers', type=int, default=1, help="processes sharing the ports with SO_REUSEPORT")
+    parser.add_argument('--ws-port', type=int, help="also accept clients over WebSocket on this port")
+    parser.add_argument('--tls-cert', help="certificate chain, makes the WebSocket port wss")
+    parser.add_argument('--tls-key', help="private key of the certificate")
+    args = parser.parse_args()
+
+    relay = RelayServer(args.host, args.port, dict(args.device), args.configs)
+    if args.operators:
+        relay.operator_keys = load_operator_keys(args.operators)
+    else:
+        print("No --operators list, every operator is refused")
+    relay.stats_interval = args.stats
+    relay.workers = args.workers
+    relay.ws_port = args.ws_port
+    relay.tls_cert = args.tls_cert
+    relay.tls_key = args.tls_key
+    relay.run()
@@ -0,0 +1,75 @@
+#
+#   Copyright 2021  Adriano Cofrancesco
+#   Open-Source-Ecosystem-for-Remote-Control is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#   Open-Source-Ecosystem-for-Remote-Control is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+import struct
+
+from StartupProfile import lazy_import
+
+AES = lazy_import('Cryptodome.Cipher.AES')
+Random = lazy_import('Cryptodome.Random')
+
+SESSION_MODE = 'AES-GCM'
+
+# the side that generates the key sends with INITIATOR, the other side with RESPONDER,
+# so the two directions never share a nonce
+INITIATOR = b'\x00\x00\x00\x01'
+RESPONDER = b'\x00\x00\x00\x02'
+
+
+class SessionCipher:
+    counter_format = '>Q'
+    counter_size = 8
+    tag_size = 16
+    key_size = 32
+
+    def __init__(self, key, initiator=True):
+        self.key = key
+        self.send_prefix = INITIATOR if initiator else RESPONDER
+        self.recv_prefix = RESPONDER if initiator else INITIATOR
+        self.send_counter = 0
+        self.recv_counter = 0
+
+    @classmethod
+    def generate(cls):
+        return cls(Random.get_random_bytes(cls.key_size), initiator=True)
+
+    # frame: counter (8 bytes) + tag (16 bytes) + cipher text
+    def encrypt(self, data):
+        self.send_counter += 1
+        counter = struct.pack(self.counter_format, self.send_counter)
+
+        cipher_aes = AES.new(self.key, AES.MODE_GCM, nonce=self.send_prefix + counter)
+        cipher_text, tag = cipher_aes.encrypt_and_digest(data)
+
+        return counter + tag + cipher_text
+
+    def decrypt(self, frame):
+        tag_index = self.counter_size + self.tag_size
+        if len(frame) < tag_index:
+            raise ValueError("Session frame too short")
+
+        counter = frame[:self.counter_size]
+        tag = frame[self.counter_size:tag_index]
+        cipher_text = frame[tag_index:]
+
+        # counters must always increase, replayed or reordered frames are refused
+        value = struct.unpack(self.counter_format, counter)[0]
+        if value <= self.recv_counter:
+            raise ValueError("Replayed session frame: {}".format(value))
+
+        cipher_aes = AES.new(self.key, AES.MODE_GCM, nonce=self.recv_prefix + counter)
+        data = cipher_aes.decrypt_and_verify(cipher_text, tag)
+        self.recv_counter = value
+
+        return data
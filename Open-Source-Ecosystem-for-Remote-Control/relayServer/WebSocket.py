@@ -0,0 +1,370 @@
+#
+#   Copyright 2021  Adriano Cofrancesco
+#   Open-Source-Ecosystem-for-Remote-Control is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#   Open-Source-Ecosystem-for-Remote-Control is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# WebSocket transport (RFC 6455), over TLS for wss:// URLs, so a client reaches the relay
+# without a local wstunnel. WebSocket is a blocking socket lookalike for MessageStream,
+# accept_websocket, WebSocketReader and WebSocketWriter are the relay side for asyncio.
+# Every message is one binary frame, the byte stream inside is the same as over TCP.
+
+import base64
+import hashlib
+import os
+import socket
+import struct
+from urllib.parse import urlsplit
+
+from Framing import MAX_FRAME_SIZE, frame_header
+from StartupProfile import lazy_import
+
+asyncio = lazy_import('asyncio')
+ssl = lazy_import('ssl')
+
+WEBSOCKET_GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+MAX_HEADER = 16384
+# every write of MessageStream is one frame, a bigger payload is refused before it is
+# buffered, whatever length the peer declares
+MAX_PAYLOAD = MAX_FRAME_SIZE + frame_header.size
+CLOSE_PROTOCOL_ERROR = 1002
+CLOSE_TOO_BIG = 1009
+
+
+def accept_key(key):
+    return base64.b64encode(hashlib.sha1(key + WEBSOCKET_GUID).digest())
+
+
+def apply_mask(key, data):
+    size = len(data)
+    if not size:
+        return b''
+    # one big integer xor instead of a python loop over the bytes
+    repeated = (key * (size // 4 + 1))[:size]
+    return (int.from_bytes(data, 'little') ^ int.from_bytes(repeated, 'little')).to_bytes(size, 'little')
+
+
+def encode_frame(opcode, payload, masked):
+    size = len(payload)
+    first = 0x80 | opcode
+    mask_bit = 0x80 if masked else 0
+    if size < 126:
+        header = struct.pack('>BB', first, mask_bit | size)
+    elif size < 65536:
+        header = struct.pack('>BBH', first, mask_bit | 126, size)
+    else:
+        header = struct.pack('>BBQ', first, mask_bit | 127, size)
+
+    if not masked:
+        return header + payload
+    key = os.urandom(4)
+    return header + key + apply_mask(key, payload)
+
+
+class FrameError(ValueError):
+
+    def __init__(self, message, code):
+        super().__init__(message)
+        self.code = code
+
+
+# (fin, opcode, payload, frame size) of the frame at the start of data, None if incomplete.
+# Clients must mask their frames (RFC 6455 5.1), the server decodes with masked=True
+def decode_frame(data, masked=False):
+    if len(data) < 2:
+        return None
+    first, second = data[0], data[1]
+    size = second & 0x7F
+    offset = 2
+    if size == 126:
+        if len(data) < 4:
+            return None
+        size = struct.unpack_from('>H', data, 2)[0]
+        offset = 4
+    elif size == 127:
+        if len(data) < 10:
+            return None
+        size = struct.unpack_from('>Q', data, 2)[0]
+        offset = 10
+    if size > MAX_PAYLOAD:
+        raise FrameError("WebSocket frame too large: {} bytes".format(size), CLOSE_TOO_BIG)
+    if masked and not second & 0x80:
+        raise FrameError("Unmasked WebSocket frame from a client", CLOSE_PROTOCOL_ERROR)
+
+    key = None
+    if second & 0x80:
+        key = bytes(data[offset:offset + 4])
+        offset += 4
+    if len(data) < offset + size:
+        return None
+
+    payload = bytes(data[offset:offset + size])
+    if key is not None:
+        payload = apply_mask(key, payload)
+    return bool(first & 0x80), first & 0x0F, payload, offset + size
+
+
+def parse_headers(block):
+    lines = block.decode('latin-1').split('\r\n')
+    headers = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(':')
+        if name:
+            headers[name.strip().lower()] = value.strip()
+    return lines[0], headers
+
+
+class WebSocket:
+
+    # ws://host[:port]/path or wss://host[:port]/path, the path names the device on the relay
+    def __init__(self, url, timeout=None, ssl_context=None):
+        parts = urlsplit(url)
+        if parts.scheme not in ('ws', 'wss'):
+            raise ValueError("Not a WebSocket URL: {}".format(url))
+        self.url = url
+        self.secure = parts.scheme == 'wss'
+        self.host = parts.hostname
+        self.port = parts.port or (443 if self.secure else 80)
+        self.path = parts.path or '/'
+        self.timeout = timeout
+        # None verifies the server against the system certificates
+        self.ssl_context = ssl_context
+        self.socket_buffer = 65536
+
+        self.sock = None
+        # bytes received and not parsed yet, payload not handed out yet
+        self.incoming = bytearray()
+        self.payload = bytearray()
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def connect(self):
+        sock = socket.create_connection((self.host, self.port), self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            if self.secure:
+                context = self.ssl_context or ssl.create_default_context()
+                sock = context.wrap_socket(sock, server_hostname=self.host)
+            self.sock = sock
+            self.handshake()
+        except BaseException:
+            sock.close()
+            self.sock = None
+            raise
+
+    def handshake(self):
+        key = base64.b64encode(os.urandom(16))
+        request = ("GET {} HTTP/1.1\r\nHost: {}:{}\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                   "Sec-WebSocket-Key: {}\r\nSec-WebSocket-Version: 13\r\n\r\n").format(
+            self.path, self.host, self.port, key.decode())
+        self.sock.sendall(request.encode())
+
+        while b'\r\n\r\n' not in self.incoming:
+            if len(self.incoming) > MAX_HEADER:
+                raise ConnectionError("WebSocket handshake too long")
+            chunk = self.sock.recv(self.socket_buffer)
+            if not chunk:
+                raise ConnectionError("Connection closed during the WebSocket handshake")
+            self.incoming += chunk
+
+        end = self.incoming.index(b'\r\n\r\n') + 4
+        status, headers = parse_headers(bytes(self.incoming[:end - 4]))
+        # frames may already follow the response
+        del self.incoming[:end]
+        if status.split(' ')[1:2] != ['101']:
+            raise ConnectionError("WebSocket upgrade refused: {}".format(status))
+        if headers.get('sec-websocket-accept', '').encode() != accept_key(key):
+            raise ConnectionError("Wrong Sec-WebSocket-Accept from {}".format(self.url))
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
+        if self.sock is not None:
+            self.sock.settimeout(timeout)
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    # bytes that can be read without waiting for the socket, MessageStream does not select then
+    def pending(self):
+        pending = len(self.payload) + len(self.incoming)
+        if self.secure and self.sock is not None:
+            pending += self.sock.pending()
+        return pending
+
+    def sendall(self, data):
+        self.sock.sendall(encode_frame(OP_BINARY, bytes(data), masked=True))
+
+    def recv_into(self, buffer, nbytes=0):
+        while not self.payload:
+            if self.closed or not self.read_frame():
+                return 0
+
+        size = min(nbytes or len(buffer), len(buffer), len(self.payload))
+        buffer[:size] = self.payload[:size]
+        del self.payload[:size]
+        return size
+
+    def recv(self, size):
+        buffer = bytearray(size)
+        received = self.recv_into(buffer)
+        return bytes(buffer[:received])
+
+    # one frame into self.payload, False once the connection is closed
+    def read_frame(self):
+        frame = decode_frame(self.incoming)
+        while frame is None:
+            chunk = self.sock.recv(self.socket_buffer)
+            if not chunk:
+                self.closed = True
+                return False
+            self.incoming += chunk
+            frame = decode_frame(self.incoming)
+
+        fin, opcode, payload, size = frame
+        del self.incoming[:size]
+        if opcode in (OP_BINARY, OP_TEXT, OP_CONTINUATION):
+            self.payload += payload
+        elif opcode == OP_PING:
+            self.sock.sendall(encode_frame(OP_PONG, payload, masked=True))
+        elif opcode == OP_CLOSE:
+            # no close frame back, the relay drops the connection right after its own
+            self.closed = True
+            return False
+        return True
+
+    def send_close(self):
+        try:
+            self.sock.sendall(encode_frame(OP_CLOSE, b'', masked=True))
+        except OSError:
+            pass
+
+    # wakes a recv blocked in another thread, like on a plain socket
+    def shutdown(self, how):
+        if self.sock is not None:
+            self.sock.shutdown(how)
+
+    def close(self):
+        if self.sock is None:
+            return
+        if not self.closed:
+            self.closed = True
+            self.send_close()
+        self.sock.close()
+        self.sock = None
+
+
+# server side of the upgrade, returns the request path or None if it was not a WebSocket
+async def accept_websocket(reader, writer):
+    try:
+        block = await reader.readuntil(b'\r\n\r\n')
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+        return None
+
+    request, headers = parse_headers(block[:-4])
+    parts = request.split(' ')
+    key = headers.get('sec-websocket-key')
+    if len(parts) < 2 or parts[0] != 'GET' or headers.get('upgrade', '').lower() != 'websocket' or not key:
+        writer.write(b'HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+        return None
+
+    writer.write(b'HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+                 b'Sec-WebSocket-Accept: ' + accept_key(key.encode()) + b'\r\n\r\n')
+    await writer.drain()
+    return urlsplit(parts[1]).path
+
+
+# StreamReader lookalike returning the payload of the client's frames
+class WebSocketReader:
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.incoming = bytearray()
+        self.payload = bytearray()
+        self.eof = False
+
+    def at_eof(self):
+        return self.eof and not self.payload
+
+    async def read(self, size=-1):
+        while not self.payload and not self.eof:
+            try:
+                frame = decode_frame(self.incoming, masked=True)
+            except FrameError as error:
+                print("WebSocket error: {}".format(error))
+                self.fail(error.code)
+                break
+            if frame is None:
+                chunk = await self.reader.read(65536)
+                if not chunk:
+                    self.eof = True
+                self.incoming += chunk
+                continue
+
+            fin, opcode, payload, frame_size = frame
+            del self.incoming[:frame_size]
+            if opcode in (OP_BINARY, OP_TEXT, OP_CONTINUATION):
+                self.payload += payload
+            elif opcode == OP_PING:
+                self.writer.write(encode_frame(OP_PONG, payload, masked=False))
+            elif opcode == OP_CLOSE:
+                self.eof = True
+
+        if size < 0:
+            size = len(self.payload)
+        data = bytes(self.payload[:size])
+        del self.payload[:size]
+        return data
+
+    # the connection is closed with a status code, reads return b'' from now on
+    def fail(self, code):
+        self.eof = True
+        self.incoming.clear()
+        if not self.writer.is_closing():
+            self.writer.write(encode_frame(OP_CLOSE, struct.pack('>H', code), masked=False))
+            self.writer.close()
+
+
+# StreamWriter lookalike sending every write as one binary frame
+class WebSocketWriter:
+
+    def __init__(self, writer):
+        self.writer = writer
+
+    def write(self, data):
+        self.writer.write(encode_frame(OP_BINARY, bytes(data), masked=False))
+
+    def writelines(self, chunks):
+        self.write(b''.join(chunks))
+
+    async def drain(self):
+        await self.writer.drain()
+
+    def is_closing(self):
+        return self.writer.is_closing()
+
+    def get_extra_info(self, name, default=None):
+        return self.writer.get_extra_info(name, default)
+
+    def close(self):
+        if not self.writer.is_closing():
+            self.writer.write(encode_frame(OP_CLOSE, b'', masked=False))
+            self.writer.close()
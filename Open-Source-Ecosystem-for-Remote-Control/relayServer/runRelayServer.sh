@@ -0,0 +1,7 @@
+#!/bin/bash
+
+echo "*Starting RelayServer*"
+
+nohup python3 "$(dirname "$0")/RelayServer.py" --configs "$(dirname "$0")/configs" --operators "$(dirname "$0")/operators" --stats 60 "$@" > relay.log 2>&1 &
+
+echo "*RelayServer Started*"
@@ -1,141 +1,276 @@
-#
-#   Copyright 2021  Adriano Cofrancesco
-#   Open-Source-Ecosystem-for-Remote-Control is free software: you can redistribute it and/or modify
-#   it under the terms of the GNU General Public License as published by
-#   the Free Software Foundation, either version 3 of the License, or
-#   (at your option) any later version.
-#   Open-Source-Ecosystem-for-Remote-Control is distributed in the hope that it will be useful,
-#
-#   Copyright 2021  Adriano Cofrancesco
-#   Open-Source-Ecosystem-for-Remote-Control is free software: you can redistribute it and/or modify
-#   it under the terms of the GNU General Public License as published by
-#   the Free Software Foundation, either version 3 of the License, or
-#   (at your option) any later version.
-#   Open-Source-Ecosystem-for-Remote-Control is distributed in the hope that it will be useful,
-#   but WITHOUT ANY WARRANTY; without even the implied warranty of
-#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
-#   GNU General Public License for more details.
-#   You should have received a copy of the GNU General Public License
-#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
-#
-
-import socket
-import serial
-import time
-import sys
-import yaml
-import glob
-import subprocess
-
-
-class TCPClient:
-
-    def __init__(self, host='0.0.0.0', port=65001):
-        self.host = host
-        self.port = port
-        self.timeout = 30
-        self.socket_buffer = 1024
-
-        self.socket = None
-        self.com_ports = []
-
-    def run(self):
-        data = b""
-        while True:
-            try:
-                print("Connection")
-                cat_stdout = self.checkEthUp()
-                if cat_stdout.strip('\n') == "0":
-                    print("DOWN")
-                    break
-
-                self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                self.socket.connect((self.host, self.port))
-                self.socket.settimeout(self.timeout)
-                
-                while True:
-                    try:
-                        data = self.socket.recv(1024)
-                    except BaseException as error:
-                        print("Client recv error: {}".format(error))
-                        self.socket.close()
-                        break
-                        
-                    if data:
-
-                        print("Received from Server: ", repr(data))
-
-                        data_yaml = yaml.load(data.decode('utf-8'), Loader=yaml.FullLoader)
-                        
-                        if data_yaml and 'msg' in data_yaml:
-
-                            if data_yaml['msg'] == "GET_PORTS":
-                                self.getSerialPorts()
-                                yaml_data = yaml.dump({'comPorts': self.com_ports})
-                            elif data_yaml['msg'] == "OPEN_CONNECTION":
-                                subprocess.Popen(["sudo", "/home/pi/Desktop/runClientRSA.sh", data_yaml['comPort']], stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
-                                yaml_data = yaml.dump({'openConnection': 'OK'})
-                            elif data_yaml['msg'] == "CLOSE_CONNECTION":
-                                subprocess.Popen(["sudo", "/home/pi/Desktop/closeServices.sh"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
-                                yaml_data = yaml.dump({'closeConnection': 'OK'})
-                            elif data_yaml['msg'] == "CHECK":
-                                check_rsa = subprocess.Popen(["sudo", "/home/pi/Desktop/checkTCPClientRSA.sh"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
-                                check_rsa_stdout, stderr = check_rsa.communicate()
-                                print("RetCode02: {}".format(check_rsa_stdout))
-                                yaml_data = yaml.dump({'check': check_rsa_stdout})
-
-                            data_binary = yaml_data.encode()
-                            try:
-                                self.socket.sendall(data_binary)
-                                print("sent: {}\n".format(data_binary))
-                                data = ""
-                                self.socket.close()
-                                break
-                            except socket.error as error:
-                                print("Client send error: {}".format(error))
-                                self.socket.close()
-                                break
-
-            except socket.timeout:
-                print("Closing Server")
-                self.socket.close()
-            except Exception as error:
-                print("Client connection error: {}".format(error))
-                time.sleep(2)
-
-    def checkEthUp(self):
-        cat_cmd = subprocess.Popen(["sudo", "cat", "/sys/class/net/eth0/carrier"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
-        cat_stdout, stderr = cat_cmd.communicate()
-        # print("CAT: '{}'".format(cat_stdout))
-
-        return cat_stdout
-
-    def getSerialPorts(self):
-        ports = []
-        if sys.platform.startswith('win'):
-            ports = ['COM%s' % (i + 1) for i in range(256)]
-        elif sys.platform.startswith('linux') or sys.platform.startswith('cygwin'):
-            # this excludes your current terminal "/dev/tty"
-            ports = glob.glob('/dev/tty[0-9A-Za-z]*')
-        elif sys.platform.startswith('darwin'):
-            ports = glob.glob('/dev/tty.*')
-        else:
-            raise EnvironmentError('Unsupported platform')
-
-        for port in ports:
-            try:
-                ser = serial.Serial(port)
-                ser.close()
-                self.com_ports.append(port)
-            except (OSError, serial.SerialException):
-                pass
-
-
-if __name__ == "__main__":
-    ip = "0.0.0.0"
-    if len(sys.argv) > 1:
-        ip = sys.argv[1]
-
-    print("IP: {}".format(ip))
-    client = TCPClient(ip)
-    client.run()
+#
+#   Copyright 2021  Adriano Cofrancesco
+#   Open-Source-Ecosystem-for-Remote-Control is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#   Open-Source-Ecosystem-for-Remote-Control is distributed in the hope that it will be useful,
+#
+#   Copyright 2021  Adriano Cofrancesco
+#   Open-Source-Ecosystem-for-Remote-Control is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#   Open-Source-Ecosystem-for-Remote-Control is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+from StartupProfile import startup_profile
+
+# first, so --profile-startup times every import below
+profile = startup_profile()
+
+import os
+import socket
+import threading
+import time
+import sys
+
+from ControlChannel import ControlChannel
+from LinkMonitor import LinkMonitor
+from PortEnumerator import PortEnumerator
+from KeyStore import KeyStore
+from ServiceStatus import StatusListener, StatusReporter
+from Supervisor import Supervisor, wstunnelPath
+from TCPClientRSASerialRaspberry import TCPClientRSASerial
+
+serialServiceName = 'TCPClientRSASerialRaspberry'
+
+
+class TCPClient:
+
+    def __init__(self, host='0.0.0.0', port=65001, interface='eth0'):
+        self.host = host
+        self.port = port
+        self.timeout = 30
+        self.socket_buffer = 1024
+        # the GUI pings every few seconds on a persistent channel
+        self.heartbeat_timeout = 15
+        # carrier of the interface towards the GUI, link events close the connection at once
+        self.link = LinkMonitor(interface)
+        self.link.on_change = self.linkChanged
+
+        self.socket = None
+        # serial ports from sysfs, cached until a tty is plugged or unplugged
+        self.port_enumerator = PortEnumerator()
+
+        # service state reported by the service process, pushed to subscribed GUIs
+        self.status = StatusListener(callback=self.pushStatus)
+        self.channel = None
+        self.subscribed = False
+
+        # the tunnel runs as a tracked child process instead of a nohup shell script
+        self.supervisor = Supervisor()
+        # wss://<IP_SERVER>/ lets the session reach the relay itself, no wstunnel process
+        self.tunnel_url = None
+
+        # serial sessions run as threads of this process, imports and RSA key stay warm
+        self.key_store = KeyStore()
+        self.session = None
+        self.session_thread = None
+        self.session_start_timeout = 5
+        # why the current session ended, None while it runs
+        self.session_error = None
+
+    def run(self):
+        data = b""
+        self.link.start()
+        self.port_enumerator.start()
+        try:
+            self.status.start()
+        except OSError as error:
+            print("Status listener error: {}".format(error))
+
+        # load the identity key now, OPEN_CONNECTION does not have to wait for it
+        try:
+            self.key_store.get_key()
+        except Exception as error:
+            print("Key store error: {}".format(error))
+        profile.report('run setup')
+
+        while True:
+            try:
+                print("Connection")
+                # an unknown interface is not treated as down
+                if self.link.is_up() is False:
+                    print("DOWN")
+                    break
+
+                self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                self.socket.connect((self.host, self.port))
+                self.socket.settimeout(self.timeout)
+                channel = ControlChannel(self.socket, self.socket_buffer, self.heartbeat_timeout)
+                channel.hello()
+                self.channel = channel
+                self.subscribed = False
+
+                while True:
+                    try:
+                        data_yaml = channel.recv()
+                    except BaseException as error:
+                        print("Client recv error: {}".format(error))
+                        self.socket.close()
+                        break
+
+                    if data_yaml is None:
+                        # empty read: the server closed the connection
+                        print("Connection closed by Server")
+                        self.socket.close()
+                        break
+
+                    print("Received from Server: ", repr(data_yaml))
+
+                    if data_yaml and 'msg' in data_yaml:
+                        reply = self.handleMessage(data_yaml)
+
+                        try:
+                            data_binary = channel.reply(data_yaml, reply)
+                            print("sent: {}\n".format(data_binary))
+                        except socket.error as error:
+                            print("Client send error: {}".format(error))
+                            self.socket.close()
+                            break
+
+                        # old GUIs open a new connection for every command
+                        if not channel.persistent:
+                            self.socket.close()
+                            break
+
+            except socket.timeout:
+                print("Closing Server")
+                self.socket.close()
+            except Exception as error:
+                print("Client connection error: {}".format(error))
+                time.sleep(2)
+
+    def handleMessage(self, message):
+        reply = {}
+        if message['msg'] == "PING":
+            # heartbeat of the persistent control channel
+            reply = {'pong': True}
+        elif message['msg'] == "SUBSCRIBE":
+            # state changes are pushed on the persistent channel, no more CHECK polling
+            self.subscribed = self.channel.persistent and self.status.socket is not None
+            reply = {'subscribed': self.status.state if self.subscribed else None}
+        elif message['msg'] == "GET_PORTS":
+            ports = self.port_enumerator.list_ports()
+            reply = {'comPorts': [port['port'] for port in ports], 'portInfo': ports}
+        elif message['msg'] == "OPEN_CONNECTION":
+            self.status.reset()
+            error, start_ms = self.openServices(message['comPort'])
+            if error is None:
+                reply = {'openConnection': 'OK', 'startMs': round(start_ms, 1)}
+            else:
+                reply = {'openConnection': 'KO', 'error': error}
+        elif message['msg'] == "CLOSE_CONNECTION":
+            self.closeServices()
+            reply = {'closeConnection': 'OK'}
+        elif message['msg'] == "CHECK":
+            # same output as checkTCPClientRSA.sh: a pid, empty when no session is running
+            running = self.session_thread is not None and self.session_thread.is_alive()
+            check_rsa_stdout = "{}\n".format(os.getpid() if running else "")
+            print("RetCode02: {}".format(check_rsa_stdout))
+            reply = {'check': check_rsa_stdout}
+
+        return reply
+
+    # what runClientRSA.sh did, the session starts in this process instead of a new
+    # interpreter. Returns the error that kept the session from connecting, None when
+    # it is running, and the time it took, in ms
+    def openServices(self, com_port):
+        start = time.perf_counter()
+        self.closeServices()
+        if not self.tunnel_url:
+            self.supervisor.start('wstunnel', [wstunnelPath, '-v', '-L', '127.0.0.1:65001:127.0.0.1:65001', 'wss://<IP_SERVER>'], restart=True)
+
+        status = StatusReporter(serialServiceName, callback=self.status.update)
+        session = TCPClientRSASerial('127.0.0.1', 65001, com_port, self.key_store, status)
+        session.tunnel_url = self.tunnel_url
+        self.session = session
+        self.session_error = None
+        self.session_thread = threading.Thread(target=self.runSession, args=(session,), daemon=True)
+        self.session_thread.start()
+
+        # ready is also set when the session ends before connecting
+        if not session.ready.wait(self.session_start_timeout):
+            error = "not connected after {} s".format(self.session_start_timeout)
+            self.closeServices()
+        else:
+            error = self.session_error
+        start_ms = (time.perf_counter() - start) * 1000
+
+        if error is not None:
+            print("Session not started: {}".format(error))
+            return str(error), start_ms
+
+        print("Session started in {:.1f} ms".format(start_ms))
+        return None, start_ms
+
+    def runSession(self, session):
+        try:
+            session.run()
+        except Exception as error:
+            print("Session error: {}".format(error))
+            if self.session is session:
+                self.session_error = error
+        finally:
+            session.status.close()
+            session.ready.set()
+            # the tunnel is only needed by the serial session
+            if self.session is session:
+                self.session = None
+                self.supervisor.stop('wstunnel')
+
+    # what closeServices.sh did
+    def closeServices(self):
+        session = self.session
+        self.session = None
+        if session is not None:
+            session.close()
+        self.supervisor.stop('wstunnel')
+
+    def linkChanged(self, carrier):
+        sock = self.socket
+        if carrier or sock is None:
+            return
+
+        # wake the blocked recv instead of waiting for the heartbeat timeout
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def pushStatus(self, status):
+        channel = self.channel
+        if not self.subscribed or channel is None:
+            return
+
+        try:
+            channel.push({'event': 'status', 'status': status})
+        except OSError as error:
+            print("Status push error: {}".format(error))
+
+
+if __name__ == "__main__":
+    profile.mark('imports')
+    ip = "0.0.0.0"
+    if len(sys.argv) > 1:
+        ip = sys.argv[1]
+    interface = "eth0"
+    if len(sys.argv) > 2:
+        interface = sys.argv[2]
+
+    print("IP: {}".format(ip))
+    client = TCPClient(ip, interface=interface)
+    # third argument: wss://<IP_SERVER>/ to open sessions without wstunnel
+    if len(sys.argv) > 3:
+        client.tunnel_url = sys.argv[3]
+    profile.mark('init')
+    try:
+        client.run()
+    finally:
+        client.supervisor.stop_all()
@@ -0,0 +1,82 @@
+#
+#   Copyright 2021  Adriano Cofrancesco
+#   Open-Source-Ecosystem-for-Remote-Control is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#   Open-Source-Ecosystem-for-Remote-Control is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+import socket
+import threading
+import time
+
+from Framing import MessageStream
+from MessageCodec import YAML, codecs, decode_message, negotiate_codec, supported_codecs
+
+CHANNEL_VERSION = 1
+
+
+# agent side of the persistent control channel.
+# On connect the agent sends a yaml 'hello'. A GUI supporting the channel answers with
+# a framed 'hello' naming the codec to use, then keeps the connection open and sends
+# requests tagged with an 'id', replies carry the same 'id'. Old GUIs ignore the hello,
+# send one command and expect the connection to be closed after the reply.
+class ControlChannel:
+
+    def __init__(self, sock, socket_buffer=1024, heartbeat_timeout=15):
+        self.stream = MessageStream(sock, socket_buffer=socket_buffer)
+        self.heartbeat_timeout = heartbeat_timeout
+        self.hello_delay = 0.2
+        self.codec = YAML
+        self.persistent = False
+        self.send_lock = threading.Lock()
+
+    # old GUIs send their command as soon as they accept, the hello is only sent when
+    # nothing arrives first, so it can never be glued to the reply of a legacy command
+    def hello(self):
+        try:
+            self.stream.wait_readable(time.monotonic() + self.hello_delay)
+        except socket.timeout:
+            self.send(YAML.encode({'hello': CHANNEL_VERSION, 'codecs': supported_codecs}))
+
+    def send(self, data):
+        with self.send_lock:
+            self.stream.send(data)
+
+    # next request from the GUI, None when the connection has been closed
+    def recv(self):
+        while True:
+            data = self.stream.recv()
+            if not data:
+                return None
+
+            message = decode_message(data)
+            if isinstance(message, dict) and 'hello' in message:
+                self.persistent = True
+                self.codec = codecs.get(message.get('codec'), YAML)
+                # the GUI pings regularly, silence means it is gone
+                self.stream.idle_timeout = self.heartbeat_timeout
+                print("Persistent control channel open ({})".format(self.codec.name))
+                continue
+
+            return message
+
+    # unsolicited message, it has no 'id' so the GUI hands it to its event callback
+    def push(self, message):
+        self.send(self.codec.encode(message))
+
+    def reply(self, request, reply):
+        if 'id' in request:
+            reply['id'] = request['id']
+
+        codec = self.codec if self.persistent else negotiate_codec(request.get('codecs'))
+        data = codec.encode(reply)
+        self.send(data)
+
+        return data
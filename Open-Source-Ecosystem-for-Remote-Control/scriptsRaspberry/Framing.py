@@ -0,0 +1,244 @@
+#
+#   Copyright 2021  Adriano Cofrancesco
+#   Open-Source-Ecosystem-for-Remote-Control is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#   Open-Source-Ecosystem-for-Remote-Control is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+import selectors
+import socket
+import struct
+import time
+
+# every frame is a 4 bytes big endian payload length followed by the payload. Lengths
+# stay below 2**24 so the first header byte is always 0, which is how framed peers are
+# told apart: a frame of 2**24 bytes would start with 0x01 and pass for unframed
+frame_header = struct.Struct('>I')
+MAX_FRAME_SIZE = 16 * 1024 * 1024 - 1
+
+
+class FrameDecoder:
+
+    def __init__(self, buffer_size=65536, max_frame_size=MAX_FRAME_SIZE):
+        self.max_frame_size = max_frame_size
+        self.buffer = bytearray(buffer_size)
+        self.view = memoryview(self.buffer)
+        self.start = 0
+        self.end = 0
+
+    def pending(self):
+        return self.end - self.start
+
+    # bytes still missing to complete the frame at the head of the buffer
+    def missing(self):
+        pending = self.pending()
+        if pending < frame_header.size:
+            return frame_header.size - pending
+        length = frame_header.unpack_from(self.buffer, self.start)[0]
+        return max(frame_header.size + length - pending, 1)
+
+    # free space to receive into, with room for at least min_size bytes
+    def writable(self, min_size=1):
+        if len(self.buffer) - self.end < min_size:
+            pending = self.pending()
+            if len(self.buffer) - pending >= min_size:
+                # compact in place, the buffer is reused
+                self.buffer[:pending] = self.buffer[self.start:self.end]
+            else:
+                buffer = bytearray(max(pending + min_size, 2 * len(self.buffer)))
+                buffer[:pending] = self.view[self.start:self.end]
+                self.view.release()
+                self.buffer = buffer
+                self.view = memoryview(self.buffer)
+            self.start = 0
+            self.end = pending
+
+        return self.view[self.end:]
+
+    def advance(self, size):
+        self.end += size
+
+    def feed(self, data):
+        size = len(data)
+        self.writable(size)[:size] = data
+        self.end += size
+
+    # next complete payload, None if more bytes are needed
+    def next_frame(self):
+        if self.pending() < frame_header.size:
+            return None
+
+        length = frame_header.unpack_from(self.buffer, self.start)[0]
+        if length > self.max_frame_size:
+            raise ValueError("Frame too large: {} bytes".format(length))
+        if self.pending() < frame_header.size + length:
+            return None
+
+        begin = self.start + frame_header.size
+        frame = bytes(self.view[begin:begin + length])
+        self.start = begin + length
+        if self.start == self.end:
+            self.start = self.end = 0
+
+        return frame
+
+    # raw bytes received so far, used by peers that do not frame their messages
+    def take_all(self):
+        data = bytes(self.view[self.start:self.end])
+        self.start = self.end = 0
+        return data
+
+
+def check_frame_size(payload):
+    if len(payload) > MAX_FRAME_SIZE:
+        raise ValueError("Frame too large: {} bytes".format(len(payload)))
+
+
+def send_frame(sock, payload):
+    check_frame_size(payload)
+    header = frame_header.pack(len(payload))
+    if not hasattr(sock, 'sendmsg') or len(payload) < 4096:
+        sock.sendall(header + payload)
+        return
+
+    # scatter/gather send, the payload is never copied into a bigger buffer
+    buffers = [memoryview(header), memoryview(payload)]
+    while buffers:
+        sent = sock.sendmsg(buffers)
+        while buffers and sent >= len(buffers[0]):
+            sent -= len(buffers[0])
+            buffers.pop(0)
+        if buffers:
+            buffers[0] = buffers[0][sent:]
+
+
+class MessageStream:
+
+    # framed=True/False forces the wire format, framed=None detects it from the first
+    # message received: a frame always starts with a 0 byte, yaml text never does.
+    # idle_timeout is the time a whole message may take before socket.timeout is raised
+    def __init__(self, sock, framed=None, socket_buffer=1024, idle_timeout=None):
+        self.sock = sock
+        self.framed = framed
+        self.socket_buffer = socket_buffer
+        self.idle_timeout = idle_timeout
+        self.decoder = FrameDecoder()
+        self.selector = None
+
+    # sleep in the kernel until the socket is readable or the deadline expires
+    def wait_readable(self, deadline):
+        if deadline is None:
+            return
+        # TLS and WebSocket transports may hold bytes the kernel no longer sees
+        pending = getattr(self.sock, 'pending', None)
+        if pending is not None and pending():
+            return
+
+        if self.selector is None:
+            self.selector = selectors.DefaultSelector()
+            self.selector.register(self.sock, selectors.EVENT_READ)
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or not self.selector.select(remaining):
+            raise socket.timeout("idle for more than {} s".format(self.idle_timeout))
+
+    def send(self, payload):
+        if self.framed:
+            send_frame(self.sock, payload)
+        else:
+            self.sock.sendall(payload)
+
+    # one whole message, b'' when the peer closed the connection
+    def recv(self):
+        deadline = None
+        if self.idle_timeout is not None:
+            deadline = time.monotonic() + self.idle_timeout
+
+        while True:
+            if self.framed:
+                frame = self.decoder.next_frame()
+                if frame is not None:
+                    return frame
+            elif self.framed is False and self.decoder.pending():
+                return self.decoder.take_all()
+
+            size = self.decoder.missing() if self.framed else self.socket_buffer
+            self.wait_readable(deadline)
+            received = self.sock.recv_into(self.decoder.writable(size))
+            if not received:
+                return b''
+            self.decoder.advance(received)
+
+            if self.framed is None:
+                self.framed = self.decoder.buffer[self.decoder.start] == 0
+                print("Peer {} framing".format("uses" if self.framed else "does not use"))
+
+    # unframed peers that answer once and then close the connection: all they sent,
+    # a single read would cut replies longer than socket_buffer
+    def recv_until_closed(self):
+        deadline = None
+        if self.idle_timeout is not None:
+            deadline = time.monotonic() + self.idle_timeout
+
+        while True:
+            self.wait_readable(deadline)
+            received = self.sock.recv_into(self.decoder.writable(self.socket_buffer))
+            if not received:
+                return self.decoder.take_all()
+            self.decoder.advance(received)
+            if self.decoder.pending() > MAX_FRAME_SIZE:
+                raise ValueError("Message too large: {} bytes".format(self.decoder.pending()))
+
+    def close(self):
+        if self.selector is not None:
+            self.selector.close()
+            self.selector = None
+
+
+class AsyncMessageStream:
+
+    # asyncio counterpart of MessageStream over a StreamReader/StreamWriter pair
+    def __init__(self, reader, writer, framed=None, socket_buffer=1024):
+        self.reader = reader
+        self.writer = writer
+        self.framed = framed
+        self.socket_buffer = socket_buffer
+        self.decoder = FrameDecoder()
+
+    async def send(self, payload):
+        # header and payload leave in one write, asyncio does not disable Nagle on sockets
+        # created with proto 0 and a lone header would wait for the peer's delayed ack
+        if self.framed:
+            check_frame_size(payload)
+            self.writer.writelines((frame_header.pack(len(payload)), payload))
+        else:
+            self.writer.write(payload)
+        await self.writer.drain()
+
+    async def recv(self):
+        while True:
+            if self.framed:
+                frame = self.decoder.next_frame()
+                if frame is not None:
+                    return frame
+            elif self.framed is False and self.decoder.pending():
+                return self.decoder.take_all()
+
+            size = self.decoder.missing() if self.framed else self.socket_buffer
+            data = await self.reader.read(max(size, self.socket_buffer))
+            if not data:
+                return b''
+            self.decoder.feed(data)
+
+            if self.framed is None:
+                self.framed = data[0] == 0
+
+    def close(self):
+        self.writer.close()
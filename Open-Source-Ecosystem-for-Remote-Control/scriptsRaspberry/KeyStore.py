@@ -0,0 +1,103 @@
+#
+#   Copyright 2021  Adriano Cofrancesco
+#   Open-Source-Ecosystem-for-Remote-Control is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#   Open-Source-Ecosystem-for-Remote-Control is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+import os
+import queue
+import threading
+import time
+
+from StartupProfile import lazy_import
+
+# pycryptodome is imported when the first key is loaded or generated
+RSA = lazy_import('Cryptodome.PublicKey.RSA')
+
+identityKeyFileName = 'identity_key.pem'
+
+
+class KeyStore:
+
+    # pool_size 0 uses a persistent identity key, a positive pool_size hands out
+    # fresh keys generated ahead of time by a background thread
+    def __init__(self, key_file=None, key_size=2048, pool_size=0):
+        if key_file is None:
+            # next to the scripts, so the key is found whatever the working directory is
+            key_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), identityKeyFileName)
+        self.key_file = key_file
+        self.key_size = key_size
+        self.pool_size = pool_size
+
+        self.identity = None
+        self.pool = queue.Queue(maxsize=max(pool_size, 1))
+        self.refill_event = threading.Event()
+        self.refill_thread = None
+
+        # time spent by the last get_key() call, in seconds
+        self.last_key_time = 0.0
+
+    def get_key(self):
+        start = time.perf_counter()
+        if self.pool_size > 0:
+            key = self.ephemeral_key()
+        else:
+            key = self.identity_key()
+        self.last_key_time = time.perf_counter() - start
+
+        return key
+
+    # load the identity key from disk, generate and store it on first use
+    def identity_key(self):
+        if self.identity is not None:
+            return self.identity
+
+        try:
+            with open(self.key_file, 'rb') as file:
+                self.identity = RSA.import_key(file.read())
+            print("Identity key loaded from {}".format(self.key_file))
+        except FileNotFoundError:
+            self.identity = RSA.generate(self.key_size)
+            self.save_key(self.identity)
+            print("Identity key generated in {}".format(self.key_file))
+
+        return self.identity
+
+    def save_key(self, key):
+        # private key readable by the owner only
+        fd = os.open(self.key_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'wb') as file:
+            file.write(key.export_key())
+
+    def ephemeral_key(self):
+        self.start_pool()
+        try:
+            key = self.pool.get_nowait()
+        except queue.Empty:
+            # pool drained, pay the generation cost inline
+            key = RSA.generate(self.key_size)
+        self.refill_event.set()
+
+        return key
+
+    def start_pool(self):
+        if self.refill_thread is not None:
+            return
+
+        self.refill_thread = threading.Thread(target=self.refill, daemon=True)
+        self.refill_thread.start()
+
+    def refill(self):
+        while True:
+            while not self.pool.full():
+                self.pool.put(RSA.generate(self.key_size))
+            self.refill_event.wait()
+            self.refill_event.clear()
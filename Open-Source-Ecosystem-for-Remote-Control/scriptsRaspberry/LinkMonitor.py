@@ -0,0 +1,141 @@
+#
+#   Copyright 2021  Adriano Cofrancesco
+#   Open-Source-Ecosystem-for-Remote-Control is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#   Open-Source-Ecosystem-for-Remote-Control is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+import errno
+import socket
+import struct
+import threading
+
+# rtnetlink constants, see linux/rtnetlink.h and linux/if_link.h
+RTMGRP_LINK = 1
+RTM_NEWLINK = 16
+RTM_DELLINK = 17
+IFLA_IFNAME = 3
+IFF_LOWER_UP = 1 << 16
+
+nlmsghdr = struct.Struct('=IHHII')
+ifinfomsg = struct.Struct('=BxHiII')
+rtattr = struct.Struct('=HH')
+
+
+# carrier state of a network interface.
+# is_up() reads /sys/class/net/<interface>/carrier directly; once start() has subscribed
+# to rtnetlink link events the state is kept up to date by the kernel notifications and
+# on_change is called as soon as the carrier changes.
+class LinkMonitor:
+
+    def __init__(self, interface='eth0', use_netlink=True):
+        self.interface = interface
+        self.carrier_path = '/sys/class/net/{}/carrier'.format(interface)
+        self.use_netlink = use_netlink
+
+        self.socket = None
+        self.carrier = None
+        # called with the new carrier state (True/False)
+        self.on_change = None
+
+    # True/False, None when the interface does not exist
+    def read_carrier(self):
+        try:
+            with open(self.carrier_path) as file:
+                return file.read().strip() == '1'
+        except FileNotFoundError:
+            return None
+        except OSError:
+            # administratively down interfaces answer EINVAL
+            return False
+
+    def is_up(self):
+        if self.socket is not None:
+            return self.carrier
+        return self.read_carrier()
+
+    def start(self):
+        if not self.use_netlink or self.socket is not None:
+            return False
+
+        try:
+            sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+            sock.bind((0, RTMGRP_LINK))
+        except (AttributeError, OSError) as error:
+            print("Link events unavailable, reading {}: {}".format(self.carrier_path, error))
+            return False
+
+        # subscribe first, then read the current state, so no change is missed
+        self.carrier = self.read_carrier()
+        self.socket = sock
+        threading.Thread(target=self.listen, args=(sock,), daemon=True).start()
+
+        return True
+
+    def listen(self, sock):
+        while True:
+            try:
+                data = sock.recv(65536)
+            except OSError as error:
+                if error.errno == errno.ENOBUFS:
+                    # the kernel dropped events, read the state they were about
+                    self.update(self.read_carrier())
+                    continue
+                break
+
+            for name, carrier in self.parse(data):
+                if name == self.interface:
+                    self.update(carrier)
+
+        # without events the cached state goes stale, is_up() reads sysfs again
+        if self.socket is sock:
+            print("Link events lost, reading {}".format(self.carrier_path))
+            self.socket = None
+            sock.close()
+
+    # (interface name, carrier) for every link message of a netlink datagram
+    @staticmethod
+    def parse(data):
+        offset = 0
+        while offset + nlmsghdr.size <= len(data):
+            length, msg_type, flags, seq, pid = nlmsghdr.unpack_from(data, offset)
+            if length < nlmsghdr.size:
+                break
+
+            if msg_type in (RTM_NEWLINK, RTM_DELLINK):
+                body = offset + nlmsghdr.size
+                family, if_type, index, if_flags, change = ifinfomsg.unpack_from(data, body)
+                carrier = msg_type == RTM_NEWLINK and bool(if_flags & IFF_LOWER_UP)
+
+                attribute = body + ifinfomsg.size
+                while attribute + rtattr.size <= offset + length:
+                    attr_length, attr_type = rtattr.unpack_from(data, attribute)
+                    if attr_length < rtattr.size:
+                        break
+                    if attr_type == IFLA_IFNAME:
+                        name = data[attribute + rtattr.size:attribute + attr_length].split(b'\0', 1)[0]
+                        yield name.decode(), carrier
+                        break
+                    attribute += (attr_length + 3) & ~3
+
+            offset += (length + 3) & ~3
+
+    def update(self, carrier):
+        changed = carrier != self.carrier
+        self.carrier = carrier
+        if changed:
+            print("Link {} {}".format(self.interface, "UP" if carrier else "DOWN"))
+            if self.on_change is not None:
+                self.on_change(carrier)
+
+    def close(self):
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
@@ -0,0 +1,196 @@
+#
+#   Copyright 2021  Adriano Cofrancesco
+#   Open-Source-Ecosystem-for-Remote-Control is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#   Open-Source-Ecosystem-for-Remote-Control is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+import struct
+
+from StartupProfile import lazy_import
+
+yaml = lazy_import('yaml')
+
+
+class YamlCodec:
+    name = 'yaml'
+
+    def __init__(self):
+        self.loader = None
+        self.dumper = None
+
+    # yaml is imported with the first yaml message
+    def load_yaml(self):
+        # libyaml bindings, much faster than the pure Python loader when available. Messages
+        # come from the network, the safe loader never builds python objects from tags
+        self.loader = getattr(yaml, 'CSafeLoader', None) or yaml.SafeLoader
+        self.dumper = getattr(yaml, 'CDumper', None) or yaml.Dumper
+
+    def encode(self, message):
+        if self.dumper is None:
+            self.load_yaml()
+        return yaml.dump(message, Dumper=self.dumper).encode('utf-8')
+
+    def decode(self, data):
+        if self.loader is None:
+            self.load_yaml()
+        return yaml.load(bytes(data).decode('utf-8'), Loader=self.loader)
+
+
+class BinaryCodec:
+    name = 'binary'
+
+    # 0xB1 can never start a utf-8 text, so binary messages are told apart from yaml
+    magic = b'\xb1\x01'
+
+    u8 = struct.Struct('>B')
+    u32 = struct.Struct('>I')
+    i32 = struct.Struct('>i')
+    i64 = struct.Struct('>q')
+    f64 = struct.Struct('>d')
+
+    # sized values use the lowercase tag with a 1 byte size below 256,
+    # the uppercase tag with a 4 bytes size otherwise
+    def encode(self, message):
+        out = bytearray(self.magic)
+        self.encode_value(out, message)
+        return bytes(out)
+
+    def encode_size(self, out, tag, size):
+        if size < 256:
+            out += tag
+            out += self.u8.pack(size)
+        else:
+            out += tag.upper()
+            out += self.u32.pack(size)
+
+    def encode_value(self, out, value):
+        if value is None:
+            out += b'N'
+        elif value is True:
+            out += b'T'
+        elif value is False:
+            out += b'F'
+        elif isinstance(value, int):
+            if -2 ** 31 <= value < 2 ** 31:
+                out += b'i'
+                out += self.i32.pack(value)
+            else:
+                out += b'q'
+                out += self.i64.pack(value)
+        elif isinstance(value, float):
+            out += b'd'
+            out += self.f64.pack(value)
+        elif isinstance(value, str):
+            raw = value.encode('utf-8')
+            self.encode_size(out, b's', len(raw))
+            out += raw
+        elif isinstance(value, (bytes, bytearray, memoryview)):
+            self.encode_size(out, b'b', len(value))
+            out += value
+        elif isinstance(value, (list, tuple)):
+            self.encode_size(out, b'l', len(value))
+            for item in value:
+                self.encode_value(out, item)
+        elif isinstance(value, dict):
+            self.encode_size(out, b'm', len(value))
+            for key, item in value.items():
+                self.encode_value(out, key)
+                self.encode_value(out, item)
+        else:
+            raise TypeError("Unsupported type for binary codec: {}".format(type(value).__name__))
+
+    def decode(self, data):
+        view = memoryview(data)
+        if bytes(view[:len(self.magic)]) != self.magic:
+            raise ValueError("Not a binary message")
+
+        try:
+            value, offset = self.decode_value(view, len(self.magic))
+        except (IndexError, struct.error):
+            raise ValueError("Truncated binary message")
+        if offset != len(view):
+            raise ValueError("Trailing bytes in binary message")
+
+        return value
+
+    def decode_value(self, view, offset):
+        tag = chr(view[offset])
+        offset += 1
+
+        if tag == 'N':
+            return None, offset
+        if tag == 'T':
+            return True, offset
+        if tag == 'F':
+            return False, offset
+        if tag == 'i':
+            return self.i32.unpack_from(view, offset)[0], offset + self.i32.size
+        if tag == 'q':
+            return self.i64.unpack_from(view, offset)[0], offset + self.i64.size
+        if tag == 'd':
+            return self.f64.unpack_from(view, offset)[0], offset + self.f64.size
+
+        if tag.islower():
+            size = view[offset]
+            offset += 1
+        else:
+            size = self.u32.unpack_from(view, offset)[0]
+            offset += self.u32.size
+        tag = tag.lower()
+
+        if tag in ('s', 'b'):
+            raw = bytes(view[offset:offset + size])
+            if len(raw) != size:
+                raise ValueError("Truncated binary message")
+            return (raw.decode('utf-8') if tag == 's' else raw), offset + size
+        if tag == 'l':
+            items = []
+            for _ in range(size):
+                item, offset = self.decode_value(view, offset)
+                items.append(item)
+            return items, offset
+        if tag == 'm':
+            items = {}
+            for _ in range(size):
+                key, offset = self.decode_value(view, offset)
+                items[key], offset = self.decode_value(view, offset)
+            return items, offset
+
+        raise ValueError("Unknown binary tag: {}".format(tag))
+
+
+YAML = YamlCodec()
+BINARY = BinaryCodec()
+
+codecs = {YAML.name: YAML, BINARY.name: BINARY}
+
+# offered to the peer in the first message, most preferred first
+supported_codecs = [BINARY.name, YAML.name]
+
+
+# codec used by a received message, yaml for anything that is not binary
+def detect_codec(data):
+    if bytes(data[:len(BINARY.magic)]) == BINARY.magic:
+        return BINARY
+    return YAML
+
+
+def decode_message(data):
+    return detect_codec(data).decode(data)
+
+
+# pick the first codec we prefer among the ones offered by the peer, old peers
+# offer nothing and keep yaml
+def negotiate_codec(offered):
+    for name in supported_codecs:
+        if offered and name in offered:
+            return codecs[name]
+    return YAML
@@ -0,0 +1,58 @@
+#
+#   Copyright 2021  Adriano Cofrancesco
+#   Open-Source-Ecosystem-for-Remote-Control is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#   Open-Source-Ecosystem-for-Remote-Control is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+# Pipelined data path: the operator keeps many commands in flight, the device runs
+# them on the serial port in order and tags every reply with the request id of its
+# command. Negotiated in the handshake like the session mode, the server offers
+# 'pipeline': [PIPELINE_MODE] and the device answers 'pipeline': PIPELINE_MODE.
+# The tags are encrypted with the payload, the relay never sees them.
+# The streaming mode goes on top of it, offered with 'stream': [STREAM_MODE]: commands
+# are only written to the serial port and acknowledged with an empty reply, all the
+# device output, solicited or not, comes in REPLY_STREAM replies without a request id.
+
+import struct
+
+PIPELINE_MODE = 'tagged'
+STREAM_MODE = 'coalesced'
+
+# a request is its id and the command, a reply adds a status byte before the
+# serial reply, or before the error message when the command failed
+request_header = struct.Struct('>I')
+reply_header = struct.Struct('>IB')
+MAX_REQUEST_ID = 0xffffffff
+
+REPLY_OK = 0
+REPLY_ERROR = 1
+REPLY_STREAM = 2
+
+
+def pack_request(request_id, data):
+    return request_header.pack(request_id) + data
+
+
+def unpack_request(message):
+    if len(message) < request_header.size:
+        raise ValueError("Pipelined request too short")
+    return request_header.unpack_from(message)[0], message[request_header.size:]
+
+
+def pack_reply(request_id, status, data):
+    return reply_header.pack(request_id, status) + data
+
+
+def unpack_reply(message):
+    if len(message) < reply_header.size:
+        raise ValueError("Pipelined reply too short")
+    request_id, status = reply_header.unpack_from(message)
+    return request_id, status, message[reply_header.size:]
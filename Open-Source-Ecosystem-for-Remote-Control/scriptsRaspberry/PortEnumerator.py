@@ -0,0 +1,206 @@
+#
+#   Copyright 2021  Adriano Cofrancesco
+#   Open-Source-Ecosystem-for-Remote-Control is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#   Open-Source-Ecosystem-for-Remote-Control is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+import glob
+import os
+import socket
+import sys
+import threading
+import time
+
+from StartupProfile import lazy_import
+
+# only the fallback probe of other platforms opens ports
+serial = lazy_import('serial')
+
+NETLINK_KOBJECT_UEVENT = 15
+# uevents of the tty devices, what udev would see on hotplug
+ueventTTY = b'SUBSYSTEM=tty'
+
+
+def read_attribute(path, name):
+    try:
+        with open(os.path.join(path, name)) as file:
+            return file.read().strip()
+    except OSError:
+        return None
+
+
+# serial ports of the machine, with driver and USB metadata read from sysfs.
+# The list is cached: kernel uevents for the tty subsystem invalidate it, without them
+# the cache expires after max_age seconds. No port is opened to build the list.
+class PortEnumerator:
+
+    def __init__(self, sysfs_path='/sys/class/tty', dev_path='/dev'):
+        self.sysfs_path = sysfs_path
+        self.dev_path = dev_path
+        # /sys/devices next to /sys/class/tty, USB metadata is searched below it
+        self.devices_path = os.path.realpath(os.path.join(sysfs_path, '..', '..', 'devices'))
+        self.max_age = 5
+
+        self.ports = None
+        self.cached_at = 0.0
+        # bumped by every uevent, a scan that overlapped one is not cached
+        self.generation = 0
+        self.socket = None
+
+    # subscribe to hotplug events, the cache then lives until a tty appears or disappears
+    def start(self):
+        if self.socket is not None or not sys.platform.startswith('linux'):
+            return False
+
+        try:
+            sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_KOBJECT_UEVENT)
+            sock.bind((0, 1))
+        except OSError as error:
+            print("Hotplug events unavailable: {}".format(error))
+            return False
+
+        self.socket = sock
+        threading.Thread(target=self.listen, args=(sock,), daemon=True).start()
+
+        return True
+
+    def listen(self, sock):
+        while True:
+            try:
+                data = sock.recv(65536)
+            except OSError:
+                break
+
+            if ueventTTY in data.split(b'\0'):
+                self.invalidate()
+
+        # without events the cache expires after max_age again
+        if self.socket is sock:
+            self.socket = None
+            sock.close()
+            self.invalidate()
+
+    def invalidate(self):
+        self.generation += 1
+        self.ports = None
+
+    def list_ports(self):
+        ports = self.ports
+        if ports is not None and (self.socket is not None or time.monotonic() - self.cached_at < self.max_age):
+            return ports
+
+        generation = self.generation
+        if sys.platform.startswith('linux') and os.path.isdir(self.sysfs_path):
+            ports = self.scan_sysfs()
+        else:
+            ports = self.probe()
+
+        # a port plugged or removed during the scan may be missing from this list
+        if self.generation == generation:
+            self.ports = ports
+            self.cached_at = time.monotonic()
+
+        return ports
+
+    def port_names(self):
+        return [port['port'] for port in self.list_ports()]
+
+    def scan_sysfs(self):
+        ports = []
+        for name in sorted(os.listdir(self.sysfs_path)):
+            tty_path = os.path.join(self.sysfs_path, name)
+            device_link = os.path.join(tty_path, 'device')
+            # virtual terminals, ptys and the console have no device behind them
+            if not os.path.exists(device_link):
+                continue
+
+            device = os.path.realpath(device_link)
+            if '/virtual/' in device:
+                continue
+
+            # 8250 ports without a UART report type 0
+            if read_attribute(tty_path, 'type') == '0':
+                continue
+
+            port = os.path.join(self.dev_path, name)
+            if not os.path.exists(port):
+                continue
+
+            ports.append(self.describe(port, device))
+
+        return ports
+
+    def describe(self, port, device):
+        driver = self.driver(device)
+        if driver == 'port':
+            # serial-base port device (Linux 6.5+), the driver is on its parent
+            device = os.path.dirname(os.path.dirname(device))
+            driver = self.driver(device)
+
+        info = {
+            'port': port,
+            'driver': driver,
+            'subsystem': os.path.basename(os.path.realpath(os.path.join(device, 'subsystem'))),
+            'vid': None,
+            'pid': None,
+            'serial': None,
+            'manufacturer': None,
+            'product': None,
+        }
+
+        # USB adapters: the usb_device directory is an ancestor of the interface
+        path = device
+        while path.startswith(self.devices_path + os.sep):
+            if os.path.exists(os.path.join(path, 'idVendor')):
+                info['vid'] = read_attribute(path, 'idVendor')
+                info['pid'] = read_attribute(path, 'idProduct')
+                info['serial'] = read_attribute(path, 'serial')
+                info['manufacturer'] = read_attribute(path, 'manufacturer')
+                info['product'] = read_attribute(path, 'product')
+                break
+            path = os.path.dirname(path)
+
+        return info
+
+    @staticmethod
+    def driver(device):
+        driver_link = os.path.join(device, 'driver')
+        if not os.path.exists(driver_link):
+            return None
+        return os.path.basename(os.path.realpath(driver_link))
+
+    # other platforms: try to open every candidate like the agents used to
+    def probe(self):
+        if sys.platform.startswith('win'):
+            candidates = ['COM%s' % (i + 1) for i in range(256)]
+        elif sys.platform.startswith('linux') or sys.platform.startswith('cygwin'):
+            # this excludes your current terminal "/dev/tty"
+            candidates = glob.glob('/dev/tty[0-9A-Za-z]*')
+        elif sys.platform.startswith('darwin'):
+            candidates = glob.glob('/dev/tty.*')
+        else:
+            raise EnvironmentError('Unsupported platform')
+
+        ports = []
+        for candidate in candidates:
+            try:
+                ser = serial.Serial(candidate)
+                ser.close()
+                ports.append({'port': candidate})
+            except (OSError, serial.SerialException):
+                pass
+
+        return ports
+
+    def close(self):
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
@@ -1,115 +1,216 @@
-#
-#   Copyright 2021  Adriano Cofrancesco
-#   Open-Source-Ecosystem-for-Remote-Control is free software: you can redistribute it and/or modify
-#   it under the terms of the GNU General Public License as published by
-#   the Free Software Foundation, either version 3 of the License, or
-#   (at your option) any later version.
-#   Open-Source-Ecosystem-for-Remote-Control is distributed in the hope that it will be useful,
-#
-#   Copyright 2021  Adriano Cofrancesco
-#   Open-Source-Ecosystem-for-Remote-Control is free software: you can redistribute it and/or modify
-#   it under the terms of the GNU General Public License as published by
-#   the Free Software Foundation, either version 3 of the License, or
-#   (at your option) any later version.
-#   Open-Source-Ecosystem-for-Remote-Control is distributed in the hope that it will be useful,
-#   but WITHOUT ANY WARRANTY; without even the implied warranty of
-#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
-#   GNU General Public License for more details.
-#   You should have received a copy of the GNU General Public License
-#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
-#
-
-import socket
-import serial
-import time
-import os
-import sys
-import subprocess
-
-
-class ServerTCP:
-
-    def __init__(self, host='0.0.0.0', port=65001, com_port='/dev/null', max_clients=3):
-        self.host = host
-        self.port = port
-        self.com_port = com_port
-        self.timeout = 60
-        self.counter_limit = 10
-        self.socket_buffer = 1024
-        self.time_sleep = 0.5
-
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.socket.bind((host, port))
-        self.socket.listen(max_clients)
-        self.socket.settimeout(self.timeout)
-
-    def run(self):
-
-        print("Server {} listening on port {}".format(self.host, self.port))
-        try:
-            while True:
-                # accept client connection
-                conn, addr = self.socket.accept()
-                with conn:
-                    print("Connected by: {}".format(addr))
-                    counter = 0
-                    while True:
-                        # receive data from client
-                        try:
-                            data = conn.recv(self.socket_buffer)
-                            print("Received from Client {}: {}".format(addr, data))
-                        except Exception as error:
-                            print("Server recv error: {}".format(error))
-                            break
-
-                        try:
-                            if data:
-                                try:
-                                    ser = serial.Serial(self.com_port, timeout=10)
-                                    print(ser.name)  # check which port was really used
-                                    ser.write(data + b'\n')  # write a string
-
-                                    print("Data sent to serial port")
-                                    s = ser.readline()
-                                    print("Received from serial port: ", s.decode())
-                                    ser.close()
-
-                                    conn.sendall(s)
-                                except Exception as e:
-                                    print("Error: {}".format(e))
-                            else:
-                                counter += 1
-                                print("waiting...")
-                                time.sleep(self.time_sleep)
-                                if counter > self.counter_limit:
-                                    print("Closing connection with Client: {}".format(addr))
-                                    conn.close()
-                                    break
-                        except Exception as e:
-                            print("Error: {}".format(e))
-                            conn.close()
-                            break
-
-        except socket.timeout:
-            print("Closing Server")
-            self.socket.close()
-        except Exception as e:
-            print("Error: {}".format(e))
-            self.socket.close()
-
-
-if __name__ == '__main__':
-    com_port = "/dev/null"
-    wireguard_conf_file_path = "wg0"
-    if len(sys.argv) > 2:
-        com_port = sys.argv[1]
-        wireguard_conf_file_path = sys.argv[2]
-    server = ServerTCP('0.0.0.0', 65001, com_port)
-    server.run()
-
-    wg_down_cmd = subprocess.Popen(["sudo", "wg-quick", "down", wireguard_conf_file_path], stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
-    wg_down_stdout, stderr = wg_down_cmd.communicate()
-
-    os.remove(wireguard_conf_file_path)
-    print("DONE")
+#
+#   Copyright 2021  Adriano Cofrancesco
+#   Open-Source-Ecosystem-for-Remote-Control is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#   Open-Source-Ecosystem-for-Remote-Control is distributed in the hope that it will be useful,
+#
+#   Copyright 2021  Adriano Cofrancesco
+#   Open-Source-Ecosystem-for-Remote-Control is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#   Open-Source-Ecosystem-for-Remote-Control is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+from StartupProfile import lazy_import, startup_profile
+
+# first, so --profile-startup times every import below
+profile = startup_profile()
+
+import socket
+import os
+import sys
+
+from Endpoint import listen_socket, peer_host
+from Framing import MessageStream, AsyncMessageStream
+from SerialSession import SerialSession
+from ServiceStatus import StatusReporter
+
+# only the --async server needs these
+asyncio = lazy_import('asyncio')
+futures = lazy_import('concurrent.futures')
+# used once the server has stopped
+subprocess = lazy_import('subprocess')
+
+
+class ServerTCP:
+
+    def __init__(self, host='0.0.0.0', port=65001, com_port='/dev/null', max_clients=3):
+        self.host = host
+        self.port = port
+        self.com_port = com_port
+        self.timeout = 60
+        self.idle_timeout = 120
+        self.socket_buffer = 1024
+        self.serial_timeout = 10
+
+        # asyncio mode: all clients share one serial session arbitrated by a lock,
+        # set shared_serial to False to give every client its own session
+        self.shared_serial = True
+        self.async_backlog = 128
+        self.serial_workers = 4
+        # state changes pushed to ClientTCPWireguard, which relays them to the GUI
+        self.status = StatusReporter('ServerTCP')
+
+        # host may be a unix:/path endpoint for a hop on the same machine
+        self.socket = listen_socket(host, port, max_clients)
+        self.socket.settimeout(self.timeout)
+
+    def run(self):
+
+        print("Server {} listening on port {}".format(self.host, self.port))
+        profile.report('listening')
+        self.status.report('started', comPort=self.com_port)
+        try:
+            while True:
+                # accept client connection
+                conn, addr = self.socket.accept()
+                # serial port stays open for the whole TCP session
+                with conn, self.status.watch(SerialSession(self.com_port, self.serial_timeout)) as session:
+                    print("Connected by: {}".format(addr))
+                    self.status.report('connected', client=peer_host(addr))
+                    stream = MessageStream(conn, socket_buffer=self.socket_buffer, idle_timeout=self.idle_timeout)
+                    while True:
+                        # receive data from client
+                        try:
+                            data = stream.recv()
+                            print("Received from Client {}: {}".format(addr, data))
+                        except Exception as error:
+                            print("Server recv error: {}".format(error))
+                            break
+
+                        try:
+                            if data:
+                                try:
+                                    s = session.transact(data)
+                                    self.status.traffic(len(data), len(s))
+                                    print("Received from serial port: ", s.decode())
+
+                                    stream.send(s)
+                                except Exception as e:
+                                    print("Error: {}".format(e))
+                            else:
+                                # empty read: the client closed the connection
+                                print("Closing connection with Client: {}".format(addr))
+                                break
+                        except Exception as e:
+                            print("Error: {}".format(e))
+                            conn.close()
+                            break
+
+                    stream.close()
+
+        except socket.timeout:
+            print("Closing Server")
+            self.socket.close()
+        except Exception as e:
+            print("Error: {}".format(e))
+            self.socket.close()
+
+    # serve many clients concurrently on one event loop, serial I/O runs on a small
+    # shared thread pool instead of one thread per connection
+    def run_async(self):
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            print("Closing Server")
+
+    async def serve(self):
+        self.executor = futures.ThreadPoolExecutor(max_workers=self.serial_workers)
+        self.shared_session = self.status.watch(SerialSession(self.com_port, self.serial_timeout))
+        self.serial_lock = asyncio.Lock()
+
+        self.socket.listen(self.async_backlog)
+        server = await asyncio.start_server(self.handle_client, sock=self.socket)
+        print("Async server {} listening on port {}".format(self.host, self.port))
+        profile.report('listening')
+        self.status.report('started', comPort=self.com_port)
+
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.shared_session.close()
+            self.executor.shutdown(wait=False)
+
+    async def handle_client(self, reader, writer):
+        addr = writer.get_extra_info('peername')
+        print("Connected by: {}".format(addr))
+        self.status.report('connected', client=peer_host(addr))
+        stream = AsyncMessageStream(reader, writer, socket_buffer=self.socket_buffer)
+        loop = asyncio.get_running_loop()
+
+        if self.shared_serial:
+            session = self.shared_session
+            lock = self.serial_lock
+        else:
+            session = self.status.watch(SerialSession(self.com_port, self.serial_timeout))
+            lock = asyncio.Lock()
+
+        try:
+            while True:
+                try:
+                    data = await asyncio.wait_for(stream.recv(), self.idle_timeout)
+                except asyncio.TimeoutError:
+                    print("Client {} idle, closing connection".format(addr))
+                    break
+
+                if not data:
+                    break
+                print("Received from Client {}: {}".format(addr, data))
+
+                try:
+                    async with lock:
+                        s = await loop.run_in_executor(self.executor, session.transact, data)
+                    self.status.traffic(len(data), len(s))
+                    print("Received from serial port: ", s.decode())
+
+                    await stream.send(s)
+                except (OSError, ConnectionError) as e:
+                    print("Error: {}".format(e))
+                    if writer.is_closing():
+                        break
+        except Exception as e:
+            print("Error: {}".format(e))
+        finally:
+            print("Closing connection with Client: {}".format(addr))
+            if not self.shared_serial:
+                await loop.run_in_executor(self.executor, session.close)
+            stream.close()
+
+
+if __name__ == '__main__':
+    profile.mark('imports')
+    com_port = "/dev/null"
+    wireguard_conf_file_path = "wg0"
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    if len(args) > 1:
+        com_port = args[0]
+        wireguard_conf_file_path = args[1]
+    # --listen=unix:/run/remote/serial.sock for a client on the same machine
+    host = '0.0.0.0'
+    for arg in sys.argv[1:]:
+        if arg.startswith('--listen='):
+            host = arg.split('=', 1)[1]
+    server = ServerTCP(host, 65001, com_port)
+    profile.mark('init')
+    try:
+        if '--async' in sys.argv:
+            server.run_async()
+        else:
+            server.run()
+    finally:
+        server.status.close()
+
+    wg_down_cmd = subprocess.Popen(["sudo", "wg-quick", "down", wireguard_conf_file_path], stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    wg_down_stdout, stderr = wg_down_cmd.communicate()
+
+    os.remove(wireguard_conf_file_path)
+    print("DONE")
@@ -0,0 +1,161 @@
+#
+#   Copyright 2021  Adriano Cofrancesco
+#   Open-Source-Ecosystem-for-Remote-Control is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#   Open-Source-Ecosystem-for-Remote-Control is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+import os
+import select
+import socket
+import stat
+import threading
+import time
+
+from MessageCodec import BINARY, decode_message
+
+# in a directory only the agent's user can enter, other local users cannot send fake
+# reports. A service started through sudo reports to the user that ran sudo
+statusSocketPath = '/tmp/remote-control-{}/status.sock'.format(os.environ.get('SUDO_UID', os.getuid()))
+
+
+# used by the services (TCPClientRSASerialRaspberry, ServerTCP) to tell the agent what
+# they are doing: started, serial_open, serial_closed, bytes and exited.
+# Reports are datagrams on a unix socket, a service never blocks when no agent listens.
+# A service running inside the agent passes a callback instead.
+class StatusReporter:
+
+    def __init__(self, service, path=statusSocketPath, interval=1, callback=None):
+        self.service = service
+        self.path = path
+        self.callback = callback
+        # minimum time between two 'bytes' reports, in seconds
+        self.interval = interval
+
+        self.commands = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.last_traffic = 0.0
+
+        self.socket = None
+        if callback is None:
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self.socket.setblocking(False)
+
+    def report(self, state, **details):
+        message = dict(details, service=self.service, state=state, pid=os.getpid())
+        if self.callback is not None:
+            self.callback(message)
+            return
+
+        try:
+            self.socket.sendto(BINARY.encode(message), self.path)
+        except OSError:
+            pass
+
+    # report serial port open/close through the session hooks
+    def watch(self, session):
+        session.on_open = lambda s: self.report('serial_open', comPort=s.com_port)
+        session.on_close = lambda s: self.report('serial_closed', comPort=s.com_port)
+        return session
+
+    # streamed device output is counted with commands=0
+    def traffic(self, received, sent, commands=1):
+        self.commands += commands
+        self.bytes_in += received
+        self.bytes_out += sent
+
+        now = time.monotonic()
+        if now - self.last_traffic >= self.interval:
+            self.last_traffic = now
+            self.report('bytes', commands=self.commands, bytesIn=self.bytes_in, bytesOut=self.bytes_out)
+
+    def close(self):
+        self.report('exited')
+        if self.socket is not None:
+            self.socket.close()
+
+
+# used by the agent: collects the reports of the service it started and watches the
+# service process, so a crash is reported as 'exited' as well
+class StatusListener:
+
+    def __init__(self, path=statusSocketPath, callback=None):
+        self.path = path
+        self.callback = callback
+        self.state = {'state': 'idle'}
+        self.socket = None
+
+    def start(self):
+        directory = os.path.dirname(self.path)
+        try:
+            os.mkdir(directory, 0o700)
+        except FileExistsError:
+            pass
+        # /tmp is shared, the directory may have been created by someone else
+        info = os.lstat(directory)
+        if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.geteuid() or info.st_mode & 0o077:
+            raise PermissionError("{} is not a private directory".format(directory))
+
+        # socket left by a previous agent
+        if os.path.lexists(self.path):
+            os.remove(self.path)
+
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.socket.bind(self.path)
+        threading.Thread(target=self.listen, daemon=True).start()
+
+    def listen(self):
+        while True:
+            try:
+                data = self.socket.recv(65536)
+            except OSError:
+                break
+
+            # a bad datagram is dropped, the listener lives as long as the agent
+            try:
+                message = decode_message(data)
+            except Exception as error:
+                print("Status error: {}".format(error))
+                continue
+            if not isinstance(message, dict):
+                print("Status error: not a report: {!r}".format(message))
+                continue
+
+            if message.get('state') == 'started' and isinstance(message.get('pid'), int):
+                threading.Thread(target=self.watchProcess, args=(message['pid'],), daemon=True).start()
+            self.update(message)
+
+    # a new service is about to be launched, forget the previous one
+    def reset(self):
+        self.state = {'state': 'starting'}
+
+    def update(self, message):
+        self.state = message
+        if self.callback is not None:
+            self.callback(message)
+
+    def watchProcess(self, pid):
+        try:
+            # pidfd becomes readable when the process exits (Linux 5.3, Python 3.9)
+            pidfd = os.pidfd_open(pid)
+            select.select([pidfd], [], [])
+            os.close(pidfd)
+        except (AttributeError, OSError):
+            while os.path.exists('/proc/{}'.format(pid)):
+                time.sleep(1)
+
+        if self.state.get('pid') == pid and self.state.get('state') != 'exited':
+            self.update({'service': self.state.get('service'), 'state': 'exited', 'pid': pid})
+
+    def close(self):
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
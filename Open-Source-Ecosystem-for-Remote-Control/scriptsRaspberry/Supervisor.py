@@ -0,0 +1,153 @@
+#
+#   Copyright 2021  Adriano Cofrancesco
+#   Open-Source-Ecosystem-for-Remote-Control is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#   Open-Source-Ecosystem-for-Remote-Control is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+wstunnelPath = '/home/pi/Desktop/wstunnel'
+
+
+class Service:
+
+    def __init__(self, name, args, restart=False):
+        self.name = name
+        self.args = args
+        # restart when the process dies with a non-zero exit code
+        self.restart = restart
+        self.restarts = 0
+        self.process = None
+        self.stopping = False
+        self.started_at = 0.0
+
+    def pid(self):
+        return self.process.pid if self.process is not None else None
+
+    def is_running(self):
+        return self.process is not None and self.process.poll() is None
+
+
+# starts the Pi services as child processes and keeps their Popen objects, so stopping
+# and checking a service is a signal or a waitpid instead of a ps aux | grep script
+class Supervisor:
+
+    def __init__(self, base_path=None, log_path=None):
+        self.base_path = base_path or os.path.dirname(os.path.abspath(__file__))
+        self.log_path = log_path or self.base_path
+        # the shell scripts ran the services through sudo, keep that when not root
+        self.command_prefix = ['sudo'] if os.geteuid() != 0 else []
+        self.stop_timeout = 5
+        self.restart_delay = 0.5
+        self.max_restarts = 3
+
+        self.services = {}
+        self.lock = threading.Lock()
+        # called with the service and its exit code when a service ends by itself
+        self.on_exit = None
+
+    def start(self, name, args, restart=False):
+        with self.lock:
+            service = self.services.get(name)
+            if service is not None and service.is_running():
+                return service
+
+            service = Service(name, args, restart)
+            self.services[name] = service
+            self.spawn(service)
+
+        return service
+
+    # start one of the python scripts next to this module
+    def start_python(self, name, script, *args, restart=False):
+        path = os.path.join(self.base_path, script)
+        return self.start(name, [sys.executable, '-u', path] + [str(arg) for arg in args], restart)
+
+    def spawn(self, service):
+        log = open(os.path.join(self.log_path, '{}.log'.format(service.name)), 'ab')
+        with log:
+            service.process = subprocess.Popen(self.command_prefix + service.args, stdout=log, stderr=subprocess.STDOUT,
+                                               stdin=subprocess.DEVNULL, cwd=self.base_path, start_new_session=True)
+        service.started_at = time.monotonic()
+        print("Service {} started, pid {}".format(service.name, service.process.pid))
+
+        threading.Thread(target=self.wait, args=(service, service.process), daemon=True).start()
+
+    def wait(self, service, process):
+        code = process.wait()
+        if service.stopping or service.process is not process:
+            return
+
+        print("Service {} exited with code {}".format(service.name, code))
+        if service.restart and code != 0 and service.restarts < self.max_restarts:
+            time.sleep(self.restart_delay)
+            with self.lock:
+                if service.stopping or self.services.get(service.name) is not service:
+                    return
+                service.restarts += 1
+                self.spawn(service)
+            return
+
+        if self.on_exit is not None:
+            self.on_exit(service, code)
+
+    def stop(self, name):
+        with self.lock:
+            service = self.services.pop(name, None)
+        if service is None or service.process is None:
+            return None
+
+        service.stopping = True
+        process = service.process
+        if process.poll() is None:
+            self.signal(process, signal.SIGTERM)
+            try:
+                process.wait(self.stop_timeout)
+            except subprocess.TimeoutExpired:
+                self.signal(process, signal.SIGKILL)
+                process.wait()
+
+        print("Service {} stopped".format(name))
+        return process.returncode
+
+    # each service leads its own process group, signalling the group also reaches the
+    # command started by sudo and whatever the service spawned. A group we may not signal
+    # (a member changed its uid) still gets the service process itself
+    def signal(self, process, signum):
+        try:
+            os.killpg(process.pid, signum)
+        except ProcessLookupError:
+            pass
+        except PermissionError as error:
+            print("Cannot signal process group {}: {}".format(process.pid, error))
+            try:
+                process.send_signal(signum)
+            except ProcessLookupError:
+                pass
+
+    def stop_all(self):
+        for name in list(self.services):
+            self.stop(name)
+
+    def is_running(self, name):
+        service = self.services.get(name)
+        return service is not None and service.is_running()
+
+    def pid(self, name):
+        service = self.services.get(name)
+        if service is None or not service.is_running():
+            return None
+        return service.pid()
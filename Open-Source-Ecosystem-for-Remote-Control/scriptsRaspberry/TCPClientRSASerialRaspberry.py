@@ -1,215 +1,462 @@
-#
-#   Copyright 2021  Adriano Cofrancesco
-#   Open-Source-Ecosystem-for-Remote-Control is free software: you can redistribute it and/or modify
-#   it under the terms of the GNU General Public License as published by
-#   the Free Software Foundation, either version 3 of the License, or
-#   (at your option) any later version.
-#   Open-Source-Ecosystem-for-Remote-Control is distributed in the hope that it will be useful,
-#
-#   Copyright 2021  Adriano Cofrancesco
-#   Open-Source-Ecosystem-for-Remote-Control is free software: you can redistribute it and/or modify
-#   it under the terms of the GNU General Public License as published by
-#   the Free Software Foundation, either version 3 of the License, or
-#   (at your option) any later version.
-#   Open-Source-Ecosystem-for-Remote-Control is distributed in the hope that it will be useful,
-#   but WITHOUT ANY WARRANTY; without even the implied warranty of
-#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
-#   GNU General Public License for more details.
-#   You should have received a copy of the GNU General Public License
-#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
-#
-
-from Cryptodome.PublicKey import RSA
-from Cryptodome.Cipher import AES, PKCS1_OAEP
-from Cryptodome.Random import get_random_bytes
-
-import yaml
-import serial
-import socket
-import time
-import sys
-import subprocess
-
-
-class TCPClientRSASerial:
-
-    def __init__(self, host='0.0.0.0', port=65001, com_port_selected=""):
-        self.private_key = ""
-        self.public_key = ""
-        self.rsa_key_size = 2048
-        self.session_key_size = 16
-        self.host = host
-        self.port = port
-        self.timeout = 30
-        self.counter_limit = 10
-        self.socket_buffer = 1024
-        self.time_sleep = 0.5
-        self.server_public_key = ""
-
-        self.socket = None
-        self.com_port = com_port_selected
-
-    # function used to generate RSA private and public key
-    def generate_keys(self):
-        self.private_key = RSA.generate(self.rsa_key_size)
-
-        # public key
-        self.public_key = self.private_key.public_key().export_key()
-
-    def run(self):
-        self.generate_keys()
-
-        # open socket with server
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as self.socket:
-            self.socket.connect((self.host, self.port))
-            self.socket.settimeout(self.timeout)
-
-            pubkey_found = False
-            counter = 0
-            while not pubkey_found:
-
-                # receive public key from server
-                try:
-                    data = self.socket.recv(self.socket_buffer)
-                    print("Received by Client: ", repr(data))
-                except socket.error as error:
-                    print("Client timeout... closing client: {}".format(error))
-                    self.socket.close()
-                    break
-
-                if data:
-                    # decode data received by client and convert it in dictionary object
-                    data_yaml = yaml.load(data.decode('utf-8'), Loader=yaml.FullLoader)
-
-                    if data_yaml and 'pubkey' in data_yaml:
-
-                        try:
-                            # get server public key
-                            self.server_public_key = RSA.import_key(data_yaml['pubkey'])
-                        except ValueError as e:
-                            print("RSA Value Error: {}".format(e))
-                            self.send_error(self.socket, 'Wrong RSA key')
-                        except Exception as e:
-                            print("Error: {}".format(e))
-                            self.send_error(self.socket, 'Client internal error')
-
-                        if self.server_public_key:
-                            pubkey_found = True
-
-                            public_key_yaml = yaml.dump({'pubkey': self.public_key.decode('utf-8')})
-                            public_key_yaml_binary = public_key_yaml.encode('utf-8')
-
-                            encrypted_data = self.encrypt_data(public_key_yaml_binary)
-
-                            # send public key to server
-                            self.socket.sendall(encrypted_data)
-
-                            print("Client public key has been sent.")
-
-                    else:
-                        print("Wrong format! {}".format(data_yaml))
-                        self.send_error(self.socket, 'Wrong message format')
-
-            if pubkey_found:
-                counter = 0
-                while True:
-                    try:
-                        data_received = self.socket.recv(self.socket_buffer)
-                    except socket.timeout:
-                        print("Closing Client")
-                        self.socket.close()
-                        break
-
-                    except BaseException as error:
-                        print("Client recv error: {}".format(error))
-                        self.socket.close()
-                        break
-
-                    if data_received:
-                        try:
-                            data = self.decrypt_data(data_received)
-
-                            print("Received by Client: ", repr(data))
-
-                            data_from_serial = self.serial_communication(data)
-
-                            encrypted_data = self.encrypt_data(data_from_serial)
-
-                            # send serial response to server
-                            self.socket.sendall(encrypted_data)
-
-                        except ValueError as e:
-                            print("ValueError: {}".format(e))
-
-                        except Exception as e:
-                            print("Error: {}".format(e))
-
-                    else:
-                        print("waiting...")
-                        counter += 1
-                        time.sleep(self.time_sleep)
-                        if counter > self.counter_limit:
-                            print("Closing connection with Server: {}".format(self.host))
-                            self.socket.close()
-                            break
-
-    def send_error(self, conn, message):
-        msg_to_server = yaml.dump({'error': message}).encode('utf-8')
-        conn.sendall(msg_to_server)
-
-    def encrypt_data(self, data):
-        session_key = get_random_bytes(self.session_key_size)
-        cipher_rsa = PKCS1_OAEP.new(self.server_public_key)
-        enc_session_key = cipher_rsa.encrypt(session_key)
-
-        cipher_aes = AES.new(session_key, AES.MODE_EAX)
-        cipher_text, tag = cipher_aes.encrypt_and_digest(data)
-
-        encrypted_data = enc_session_key + cipher_aes.nonce + tag + cipher_text
-
-        return encrypted_data
-
-    def decrypt_data(self, data_received):
-
-        # retrieve all keys to perform decryption
-        session_key_index = self.private_key.size_in_bytes()
-        nonce_index = session_key_index + self.session_key_size
-        tag_index = nonce_index + self.session_key_size
-
-        enc_session_key = data_received[:session_key_index]
-        nonce = data_received[session_key_index:nonce_index]
-        tag = data_received[nonce_index:tag_index]
-        cipher_text = data_received[tag_index:]
-
-        cipher_rsa = PKCS1_OAEP.new(self.private_key)
-        session_key = cipher_rsa.decrypt(enc_session_key)
-
-        # decrypt the data with the AES session key
-        cipher_aes = AES.new(session_key, AES.MODE_EAX, nonce)
-
-        # get data decrypted
-        return cipher_aes.decrypt_and_verify(cipher_text, tag)
-
-    def serial_communication(self, data):
-        ser = serial.Serial(self.com_port, timeout=10)
-        print(ser.name)  # check which port was really used
-        ser.write(data + b'\n')  # write a string
-
-        print("Data sent to serial port")
-        serial_result = ser.readline()
-        print("Received from serial port: ", serial_result.decode('utf-8'))
-        ser.close()
-
-        return serial_result.decode('utf-8').strip("\n").encode('utf-8')
-
-
-if __name__ == '__main__':
-    com_port = "/dev/null"
-    if len(sys.argv) > 1:
-        com_port = sys.argv[1]
-    client = TCPClientRSASerial('127.0.0.1', 65001, com_port)
-    client.run()
-
-    close_services = subprocess.Popen(["sudo", "/home/pi/Desktop/closeServices.sh"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
-    close_services_stdout, stderr = close_services.communicate()
-    print("DONE")
+#
+#   Copyright 2021  Adriano Cofrancesco
+#   Open-Source-Ecosystem-for-Remote-Control is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#   Open-Source-Ecosystem-for-Remote-Control is distributed in the hope that it will be useful,
+#
+#   Copyright 2021  Adriano Cofrancesco
+#   Open-Source-Ecosystem-for-Remote-Control is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#   Open-Source-Ecosystem-for-Remote-Control is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+from StartupProfile import lazy_import, startup_profile
+
+# first, so --profile-startup times every import below
+profile = startup_profile()
+
+import base64
+import queue
+import socket
+import sys
+import subprocess
+import threading
+import time
+
+from Endpoint import endpoint_address, endpoint_socket
+from Framing import MessageStream
+from KeyStore import KeyStore
+from MessageCodec import YAML, decode_message, negotiate_codec
+from Pipeline import PIPELINE_MODE, REPLY_ERROR, REPLY_OK, REPLY_STREAM, STREAM_MODE, pack_reply, unpack_request
+from SerialSession import SerialSession
+from ServiceStatus import StatusReporter
+from SessionCipher import SessionCipher, SESSION_MODE
+from WebSocket import WebSocket
+
+RSA = lazy_import('Cryptodome.PublicKey.RSA')
+AES = lazy_import('Cryptodome.Cipher.AES')
+PKCS1_OAEP = lazy_import('Cryptodome.Cipher.PKCS1_OAEP')
+Random = lazy_import('Cryptodome.Random')
+
+
+class TCPClientRSASerial:
+
+    def __init__(self, host='0.0.0.0', port=65001, com_port_selected="", key_store=None, status=None):
+        self.private_key = ""
+        self.public_key = ""
+        self.rsa_key_size = 2048
+        self.key_store = key_store if key_store is not None else KeyStore(key_size=self.rsa_key_size)
+        self.session_key_size = 16
+        self.host = host
+        self.port = port
+        self.timeout = 30
+        # the local tunnel may still be starting when the session is opened
+        self.connect_timeout = 5
+        self.connect_retry_sleep = 0.05
+        # wss://<IP_SERVER>/ reaches the relay directly instead of through a local wstunnel,
+        # host and port are then unused. The context defaults to the system certificates
+        self.tunnel_url = None
+        self.tunnel_ssl_context = None
+        self.socket_buffer = 1024
+        self.server_public_key = ""
+        self.session_cipher = None
+        self.codec = YAML
+        self.serial_timeout = 10
+        self.serial_session = None
+        # pipelined mode: commands wait for the serial port in this queue, when it is full
+        # the socket is no longer read and the server is held back by TCP
+        self.pipeline_depth = 64
+        self.pipeline_requests = None
+        self.pipeline_closed = None
+        # streaming mode: the device output is sent as it comes, coalesced into frames of
+        # stream_frame_size bytes or sent stream_frame_delay seconds after their first byte
+        self.stream_frame_size = 4096
+        self.stream_frame_delay = 0.02
+        # state changes pushed to ClientTCP, which relays them to the GUI
+        self.status = status if status is not None else StatusReporter('TCPClientRSASerialRaspberry')
+        # set once the key is ready and the server is connected
+        self.ready = threading.Event()
+
+        self.socket = None
+        self.stream = None
+        self.com_port = com_port_selected
+
+    # function used to load RSA private and public key from the key store
+    def generate_keys(self):
+        self.private_key = self.key_store.get_key()
+        print("RSA key ready in {:.1f} ms".format(self.key_store.last_key_time * 1000))
+
+        # public key
+        self.public_key = self.private_key.public_key().export_key()
+
+    def run(self):
+        self.status.report('started', comPort=self.com_port)
+        self.generate_keys()
+        profile.mark('keys')
+
+        # open socket with server
+        # serial port stays open for the whole session
+        with self.open_socket() as self.socket, \
+                self.status.watch(SerialSession(self.com_port, self.serial_timeout)) as self.serial_session:
+            self.connect()
+            self.socket.settimeout(self.timeout)
+            self.ready.set()
+            profile.report('connected')
+            # the server speaks first with a yaml pubkey, its framing is detected from that
+            self.stream = MessageStream(self.socket, socket_buffer=self.socket_buffer, idle_timeout=self.timeout)
+
+            pubkey_found = False
+            pipelined = False
+            streaming = False
+            while not pubkey_found:
+
+                # receive public key from server
+                try:
+                    data = self.stream.recv()
+                    print("Received by Client: ", repr(data))
+                except socket.error as error:
+                    print("Client timeout... closing client: {}".format(error))
+                    self.socket.close()
+                    break
+
+                if data:
+                    # decode data received by client and convert it in dictionary object
+                    data_yaml = decode_message(data)
+
+                    if data_yaml and 'pubkey' in data_yaml:
+                        # control messages use the best codec offered by the server, yaml for old servers
+                        self.codec = negotiate_codec(data_yaml.get('codecs'))
+
+                        try:
+                            # get server public key
+                            self.server_public_key = RSA.import_key(data_yaml['pubkey'])
+                        except ValueError as e:
+                            print("RSA Value Error: {}".format(e))
+                            self.send_error(self.stream, 'Wrong RSA key')
+                        except Exception as e:
+                            print("Error: {}".format(e))
+                            self.send_error(self.stream, 'Client internal error')
+
+                        if self.server_public_key:
+                            pubkey_found = True
+
+                            public_key_packet = {'pubkey': self.public_key.decode('utf-8')}
+
+                            # a server advertising session mode gets one symmetric key for the whole
+                            # session, older servers keep the per-message RSA format
+                            session_cipher = None
+                            if SESSION_MODE in (data_yaml.get('session') or []):
+                                session_cipher = SessionCipher.generate()
+                                public_key_packet['session'] = SESSION_MODE
+                                public_key_packet['sessionKey'] = base64.b64encode(session_cipher.key).decode('utf-8')
+
+                            # a server offering the pipelined mode may send commands before
+                            # the replies to the previous ones are back
+                            pipelined = PIPELINE_MODE in (data_yaml.get('pipeline') or [])
+                            if pipelined:
+                                public_key_packet['pipeline'] = PIPELINE_MODE
+                            # and then for the streaming mode, which needs the request ids
+                            streaming = pipelined and STREAM_MODE in (data_yaml.get('stream') or [])
+                            if streaming:
+                                public_key_packet['stream'] = STREAM_MODE
+
+                            public_key_yaml_binary = self.codec.encode(public_key_packet)
+
+                            encrypted_data = self.encrypt_data(public_key_yaml_binary)
+
+                            # send public key to server
+                            self.stream.send(encrypted_data)
+                            self.session_cipher = session_cipher
+
+                            print("Client public key has been sent.")
+                            self.status.report('connected', host=self.host)
+
+                    else:
+                        print("Wrong format! {}".format(data_yaml))
+                        self.send_error(self.stream, 'Wrong message format')
+                else:
+                    # empty read: the server closed the connection
+                    print("Closing connection with Server: {}".format(self.host))
+                    self.socket.close()
+                    break
+
+            if pubkey_found:
+                if streaming:
+                    # an operator only watching the console sends nothing, the session
+                    # must not end on the idle deadline
+                    self.stream.idle_timeout = None
+                    self.socket.settimeout(None)
+                if pipelined:
+                    workers = self.start_pipeline(streaming)
+                while True:
+                    try:
+                        data_received = self.stream.recv()
+                    except socket.timeout:
+                        print("Closing Client")
+                        self.socket.close()
+                        break
+
+                    except BaseException as error:
+                        print("Client recv error: {}".format(error))
+                        self.socket.close()
+                        break
+
+                    if data_received:
+                        try:
+                            data = self.decrypt_data(data_received)
+
+                            print("Received by Client: ", repr(data))
+
+                            if pipelined:
+                                # answered by the pipeline worker, the next command is read meanwhile
+                                self.pipeline_requests.put(unpack_request(data))
+                                continue
+
+                            data_from_serial = self.serial_communication(data)
+
+                            encrypted_data = self.encrypt_data(data_from_serial)
+
+                            # send serial response to server
+                            self.stream.send(encrypted_data)
+
+                        except ValueError as e:
+                            print("ValueError: {}".format(e))
+
+                        except Exception as e:
+                            print("Error: {}".format(e))
+
+                    else:
+                        # empty read: the server closed the connection
+                        print("Closing connection with Server: {}".format(self.host))
+                        self.socket.close()
+                        break
+
+                if pipelined:
+                    self.stop_pipeline(workers)
+
+    # the sender first, then the serial reader of the streaming mode
+    def start_pipeline(self, streaming=False):
+        self.pipeline_requests = queue.Queue(self.pipeline_depth)
+        self.pipeline_closed = threading.Event()
+        if streaming:
+            workers = [threading.Thread(target=self.run_stream, daemon=True),
+                       threading.Thread(target=self.read_serial_output, daemon=True)]
+        else:
+            workers = [threading.Thread(target=self.run_pipeline, daemon=True)]
+        for worker in workers:
+            worker.start()
+        return workers
+
+    # commands left in the queue are dropped, the serial port is closed after the workers
+    def stop_pipeline(self, workers):
+        self.pipeline_closed.set()
+        if len(workers) > 1:
+            # the reader may be waiting for the device for up to serial_timeout
+            self.serial_session.cancel_read()
+        for worker in workers[1:]:
+            worker.join()
+        self.pipeline_requests.put(None)
+        workers[0].join()
+        self.pipeline_requests = None
+
+    # serial side of the pipelined mode, the only sender once the handshake is done:
+    # replies leave in the order of the commands, each with its request id
+    def run_pipeline(self):
+        while True:
+            request = self.pipeline_requests.get()
+            if request is None:
+                return
+            if self.pipeline_closed.is_set():
+                continue
+
+            request_id, data = request
+            try:
+                reply = pack_reply(request_id, REPLY_OK, self.serial_communication(data))
+            except Exception as e:
+                print("Error: {}".format(e))
+                reply = pack_reply(request_id, REPLY_ERROR, str(e).encode('utf-8'))
+
+            try:
+                self.stream.send(self.encrypt_data(reply))
+            except OSError as e:
+                print("Client send error: {}".format(e))
+                self.pipeline_closed.set()
+
+    # streaming mode: everything the device prints is queued for run_stream, along
+    # with the commands
+    def read_serial_output(self):
+        while not self.pipeline_closed.is_set():
+            try:
+                data = self.serial_session.read_available()
+            except Exception as e:
+                # read_available() closed the failed port, the next read reopens it
+                print("Serial read error: {}".format(e))
+                time.sleep(self.serial_session.reopen_sleep)
+                continue
+
+            if data:
+                self.pipeline_requests.put(data)
+
+    # sender of the streaming mode: commands are written and acknowledged at once, the
+    # device output leaves when stream_frame_size bytes are there or stream_frame_delay
+    # after the first byte, whichever comes first
+    def run_stream(self):
+        output = bytearray()
+        deadline = None
+        while True:
+            try:
+                timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+                request = self.pipeline_requests.get(timeout=timeout)
+            except queue.Empty:
+                request = b''
+            if request is None:
+                return
+            if self.pipeline_closed.is_set():
+                continue
+
+            replies = []
+            if isinstance(request, tuple):
+                request_id, data = request
+                try:
+                    self.serial_session.write(data)
+                    self.status.traffic(len(data), 0)
+                    replies.append(pack_reply(request_id, REPLY_OK, b''))
+                except Exception as e:
+                    print("Error: {}".format(e))
+                    replies.append(pack_reply(request_id, REPLY_ERROR, str(e).encode('utf-8')))
+            elif request:
+                if not output:
+                    deadline = time.monotonic() + self.stream_frame_delay
+                output += request
+
+            if output and (len(output) >= self.stream_frame_size or time.monotonic() >= deadline):
+                self.status.traffic(0, len(output), commands=0)
+                replies.append(pack_reply(0, REPLY_STREAM, bytes(output)))
+                output.clear()
+                deadline = None
+
+            try:
+                for reply in replies:
+                    self.stream.send(self.encrypt_data(reply))
+            except OSError as e:
+                print("Client send error: {}".format(e))
+                self.pipeline_closed.set()
+
+    def open_socket(self):
+        if self.tunnel_url:
+            return WebSocket(self.tunnel_url, self.connect_timeout, self.tunnel_ssl_context)
+        # host may be a unix:/path endpoint, a local hop without the TCP stack
+        return endpoint_socket(self.host)
+
+    def connect(self):
+        deadline = time.monotonic() + self.connect_timeout
+        while True:
+            try:
+                if self.tunnel_url:
+                    self.socket.connect()
+                else:
+                    self.socket.connect(endpoint_address(self.host, self.port))
+                return
+            # a unix: endpoint has no socket file until its server is up
+            except (ConnectionRefusedError, FileNotFoundError):
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(self.connect_retry_sleep)
+
+    # end a session running in another thread, its recv sees the connection closed
+    def close(self):
+        if self.socket is None:
+            return
+
+        try:
+            self.socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def send_error(self, conn, message):
+        msg_to_server = self.codec.encode({'error': message})
+        conn.send(msg_to_server)
+
+    def encrypt_data(self, data):
+        if self.session_cipher is not None:
+            return self.session_cipher.encrypt(data)
+
+        session_key = Random.get_random_bytes(self.session_key_size)
+        cipher_rsa = PKCS1_OAEP.new(self.server_public_key)
+        enc_session_key = cipher_rsa.encrypt(session_key)
+
+        cipher_aes = AES.new(session_key, AES.MODE_EAX)
+        cipher_text, tag = cipher_aes.encrypt_and_digest(data)
+
+        encrypted_data = enc_session_key + cipher_aes.nonce + tag + cipher_text
+
+        return encrypted_data
+
+    def decrypt_data(self, data_received):
+        if self.session_cipher is not None:
+            return self.session_cipher.decrypt(data_received)
+
+        # retrieve all keys to perform decryption
+        session_key_index = self.private_key.size_in_bytes()
+        nonce_index = session_key_index + self.session_key_size
+        tag_index = nonce_index + self.session_key_size
+
+        enc_session_key = data_received[:session_key_index]
+        nonce = data_received[session_key_index:nonce_index]
+        tag = data_received[nonce_index:tag_index]
+        cipher_text = data_received[tag_index:]
+
+        cipher_rsa = PKCS1_OAEP.new(self.private_key)
+        session_key = cipher_rsa.decrypt(enc_session_key)
+
+        # decrypt the data with the AES session key
+        cipher_aes = AES.new(session_key, AES.MODE_EAX, nonce)
+
+        # get data decrypted
+        return cipher_aes.decrypt_and_verify(cipher_text, tag)
+
+    def serial_communication(self, data):
+        serial_result = self.serial_session.transact(data)
+        self.status.traffic(len(data), len(serial_result))
+        print("Received from serial port: ", serial_result.decode('utf-8'))
+        print("Serial latency: {last_ms:.2f} ms (avg {avg_ms:.2f} ms, max {max_ms:.2f} ms)".format(**self.serial_session.latency_stats()))
+
+        return serial_result.decode('utf-8').strip("\n").encode('utf-8')
+
+
+if __name__ == '__main__':
+    profile.mark('imports')
+    com_port = "/dev/null"
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    if len(args) > 0:
+        com_port = args[0]
+    client = TCPClientRSASerial('127.0.0.1', 65001, com_port)
+    # --tunnel=wss://<IP_SERVER>/ replaces the wstunnel started by runClientRSA.sh,
+    # --server=unix:/path reaches a server on the same machine
+    for arg in sys.argv[1:]:
+        if arg.startswith('--tunnel='):
+            client.tunnel_url = arg.split('=', 1)[1]
+        elif arg.startswith('--server='):
+            client.host = arg.split('=', 1)[1]
+    profile.mark('init')
+    try:
+        client.run()
+    finally:
+        client.status.close()
+
+    # a supervised client is cleaned up by ClientTCP
+    if '--supervised' in sys.argv:
+        sys.exit(0)
+
+    close_services = subprocess.Popen(["sudo", "/home/pi/Desktop/closeServices.sh"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    close_services_stdout, stderr = close_services.communicate()
+    print("DONE")
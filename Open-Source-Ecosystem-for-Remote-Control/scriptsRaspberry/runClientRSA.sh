@@ -8,4 +8,7 @@ echo "*Starting TCPClientRSASerialRaspberry*"
 
 nohup python3 /home/pi/Desktop/TCPClientRSASerialRaspberry.py $1 &
 
+# Uncomment, and comment the wstunnel and python3 lines above, to reach the relay without wstunnel
+#nohup python3 /home/pi/Desktop/TCPClientRSASerialRaspberry.py $1 --tunnel=wss://<IP_SERVER>/ &
+
 echo "*TCPClientRSASerialRaspberry Started*"
\ No newline at end of file
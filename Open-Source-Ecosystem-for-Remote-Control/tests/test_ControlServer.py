@@ -0,0 +1,88 @@
+#
+#   Copyright 2021  Adriano Cofrancesco
+#   Open-Source-Ecosystem-for-Remote-Control is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#   Open-Source-Ecosystem-for-Remote-Control is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'raspberryGUI', 'serviceGUI_Raspberry'))
+
+from ControlServer import ControlServer
+from Framing import MessageStream
+from MessageCodec import YAML, decode_message
+
+
+def start_server():
+    server = ControlServer('127.0.0.1', 0)
+    server.hello_timeout = 0.1
+    server.start()
+    return server, server.socket.getsockname()[1]
+
+
+def test_legacy_agent_gets_one_command():
+    server, port = start_server()
+    try:
+        with socket.create_connection(('127.0.0.1', port)) as agent:
+
+            def answer():
+                stream = MessageStream(agent, False, 1024, 5)
+                assert decode_message(stream.recv())['msg'] == "GET_PORTS"
+                agent.sendall(YAML.encode({'comPorts': ['/dev/ttyUSB0']}))
+                agent.shutdown(socket.SHUT_WR)
+
+            thread = threading.Thread(target=answer)
+            thread.start()
+            assert server.command({'msg': "GET_PORTS"}, timeout=5) == ['/dev/ttyUSB0']
+            thread.join(5)
+    finally:
+        server.close()
+
+
+def test_channel_replies_are_matched_by_id():
+    server, port = start_server()
+    try:
+        with socket.create_connection(('127.0.0.1', port)) as agent:
+            stream = MessageStream(agent, True, 1024, 5)
+            stream.send(YAML.encode({'hello': 1, 'codecs': ['yaml']}))
+            assert decode_message(stream.recv())['hello'] == 1
+
+            def answer():
+                request = decode_message(stream.recv())
+                stream.send(YAML.encode({'id': request['id'], 'check': "42\n"}))
+
+            thread = threading.Thread(target=answer)
+            thread.start()
+            assert server.command({'msg': "CHECK"}, timeout=5) == "42\n"
+            thread.join(5)
+            assert server.pending == {}
+    finally:
+        server.close()
+
+
+def test_close_ends_the_channel():
+    server, port = start_server()
+    with socket.create_connection(('127.0.0.1', port)) as agent:
+        stream = MessageStream(agent, True, 1024, 5)
+        stream.send(YAML.encode({'hello': 1, 'codecs': ['yaml']}))
+        assert decode_message(stream.recv())['hello'] == 1
+        while server.channel is None:
+            time.sleep(0.01)
+
+        server.close()
+
+        # the agent sees EOF instead of a heartbeat
+        assert server.channel is None
+        assert stream.recv() == b''
@@ -0,0 +1,45 @@
+#
+#   Copyright 2021  Adriano Cofrancesco
+#   Open-Source-Ecosystem-for-Remote-Control is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#   Open-Source-Ecosystem-for-Remote-Control is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+import os
+import socket
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scriptsRaspberry'))
+
+from Framing import MAX_FRAME_SIZE, MessageStream, frame_header, send_frame
+
+
+def test_largest_frame_keeps_a_zero_first_byte():
+    assert frame_header.pack(MAX_FRAME_SIZE)[0] == 0
+    left, right = socket.socketpair()
+    with left, right, pytest.raises(ValueError):
+        send_frame(left, bytes(MAX_FRAME_SIZE + 1))
+
+
+def test_unframed_reply_is_read_until_closed():
+    left, right = socket.socketpair()
+    reply = b'comPorts:\n' + b'- /dev/ttyUSB0\n' * 500
+
+    def answer():
+        right.sendall(reply)
+        right.close()
+
+    threading.Thread(target=answer).start()
+    with left:
+        stream = MessageStream(left, framed=False, socket_buffer=1024, idle_timeout=5)
+        assert stream.recv_until_closed() == reply
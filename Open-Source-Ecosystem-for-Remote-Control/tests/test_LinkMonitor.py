@@ -0,0 +1,65 @@
+#
+#   Copyright 2021  Adriano Cofrancesco
+#   Open-Source-Ecosystem-for-Remote-Control is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#   Open-Source-Ecosystem-for-Remote-Control is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+import errno
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scriptsRaspberry'))
+
+from LinkMonitor import LinkMonitor
+
+
+class FailingSocket:
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.closed = False
+
+    def recv(self, size):
+        error = self.errors.pop(0)
+        raise OSError(error, os.strerror(error))
+
+    def close(self):
+        self.closed = True
+
+
+def make_monitor(tmp_path, carrier):
+    monitor = LinkMonitor('test0')
+    monitor.carrier_path = str(tmp_path / 'carrier')
+    (tmp_path / 'carrier').write_text(carrier)
+    return monitor
+
+
+def test_failed_listener_falls_back_to_sysfs(tmp_path):
+    monitor = make_monitor(tmp_path, '0\n')
+    sock = monitor.socket = FailingSocket(errno.EIO)
+    monitor.carrier = True
+
+    monitor.listen(sock)
+
+    assert monitor.socket is None and sock.closed
+    assert monitor.is_up() is False
+
+
+def test_dropped_events_reread_the_carrier(tmp_path):
+    monitor = make_monitor(tmp_path, '0\n')
+    sock = monitor.socket = FailingSocket(errno.ENOBUFS, errno.EIO)
+    monitor.carrier = True
+    changes = []
+    monitor.on_change = changes.append
+
+    monitor.listen(sock)
+
+    assert changes == [False]
@@ -0,0 +1,55 @@
+#
+#   Copyright 2021  Adriano Cofrancesco
+#   Open-Source-Ecosystem-for-Remote-Control is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#   Open-Source-Ecosystem-for-Remote-Control is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+# Every deployment directory has its own copy of MessageCodec.py, all of them are checked:
+#   python3 -m pytest tests
+
+import importlib.util
+import os
+import sys
+
+import pytest
+import yaml
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+directories = ['scriptsRaspberry', 'relayServer', 'raspberryGUI/serviceGUI_Raspberry',
+               'windowsWithoutWireguard/serviceGUI_NoWireguard']
+
+
+def load_codec(directory):
+    path = os.path.join(root, directory, 'MessageCodec.py')
+    # StartupProfile is imported from next to the copy
+    sys.path.insert(0, os.path.dirname(path))
+    try:
+        spec = importlib.util.spec_from_file_location('MessageCodec_' + directory.replace('/', '_'), path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        sys.path.pop(0)
+    return module
+
+
+@pytest.mark.parametrize('directory', directories)
+def test_python_tags_are_rejected(directory):
+    codec = load_codec(directory)
+    with pytest.raises(yaml.YAMLError):
+        codec.decode_message(b'x: !!python/object/apply:os.getpid []')
+
+
+@pytest.mark.parametrize('directory', directories)
+def test_yaml_and_binary_round_trip(directory):
+    codec = load_codec(directory)
+    message = {'pubkey': 'key', 'codecs': ['binary', 'yaml'], 'wait': 10}
+    for name in ('yaml', 'binary'):
+        assert codec.decode_message(codec.codecs[name].encode(message)) == message
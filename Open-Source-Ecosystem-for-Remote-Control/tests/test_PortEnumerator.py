@@ -0,0 +1,93 @@
+#
+#   Copyright 2021  Adriano Cofrancesco
+#   Open-Source-Ecosystem-for-Remote-Control is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#   Open-Source-Ecosystem-for-Remote-Control is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scriptsRaspberry'))
+
+from PortEnumerator import PortEnumerator
+
+
+def write(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text + '\n')
+
+
+def link(path, target):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    target.mkdir(parents=True, exist_ok=True)
+    path.symlink_to(target)
+
+
+# a Raspberry Pi with an FTDI adapter, laid out like the kernel does it
+def make_sysfs(root):
+    devices = root / 'sys' / 'devices'
+    usb = devices / 'platform' / 'scb' / 'usb1' / '1-1'
+    for name, value in [('idVendor', '0403'), ('idProduct', '6001'), ('serial', 'A10K1234'),
+                        ('manufacturer', 'FTDI'), ('product', 'FT232R USB UART')]:
+        write(usb / name, value)
+    # usb-serial names its port device after the tty
+    usb_port = usb / '1-1:1.0' / 'ttyUSB0'
+    link(usb_port / 'driver', root / 'sys' / 'bus' / 'usb-serial' / 'drivers' / 'ftdi_sio')
+    link(usb_port / 'subsystem', root / 'sys' / 'bus' / 'usb-serial')
+
+    uart = devices / 'platform' / 'soc' / 'fe201000.serial'
+    link(uart / 'driver', root / 'sys' / 'bus' / 'amba' / 'drivers' / 'uart-pl011')
+    link(uart / 'subsystem', root / 'sys' / 'bus' / 'amba')
+    isa = devices / 'platform' / 'serial8250'
+
+    tty = root / 'sys' / 'class' / 'tty'
+    link(tty / 'ttyUSB0' / 'device', usb_port)
+    link(tty / 'ttyAMA0' / 'device', uart)
+    link(tty / 'ttyS0' / 'device', isa)
+    write(tty / 'ttyS0' / 'type', '0')
+    (tty / 'tty1').mkdir()
+    link(tty / 'ptmx' / 'device', devices / 'virtual' / 'tty' / 'ptmx')
+
+    for name in ('ttyUSB0', 'ttyAMA0', 'ttyS0', 'tty1', 'ptmx'):
+        write(root / 'dev' / name, '')
+
+    return PortEnumerator(str(tty), str(root / 'dev'))
+
+
+def test_sysfs_scan(tmp_path):
+    enumerator = make_sysfs(tmp_path)
+
+    ports = enumerator.scan_sysfs()
+
+    assert [port['port'] for port in ports] == [str(tmp_path / 'dev' / 'ttyAMA0'), str(tmp_path / 'dev' / 'ttyUSB0')]
+    uart, usb = ports
+    assert uart['driver'] == 'uart-pl011' and uart['vid'] is None
+    assert usb['driver'] == 'ftdi_sio' and usb['subsystem'] == 'usb-serial'
+    assert (usb['vid'], usb['pid'], usb['serial']) == ('0403', '6001', 'A10K1234')
+    assert usb['product'] == 'FT232R USB UART'
+
+
+def test_scan_overlapping_a_uevent_is_not_cached(tmp_path):
+    enumerator = make_sysfs(tmp_path)
+    scan = enumerator.scan_sysfs
+
+    def scan_during_hotplug():
+        ports = scan()
+        enumerator.invalidate()
+        return ports
+
+    enumerator.scan_sysfs = scan_during_hotplug
+    assert len(enumerator.list_ports()) == 2
+    assert enumerator.ports is None
+
+    enumerator.scan_sysfs = scan
+    assert len(enumerator.list_ports()) == 2
+    assert enumerator.ports is not None
@@ -0,0 +1,57 @@
+#
+#   Copyright 2021  Adriano Cofrancesco
+#   Open-Source-Ecosystem-for-Remote-Control is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#   Open-Source-Ecosystem-for-Remote-Control is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+import os
+import sys
+import time
+
+base = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(base, 'windowsWithWireguard', 'serviceGUI'))
+sys.path.insert(0, os.path.join(base, 'benchmarks'))
+
+from FakePortBackend import FakePortBackend
+from PortProbe import PortProbe
+
+
+def test_found_ports_are_ordered_and_cached(tmp_path):
+    cache_file = str(tmp_path / 'serial_ports.yaml')
+    candidates = ['COM%s' % (i + 1) for i in range(20)]
+    probe = PortProbe(candidates, FakePortBackend(['COM10', 'COM2', 'COM17']), cache_file, workers=4)
+    found_early = []
+    probe.on_found = found_early.append
+
+    found = probe.probe()
+
+    assert found == ['COM2', 'COM10', 'COM17']
+    assert sorted(found_early) == sorted(found)
+    assert PortProbe(cache_file=cache_file).cached_ports() == found
+
+
+def test_hanging_port_is_given_up(tmp_path):
+    backend = FakePortBackend(['COM1', 'COM3'], hanging=['COM2'], hang_time=5)
+    probe = PortProbe(['COM1', 'COM2', 'COM3'], backend, str(tmp_path / 'serial_ports.yaml'),
+                      workers=2, port_timeout=0.3)
+
+    start = time.perf_counter()
+    found = probe.probe()
+
+    assert found == ['COM1', 'COM3']
+    assert time.perf_counter() - start < 2
+
+
+def test_unreadable_cache_is_empty(tmp_path):
+    cache_file = tmp_path / 'serial_ports.yaml'
+    assert PortProbe(cache_file=str(cache_file)).cached_ports() == []
+    cache_file.write_text("- COM1\n- [broken\n")
+    assert PortProbe(cache_file=str(cache_file)).cached_ports() == []
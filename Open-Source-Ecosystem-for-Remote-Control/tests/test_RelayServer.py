@@ -0,0 +1,108 @@
+#
+#   Copyright 2021  Adriano Cofrancesco
+#   Open-Source-Ecosystem-for-Remote-Control is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#   Open-Source-Ecosystem-for-Remote-Control is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+import asyncio
+import os
+import sys
+
+import pytest
+from Cryptodome.PublicKey import RSA
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'relayServer'))
+
+from MessageCodec import BINARY, decode_message
+from OperatorAuth import key_fingerprint, sign_challenge
+from RelayServer import RelayServer
+
+KEY = RSA.generate(2048)
+OTHER_KEY = RSA.generate(2048)
+
+
+class FakePeer:
+    address = ('127.0.0.1', 0)
+
+
+# the relay side of an operator connection, answer() builds the next message from the last reply
+class FakeStream:
+
+    def __init__(self, answer=None):
+        self.sent = []
+        self.answer = answer
+
+    async def send(self, payload):
+        self.sent.append(decode_message(payload))
+
+    async def recv(self):
+        return BINARY.encode(self.answer(self.sent[-1])) if self.answer else b''
+
+
+def make_relay(*keys):
+    relay = RelayServer()
+    relay.operator_keys = {key_fingerprint(key.public_key()) for key in keys}
+    relay.pair_timeout = 0.01
+    relay.auth_timeout = 1
+    return relay
+
+
+def request(key, **fields):
+    return dict({'relay': 'operator', 'pubkey': key.public_key().export_key().decode('ascii')}, **fields)
+
+
+def run_operator(relay, stream, message):
+    asyncio.run(relay.handle_operator(FakePeer(), stream, message, BINARY))
+    return stream.sent[-1]
+
+
+@pytest.mark.parametrize('wait', ['abc', None, -1, float('nan'), True, [1]])
+def test_wrong_wait_is_an_error(wait):
+    reply = run_operator(make_relay(KEY), FakeStream(), request(KEY, wait=wait))
+
+    assert reply == {'relay': 'error', 'error': "Wrong operator request"}
+
+
+def test_unknown_key_is_refused_before_pairing():
+    relay = make_relay(KEY)
+    stream = FakeStream()
+
+    reply = run_operator(relay, stream, request(OTHER_KEY, wait=0))
+
+    assert stream.sent == [reply] and reply['error'] == "Operator key not allowed"
+
+
+def test_no_key_is_refused():
+    message = request(KEY, wait=0)
+    del message['pubkey']
+
+    reply = run_operator(make_relay(KEY), FakeStream(), message)
+
+    assert reply['error'] == "Operator key not allowed"
+
+
+def test_unproven_key_is_refused():
+    # a copy of an allowed public key without its private half
+    stream = FakeStream(lambda challenge: sign_challenge(OTHER_KEY, challenge))
+
+    reply = run_operator(make_relay(KEY), stream, request(KEY, wait=0))
+
+    assert stream.sent[0]['relay'] == 'challenge'
+    assert reply['error'] == "Operator key not proven"
+
+
+def test_proven_key_waits_for_a_device():
+    stream = FakeStream(lambda challenge: sign_challenge(KEY, challenge))
+
+    reply = run_operator(make_relay(KEY), stream, request(KEY, wait=0))
+
+    assert stream.sent[0]['relay'] == 'challenge'
+    assert reply == {'relay': 'error', 'error': "No device available on 'default'"}
@@ -0,0 +1,62 @@
+#
+#   Copyright 2021  Adriano Cofrancesco
+#   Open-Source-Ecosystem-for-Remote-Control is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#   Open-Source-Ecosystem-for-Remote-Control is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+import os
+import pty
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scriptsRaspberry'))
+
+from SerialSession import SerialSession
+
+
+def open_pty():
+    master, slave = pty.openpty()
+    return master, os.ttyname(slave), slave
+
+
+def test_stale_handle_does_not_close_the_reopened_port():
+    master, name, slave = open_pty()
+    try:
+        with SerialSession(name, timeout=0.2) as session:
+            failed = session.open()
+            session.close()
+            reopened = session.open()
+            # the reader reports an error on the handle it was blocked on
+            session.close(failed)
+            session.recover(OSError('stale'), 1, failed)
+            assert session.serial is reopened and session.is_open()
+    finally:
+        os.close(master)
+        os.close(slave)
+
+
+def test_write_while_reader_is_blocked():
+    master, name, slave = open_pty()
+    try:
+        with SerialSession(name, timeout=5) as session:
+            session.open()
+            received = []
+            reader = threading.Thread(target=lambda: received.append(session.read_available()))
+            reader.start()
+            session.write(b'ping')
+            assert os.read(master, 16).startswith(b'ping')
+            os.write(master, b'pong\n')
+            reader.join(5)
+            # the read wakes up on the first byte
+            assert received and received[0] and b'pong\n'.startswith(received[0])
+    finally:
+        os.close(master)
+        os.close(slave)
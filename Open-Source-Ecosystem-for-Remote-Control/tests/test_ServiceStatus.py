@@ -0,0 +1,56 @@
+#
+#   Copyright 2021  Adriano Cofrancesco
+#   Open-Source-Ecosystem-for-Remote-Control is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#   Open-Source-Ecosystem-for-Remote-Control is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+import os
+import queue
+import socket
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scriptsRaspberry'))
+
+from MessageCodec import BINARY, YAML
+from ServiceStatus import StatusListener, StatusReporter
+
+
+def test_bad_datagrams_do_not_stop_the_listener(tmp_path):
+    path = str(tmp_path / 'status' / 'status.sock')
+    reports = queue.Queue()
+    listener = StatusListener(path, callback=reports.put)
+    listener.start()
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sender:
+            sender.sendto(b'\xff\x00garbage', path)
+            sender.sendto(YAML.encode(['not', 'a', 'report']), path)
+            sender.sendto(b'key: [unclosed', path)
+            sender.sendto(BINARY.encode({'state': 'started', 'pid': 'nope'}), path)
+        StatusReporter('test', path).report('serial_open', comPort='/dev/ttyUSB0')
+
+        first = reports.get(timeout=5)
+        assert first['state'] == 'started'
+        report = reports.get(timeout=5)
+        assert report['state'] == 'serial_open' and report['comPort'] == '/dev/ttyUSB0'
+    finally:
+        listener.close()
+
+
+def test_shared_directory_is_refused(tmp_path):
+    directory = tmp_path / 'status'
+    directory.mkdir()
+    directory.chmod(0o777)
+    listener = StatusListener(str(directory / 'status.sock'))
+    with pytest.raises(PermissionError):
+        listener.start()
+    assert listener.socket is None
@@ -0,0 +1,63 @@
+#
+#   Copyright 2021  Adriano Cofrancesco
+#   Open-Source-Ecosystem-for-Remote-Control is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#   Open-Source-Ecosystem-for-Remote-Control is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scriptsRaspberry'))
+
+from Supervisor import Supervisor
+
+
+def is_alive(pid):
+    try:
+        with open('/proc/{}/stat'.format(pid)) as stat:
+            # a zombie waits for a reaper, it is not running any more
+            return stat.read().rsplit(')', 1)[1].split()[0] != 'Z'
+    except FileNotFoundError:
+        return False
+
+
+def test_stop_reaches_the_whole_process_group(tmp_path):
+    supervisor = Supervisor(base_path=str(tmp_path))
+    # sudo is the same kind of parent: the service command is its child
+    supervisor.command_prefix = []
+    pid_file = tmp_path / 'child.pid'
+    supervisor.start('service', ['sh', '-c', 'sleep 60 & echo $! > {}; wait'.format(pid_file)])
+
+    deadline = time.monotonic() + 5
+    while not pid_file.exists() or not pid_file.read_text().strip():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    child = int(pid_file.read_text())
+
+    supervisor.stop('service')
+    deadline = time.monotonic() + 5
+    while is_alive(child):
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_group_without_permission_falls_back_to_the_process(tmp_path, monkeypatch):
+    supervisor = Supervisor(base_path=str(tmp_path))
+    supervisor.command_prefix = []
+    service = supervisor.start('service', ['sleep', '60'])
+
+    def killpg(pgid, signum):
+        raise PermissionError(1, 'Operation not permitted')
+
+    monkeypatch.setattr(os, 'killpg', killpg)
+    supervisor.stop('service')
+    assert service.process.returncode is not None
@@ -0,0 +1,44 @@
+#
+#   Copyright 2021  Adriano Cofrancesco
+#   Open-Source-Ecosystem-for-Remote-Control is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#   Open-Source-Ecosystem-for-Remote-Control is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+import importlib.util
+import os
+import sys
+import threading
+import time
+
+directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'windowsWithWireguard', 'serviceGUI')
+sys.path.insert(0, directory)
+
+# raspberryGUI has a TCPServer module of its own
+spec = importlib.util.spec_from_file_location('TCPServer_windowsWithWireguard', os.path.join(directory, 'TCPServer.py'))
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+TCPServer = module.TCPServer
+
+
+def test_close_as_soon_as_the_loop_is_published():
+    server = TCPServer('127.0.0.1', 0)
+    thread = threading.Thread(target=server.runAsync, args=('/dev/null-port',), daemon=True)
+    thread.start()
+
+    # the GUI may close the server while serveAsync is still setting up
+    deadline = time.monotonic() + 5
+    while server.loop is None:
+        assert time.monotonic() < deadline
+        time.sleep(0)
+    server.close()
+
+    thread.join(5)
+    assert not thread.is_alive()
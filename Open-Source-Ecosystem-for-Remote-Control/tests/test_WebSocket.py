@@ -0,0 +1,73 @@
+#
+#   Copyright 2021  Adriano Cofrancesco
+#   Open-Source-Ecosystem-for-Remote-Control is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#   Open-Source-Ecosystem-for-Remote-Control is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+import asyncio
+import os
+import struct
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'relayServer'))
+
+from WebSocket import (CLOSE_PROTOCOL_ERROR, CLOSE_TOO_BIG, MAX_PAYLOAD, OP_BINARY, OP_CLOSE, FrameError,
+                       WebSocketReader, decode_frame, encode_frame)
+
+
+class FakeWriter:
+
+    def __init__(self):
+        self.data = bytearray()
+        self.closing = False
+
+    def write(self, data):
+        self.data += data
+
+    def is_closing(self):
+        return self.closing
+
+    def close(self):
+        self.closing = True
+
+
+def read_from_client(data):
+    async def read():
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        writer = FakeWriter()
+        return await WebSocketReader(reader, writer).read(), writer
+    return asyncio.run(read())
+
+
+def test_declared_length_is_checked_before_buffering():
+    # only the header of a frame announcing 2**40 bytes
+    header = struct.pack('>BBQ', 0x80 | OP_BINARY, 0x80 | 127, 2 ** 40)
+    with pytest.raises(FrameError) as error:
+        decode_frame(header, masked=True)
+    assert error.value.code == CLOSE_TOO_BIG
+    assert decode_frame(struct.pack('>BBQ', 0x80 | OP_BINARY, 127, MAX_PAYLOAD)) is None
+
+
+def test_client_frames_are_read_unmasked():
+    data, writer = read_from_client(encode_frame(OP_BINARY, b'payload', masked=True))
+    assert data == b'payload'
+    assert not writer.closing
+
+
+def test_unmasked_client_frame_closes_the_connection():
+    data, writer = read_from_client(encode_frame(OP_BINARY, b'payload', masked=False))
+    assert data == b''
+    assert writer.closing
+    assert decode_frame(bytes(writer.data))[1:3] == (OP_CLOSE, struct.pack('>H', CLOSE_PROTOCOL_ERROR))
@@ -0,0 +1,85 @@
+#
+#   Copyright 2021  Adriano Cofrancesco
+#   Open-Source-Ecosystem-for-Remote-Control is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#   Open-Source-Ecosystem-for-Remote-Control is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+# Endpoint addresses: a host of the form 'unix:/run/remote/serial.sock' names a Unix
+# domain socket and the port is ignored. Hops on the same machine then skip the TCP
+# stack and cannot clash on a port.
+
+import errno
+import os
+import socket
+import stat
+
+UNIX_PREFIX = 'unix:'
+
+
+def is_unix(host):
+    return isinstance(host, str) and host.startswith(UNIX_PREFIX)
+
+
+def endpoint_family(host):
+    if not is_unix(host):
+        return socket.AF_INET
+    # Windows builds of python do not have it
+    if not hasattr(socket, 'AF_UNIX'):
+        raise ValueError("unix: endpoints are not supported on this platform")
+    return socket.AF_UNIX
+
+
+def endpoint_address(host, port):
+    if is_unix(host):
+        return host[len(UNIX_PREFIX):]
+    return host, port
+
+
+def endpoint_socket(host):
+    return socket.socket(endpoint_family(host), socket.SOCK_STREAM)
+
+
+def listen_socket(host, port, backlog):
+    sock = endpoint_socket(host)
+    address = endpoint_address(host, port)
+    try:
+        if is_unix(host):
+            remove_stale(address)
+        else:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(address)
+        sock.listen(backlog)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+# the socket file outlives a server that did not shut down cleanly, it is only
+# removed when nobody answers on it
+def remove_stale(path):
+    # anything else than a socket is left for bind to fail on
+    if not os.path.exists(path) or not stat.S_ISSOCK(os.stat(path).st_mode):
+        return
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(path)
+        except ConnectionRefusedError:
+            os.unlink(path)
+            return
+    raise OSError(errno.EADDRINUSE, "{} is in use".format(path))
+
+
+# peer address for logs and status reports, unix clients have no name
+def peer_host(addr):
+    if isinstance(addr, tuple):
+        return addr[0]
+    return addr or 'unix'
@@ -0,0 +1,161 @@
+#
+#   Copyright 2021  Adriano Cofrancesco
+#   Open-Source-Ecosystem-for-Remote-Control is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#   Open-Source-Ecosystem-for-Remote-Control is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+import glob
+import os
+import queue
+import re
+import sys
+import threading
+import time
+
+from StartupProfile import lazy_import
+
+serial = lazy_import('serial')
+yaml = lazy_import('yaml')
+
+portCacheFileName = 'serial_ports.yaml'
+
+
+def default_candidates():
+    if sys.platform.startswith('win'):
+        return ['COM%s' % (i + 1) for i in range(256)]
+    # this excludes your current terminal "/dev/tty"
+    return glob.glob('/dev/tty[0-9A-Za-z]*')
+
+
+def open_serial(port, timeout):
+    s = serial.Serial(port, timeout=timeout, write_timeout=timeout)
+    s.close()
+
+
+# COM2 before COM10
+def port_order(port):
+    match = re.match(r'(.*?)(\d+)$', port)
+    if match is None:
+        return port, 0
+    return match.group(1), int(match.group(2))
+
+
+# checks which serial ports can be opened, several at a time on daemon threads.
+# A port that does not answer within port_timeout is given up and its worker replaced,
+# found ports are reported through on_found as soon as they open, on_done gets the
+# final list which is also saved as the last known-good list.
+class PortProbe:
+
+    def __init__(self, candidates=None, opener=None, cache_file=None, workers=16, port_timeout=2):
+        if cache_file is None:
+            cache_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), portCacheFileName)
+        self.candidates = candidates
+        self.opener = opener if opener is not None else open_serial
+        self.cache_file = cache_file
+        self.workers = workers
+        self.port_timeout = port_timeout
+        self.poll_interval = 0.05
+
+        self.lock = threading.Lock()
+        self.thread = None
+        self.on_found = None
+        self.on_done = None
+
+    def cached_ports(self):
+        try:
+            with open(self.cache_file) as file:
+                ports = yaml.safe_load(file)
+        except (OSError, yaml.YAMLError):
+            return []
+
+        return [port for port in ports or [] if isinstance(port, str)]
+
+    def save_cache(self, ports):
+        try:
+            with open(self.cache_file, 'w') as file:
+                yaml.safe_dump(ports, file)
+        except OSError as error:
+            print("Port cache error: {}".format(error))
+
+    def start(self):
+        self.thread = threading.Thread(target=self.probe, daemon=True)
+        self.thread.start()
+        return self.thread
+
+    def check(self, port):
+        try:
+            self.opener(port, self.port_timeout)
+            return True
+        except (OSError, ValueError, serial.SerialException):
+            return False
+
+    def worker(self, pending, results, started):
+        while True:
+            try:
+                port = pending.get_nowait()
+            except queue.Empty:
+                return
+
+            with self.lock:
+                started[port] = time.monotonic()
+            results.put((port, self.check(port)))
+
+    def spawn_worker(self, pending, results, started):
+        threading.Thread(target=self.worker, args=(pending, results, started), daemon=True).start()
+
+    def probe(self):
+        candidates = self.candidates if self.candidates is not None else default_candidates()
+        pending = queue.Queue()
+        for port in candidates:
+            pending.put(port)
+        results = queue.Queue()
+        started = {}
+
+        for _ in range(min(self.workers, len(candidates))):
+            self.spawn_worker(pending, results, started)
+
+        found = []
+        remaining = len(candidates)
+        while remaining:
+            now = time.monotonic()
+            with self.lock:
+                expired = [port for port, start in started.items() if now - start >= self.port_timeout]
+                for port in expired:
+                    del started[port]
+
+            for port in expired:
+                # the stuck worker is left behind, another one takes its place
+                print("Port {} did not answer in {} s".format(port, self.port_timeout))
+                remaining -= 1
+                self.spawn_worker(pending, results, started)
+
+            try:
+                port, available = results.get(timeout=self.poll_interval)
+            except queue.Empty:
+                continue
+
+            with self.lock:
+                if started.pop(port, None) is None:
+                    # answered after its timeout, already counted
+                    continue
+            remaining -= 1
+
+            if available:
+                found.append(port)
+                if self.on_found is not None:
+                    self.on_found(port)
+
+        found.sort(key=port_order)
+        self.save_cache(found)
+        if self.on_done is not None:
+            self.on_done(found)
+
+        return found
@@ -1,116 +1,213 @@
-#
-#   Copyright 2021  Adriano Cofrancesco
-#   Open-Source-Ecosystem-for-Remote-Control is free software: you can redistribute it and/or modify
-#   it under the terms of the GNU General Public License as published by
-#   the Free Software Foundation, either version 3 of the License, or
-#   (at your option) any later version.
-#   Open-Source-Ecosystem-for-Remote-Control is distributed in the hope that it will be useful,
-#   but WITHOUT ANY WARRANTY; without even the implied warranty of
-#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
-#   GNU General Public License for more details.
-#   You should have received a copy of the GNU General Public License
-#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
-#
-
-import socket
-import serial
-import time
-import sys
-
-
-class TCPServer:
-
-    def __init__(self, host='0.0.0.0', port=65001, max_clients=3):
-        self.host = host
-        self.port = port
-        self.timeout = 30
-        self.counter_limit = 10
-        self.socket_buffer = 1024
-        self.time_sleep = 0.5
-
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.socket.bind((host, port))
-        self.socket.listen(max_clients)
-        self.socket.settimeout(self.timeout)
-
-        self.client = None
-
-    def run(self, selectedComPort):
-
-        print("Server {} listening on port {}".format(self.host, self.port))
-        try:
-            while True:
-                self.client = None
-                # accept client connection
-                conn, addr = self.socket.accept()
-                self.client = conn
-
-                self.runThread(conn, addr, selectedComPort)
-
-        except socket.timeout:
-            print("Closing Server")
-            self.socket.close()
-        except Exception as e:
-            print("Error: {}".format(e))
-            self.socket.close()
-
-    def runThread(self, client, address, comPort):
-        print("Server {} listening on port {}".format(self.host, self.port))
-        try:
-            with client:
-                print("Connected by: {}".format(address))
-                counter = 0
-                while True:
-                    # receive data from client
-                    try:
-                        data = client.recv(self.socket_buffer)
-                        print("Received from Client {}: {}".format(address, data))
-                    except Exception as error:
-                        print("Server recv error: {}".format(error))
-                        break
-
-                    try:
-                        if data:
-                            try:
-                                ser = serial.Serial(comPort, timeout=10)
-                                print("Selected: {}".format(ser.name))  # check which port was really used
-                                ser.write(data + b'\n')  # write a string
-
-                                print("Data sent to serial port")
-                                s = ser.readline()
-                                print("Received from serial port: '{}'".format(s.decode()))
-                                ser.close()
-
-                                if not s:
-                                    s = b"null\n"
-
-                                client.sendall(s)
-                            except:
-                                msg = "Error on serial: {}\n".format(sys.exc_info()[0])
-                                print(msg)
-                                client.sendall(msg.encode('utf-8'))
-                        else:
-                            counter += 1
-                            print("waiting...")
-                            time.sleep(self.time_sleep)
-                            if counter > self.counter_limit:
-                                print("Closing connection with Client: {}".format(address))
-                                client.close()
-                                break
-                    except Exception as e:
-                        print("Error: {}".format(e))
-                        client.close()
-                        break
-
-        except socket.timeout:
-            print("Closing Server")
-            self.socket.close()
-        except Exception as e:
-            print("Error: {}".format(e))
-            self.socket.close()
-
-    def close(self):
-        if self.client is not None:
-            self.client.close()
+#
+#   Copyright 2021  Adriano Cofrancesco
+#   Open-Source-Ecosystem-for-Remote-Control is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#   Open-Source-Ecosystem-for-Remote-Control is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+import socket
+import sys
+
+from Endpoint import listen_socket
+from Framing import MessageStream, AsyncMessageStream
+from SerialSession import SerialSession
+from StartupProfile import lazy_import
+
+# only the async server needs these
+asyncio = lazy_import('asyncio')
+futures = lazy_import('concurrent.futures')
+
+
+class TCPServer:
+
+    def __init__(self, host='0.0.0.0', port=65001, max_clients=3):
+        self.host = host
+        self.port = port
+        self.timeout = 30
+        self.idle_timeout = 120
+        self.socket_buffer = 1024
+        self.serial_timeout = 10
+
+        # asyncio mode: all clients share one serial session arbitrated by a lock,
+        # set shared_serial to False to give every client its own session
+        self.shared_serial = True
+        self.async_backlog = 128
+        self.serial_workers = 4
+
+        # host may be a unix:/path endpoint for a hop on the same machine
+        self.socket = listen_socket(host, port, max_clients)
+        self.socket.settimeout(self.timeout)
+
+        self.client = None
+        self.loop = None
+        self.stop_event = None
+        self.writers = set()
+
+    def run(self, selectedComPort):
+
+        print("Server {} listening on port {}".format(self.host, self.port))
+        try:
+            while True:
+                self.client = None
+                # accept client connection
+                conn, addr = self.socket.accept()
+                self.client = conn
+
+                self.runThread(conn, addr, selectedComPort)
+
+        except socket.timeout:
+            print("Closing Server")
+            self.socket.close()
+        except Exception as e:
+            print("Error: {}".format(e))
+            self.socket.close()
+
+    def runThread(self, client, address, comPort):
+        print("Server {} listening on port {}".format(self.host, self.port))
+        try:
+            # serial port stays open for the whole TCP session
+            with client, SerialSession(comPort, self.serial_timeout) as session:
+                print("Connected by: {}".format(address))
+                stream = MessageStream(client, socket_buffer=self.socket_buffer, idle_timeout=self.idle_timeout)
+                while True:
+                    # receive data from client
+                    try:
+                        data = stream.recv()
+                        print("Received from Client {}: {}".format(address, data))
+                    except Exception as error:
+                        print("Server recv error: {}".format(error))
+                        break
+
+                    try:
+                        if data:
+                            try:
+                                s = session.transact(data)
+                                print("Received from serial port: '{}'".format(s.decode()))
+
+                                if not s:
+                                    s = b"null\n"
+
+                                stream.send(s)
+                            except:
+                                msg = "Error on serial: {}\n".format(sys.exc_info()[0])
+                                print(msg)
+                                stream.send(msg.encode('utf-8'))
+                        else:
+                            # empty read: the client closed the connection
+                            print("Closing connection with Client: {}".format(address))
+                            break
+                    except Exception as e:
+                        print("Error: {}".format(e))
+                        client.close()
+                        break
+
+                stream.close()
+
+        except socket.timeout:
+            print("Closing Server")
+            self.socket.close()
+        except Exception as e:
+            print("Error: {}".format(e))
+            self.socket.close()
+
+    # serve many clients concurrently on one event loop, serial I/O runs on a small
+    # shared thread pool instead of one thread per connection
+    def runAsync(self, selectedComPort):
+        try:
+            asyncio.run(self.serveAsync(selectedComPort))
+        except Exception as e:
+            print("Error: {}".format(e))
+        finally:
+            self.loop = None
+            self.socket.close()
+
+    async def serveAsync(self, comPort):
+        # the event exists before the loop is published, close() can come from the GUI
+        # thread at any time
+        self.stop_event = asyncio.Event()
+        self.loop = asyncio.get_running_loop()
+        self.executor = futures.ThreadPoolExecutor(max_workers=self.serial_workers)
+        self.shared_session = SerialSession(comPort, self.serial_timeout)
+        self.serial_lock = asyncio.Lock()
+
+        self.socket.listen(self.async_backlog)
+        server = await asyncio.start_server(
+            lambda reader, writer: self.handleClientAsync(reader, writer, comPort), sock=self.socket)
+        print("Async server {} listening on port {}".format(self.host, self.port))
+
+        await self.stop_event.wait()
+
+        print("Closing Server")
+        server.close()
+        for writer in list(self.writers):
+            writer.close()
+        await self.loop.run_in_executor(self.executor, self.shared_session.close)
+        self.executor.shutdown(wait=False)
+
+    async def handleClientAsync(self, reader, writer, comPort):
+        address = writer.get_extra_info('peername')
+        print("Connected by: {}".format(address))
+        self.writers.add(writer)
+        stream = AsyncMessageStream(reader, writer, socket_buffer=self.socket_buffer)
+
+        if self.shared_serial:
+            session = self.shared_session
+            lock = self.serial_lock
+        else:
+            session = SerialSession(comPort, self.serial_timeout)
+            lock = asyncio.Lock()
+
+        try:
+            while True:
+                try:
+                    data = await asyncio.wait_for(stream.recv(), self.idle_timeout)
+                except asyncio.TimeoutError:
+                    print("Client {} idle, closing connection".format(address))
+                    break
+
+                if not data:
+                    break
+                print("Received from Client {}: {}".format(address, data))
+
+                try:
+                    async with lock:
+                        s = await self.loop.run_in_executor(self.executor, session.transact, data)
+                    print("Received from serial port: '{}'".format(s.decode()))
+
+                    if not s:
+                        s = b"null\n"
+                except OSError:
+                    s = "Error on serial: {}\n".format(sys.exc_info()[0]).encode('utf-8')
+                    print(s)
+
+                await stream.send(s)
+        except Exception as e:
+            print("Error: {}".format(e))
+        finally:
+            print("Closing connection with Client: {}".format(address))
+            self.writers.discard(writer)
+            if not self.shared_serial:
+                await self.loop.run_in_executor(self.executor, session.close)
+            stream.close()
+
+    def close(self):
+        # async mode: stop the event loop from the GUI thread
+        loop = self.loop
+        if loop is not None:
+            try:
+                loop.call_soon_threadsafe(self.stop_event.set)
+            except RuntimeError:
+                # the loop has just ended by itself
+                pass
+            return
+
+        if self.client is not None:
+            self.client.close()
         self.socket.close()
\ No newline at end of file
@@ -1,31 +1,76 @@
-#
-#   Copyright 2021  Adriano Cofrancesco
-#   Open-Source-Ecosystem-for-Remote-Control is free software: you can redistribute it and/or modify
-#   it under the terms of the GNU General Public License as published by
-#   the Free Software Foundation, either version 3 of the License, or
-#   (at your option) any later version.
-#   Open-Source-Ecosystem-for-Remote-Control is distributed in the hope that it will be useful,
-#   but WITHOUT ANY WARRANTY; without even the implied warranty of
-#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
-#   GNU General Public License for more details.
-#   You should have received a copy of the GNU General Public License
-#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
-#
-
-import base64
-
-
-def pic2str(file, functionName):
-    pic = open(file, 'rb')
-    content = '{} = {}\n'.format(functionName, base64.b64encode(pic.read()))
-    pic.close()
-
-    with open('pic2str.py', 'a') as f:
-        f.write(content)
-
-
-if __name__ == '__main__':
-    pic2str('./ui/img/icon_s.png', 'icon_s')
-    pic2str('./ui/img/devops-infinite.png', 'logo')
-    pic2str('./ui/img/green-led-on.png', 'greenLed')
-    pic2str('./ui/img/red-led-on.png', 'redLed')
\ No newline at end of file
+#
+#   Copyright 2021  Adriano Cofrancesco
+#   Open-Source-Ecosystem-for-Remote-Control is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#   Open-Source-Ecosystem-for-Remote-Control is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+import hashlib
+import os
+
+from AssetBundle import BUNDLE_MAGIC, BUNDLE_VERSION, bundleEntry, bundleFileName, bundleHeader
+
+images = [
+    ('icon_s', 'ui/img/icon_s.png'),
+    ('logo', 'ui/img/devops-infinite.png'),
+    ('greenLed', 'ui/img/green-led-on.png'),
+    ('redLed', 'ui/img/red-led-on.png'),
+]
+
+
+# write all images in one bundle, identical files are stored once.
+# Running it again with the same images leaves the bundle untouched
+def build_bundle(images, bundle_file=bundleFileName):
+    blobs = []
+    blob_index = {}
+    entries = []
+    for name, path in images:
+        with open(path, 'rb') as file:
+            content = file.read()
+
+        digest = hashlib.sha256(content).digest()
+        if digest not in blob_index:
+            blob_index[digest] = len(blobs)
+            blobs.append(content)
+        entries.append((name.encode('utf-8'), blob_index[digest]))
+
+    offset = bundleHeader.size + sum(1 + len(name) + bundleEntry.size for name, blob in entries)
+    blob_offsets = []
+    for content in blobs:
+        blob_offsets.append(offset)
+        offset += len(content)
+
+    data = bytearray(bundleHeader.pack(BUNDLE_MAGIC, BUNDLE_VERSION, len(entries)))
+    for name, blob in entries:
+        data += bytes([len(name)]) + name + bundleEntry.pack(blob_offsets[blob], len(blobs[blob]))
+    for content in blobs:
+        data += content
+
+    try:
+        with open(bundle_file, 'rb') as file:
+            if file.read() == data:
+                return False
+    except FileNotFoundError:
+        pass
+
+    temp_file = bundle_file + '.tmp'
+    with open(temp_file, 'wb') as file:
+        file.write(data)
+    os.replace(temp_file, bundle_file)
+
+    return True
+
+
+if __name__ == '__main__':
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    if build_bundle(images):
+        print("{} written".format(bundleFileName))
+    else:
+        print("{} up to date".format(bundleFileName))
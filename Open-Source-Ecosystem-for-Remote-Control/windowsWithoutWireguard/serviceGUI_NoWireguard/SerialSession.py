@@ -0,0 +1,209 @@
+#
+#   Copyright 2021  Adriano Cofrancesco
+#   Open-Source-Ecosystem-for-Remote-Control is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#   Open-Source-Ecosystem-for-Remote-Control is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+import threading
+import time
+
+from StartupProfile import lazy_import
+
+serial = lazy_import('serial')
+
+
+class SerialSession:
+
+    def __init__(self, com_port, timeout=10, **settings):
+        self.com_port = com_port
+        self.timeout = timeout
+        self.settings = settings
+        self.reopen_attempts = 3
+        self.reopen_sleep = 0.2
+
+        self.serial = None
+        self.read_buffer = bytearray()
+        # in the streaming mode a reader and a writer thread share the port, opening
+        # and closing it are done under this lock
+        self.lock = threading.RLock()
+
+        # per-command latency, in seconds
+        self.command_count = 0
+        self.last_latency = 0.0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+        # hooks called with the session as only argument
+        self.on_open = None
+        self.on_close = None
+        self.on_reconfigure = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def is_open(self):
+        return self.serial is not None and self.serial.is_open
+
+    # open the serial port, the same handle is reused until close() is called
+    def open(self):
+        with self.lock:
+            if self.is_open():
+                return self.serial
+
+            self.serial = serial.Serial(self.com_port, timeout=self.timeout, **self.settings)
+            print("Serial port {} opened".format(self.serial.name))
+
+            if self.on_open is not None:
+                self.on_open(self)
+
+            return self.serial
+
+    # with a handle the port is closed only if it is still that one, another thread
+    # may have reopened it after the failure
+    def close(self, handle=None):
+        with self.lock:
+            if self.serial is None or (handle is not None and handle is not self.serial):
+                return
+
+            try:
+                self.serial.close()
+            except (OSError, serial.SerialException) as e:
+                print("Serial close error: {}".format(e))
+
+            self.serial = None
+            self.read_buffer.clear()
+            print("Serial port {} closed".format(self.com_port))
+
+            if self.on_close is not None:
+                self.on_close(self)
+
+    # change port settings (baudrate, parity, timeout, ...) without reopening the port,
+    # a new com_port forces a reopen
+    def reconfigure(self, com_port=None, **settings):
+        with self.lock:
+            if 'timeout' in settings:
+                self.timeout = settings.pop('timeout')
+            self.settings.update(settings)
+
+            if com_port is not None and com_port != self.com_port:
+                self.close()
+                self.com_port = com_port
+            elif self.is_open():
+                self.serial.apply_settings(dict(self.settings, timeout=self.timeout))
+
+        if self.on_reconfigure is not None:
+            self.on_reconfigure(self)
+
+    # read one line through the session buffer, bytes received after the line terminator
+    # are kept for the next command instead of being dropped
+    def readline(self):
+        ser = self.open()
+        deadline = None
+        if self.timeout is not None:
+            deadline = time.monotonic() + self.timeout
+
+        while True:
+            index = self.read_buffer.find(b'\n')
+            if index >= 0:
+                line = bytes(self.read_buffer[:index + 1])
+                del self.read_buffer[:index + 1]
+                return line
+
+            chunk = ser.read(ser.in_waiting or 1)
+            if chunk:
+                self.read_buffer += chunk
+            if not chunk or (deadline is not None and time.monotonic() >= deadline):
+                # timeout, return what has been received so far like serial.readline()
+                line = bytes(self.read_buffer)
+                self.read_buffer.clear()
+                return line
+
+    # write a command and read one line back, the port is reopened if the adapter failed
+    def transact(self, data):
+        start = time.perf_counter()
+        attempt = 0
+        while True:
+            ser = None
+            try:
+                ser = self.open()
+                ser.write(data + b'\n')
+                line = self.readline()
+                break
+            except (OSError, serial.SerialException) as e:
+                attempt += 1
+                self.recover(e, attempt, ser)
+
+        self.last_latency = time.perf_counter() - start
+        self.command_count += 1
+        self.total_latency += self.last_latency
+        self.max_latency = max(self.max_latency, self.last_latency)
+
+        return line
+
+    # write a command without reading its reply, for the streaming mode where all
+    # the device output is read by read_available()
+    def write(self, data):
+        attempt = 0
+        while True:
+            ser = None
+            try:
+                ser = self.open()
+                ser.write(data + b'\n')
+                return
+            except (OSError, serial.SerialException) as e:
+                attempt += 1
+                self.recover(e, attempt, ser)
+
+    # what the device sent so far, solicited or not: at least one byte unless the
+    # port timed out or the read was cancelled, a failed port is closed before the error
+    # goes up and reopened by the next read
+    def read_available(self):
+        with self.lock:
+            ser = self.open()
+            if self.read_buffer:
+                data = bytes(self.read_buffer)
+                self.read_buffer.clear()
+                return data
+
+        # the lock is not held while blocked, writes go on meanwhile
+        try:
+            return ser.read(ser.in_waiting or 1)
+        except (OSError, serial.SerialException):
+            self.close(ser)
+            raise
+
+    # wake up a read_available() blocked in another thread
+    def cancel_read(self):
+        with self.lock:
+            if self.serial is not None and hasattr(self.serial, 'cancel_read'):
+                self.serial.cancel_read()
+
+    # the failed handle is closed and the port reopened by the next operation, after
+    # reopen_attempts failures in a row the error goes up
+    def recover(self, error, attempt, handle=None):
+        print("Serial error on {}: {}".format(self.com_port, error))
+        if handle is not None:
+            self.close(handle)
+        if attempt > self.reopen_attempts:
+            raise error
+        time.sleep(self.reopen_sleep)
+
+    def latency_stats(self):
+        average = self.total_latency / self.command_count if self.command_count else 0.0
+        return {
+            'commands': self.command_count,
+            'last_ms': self.last_latency * 1000,
+            'avg_ms': average * 1000,
+            'max_ms': self.max_latency * 1000,
+        }
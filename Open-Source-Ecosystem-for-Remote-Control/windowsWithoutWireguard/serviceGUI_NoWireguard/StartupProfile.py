@@ -0,0 +1,133 @@
+#
+#   Copyright 2021  Adriano Cofrancesco
+#   Open-Source-Ecosystem-for-Remote-Control is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#   Open-Source-Ecosystem-for-Remote-Control is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+import builtins
+import sys
+import threading
+import time
+
+profileFlag = '--profile-startup'
+
+
+# module imported on first attribute access. Attributes are copied on the proxy
+# once read, so later accesses cost as much as on the real module
+class LazyModule:
+
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+
+    def __getattr__(self, attribute):
+        module = self._module
+        if module is None:
+            # through builtins.__import__ so the startup profile sees it
+            __import__(self._name)
+            module = self.__dict__['_module'] = sys.modules[self._name]
+
+        value = getattr(module, attribute)
+        self.__dict__[attribute] = value
+        return value
+
+    def __repr__(self):
+        return "<lazy module {}>".format(self._name)
+
+
+def lazy_import(name):
+    return sys.modules.get(name) or LazyModule(name)
+
+
+# time spent in every import and in the init steps of an entry point, printed
+# once the entry point is ready. Disabled it only costs a flag check per call
+class StartupProfile:
+
+    def __init__(self, enabled=False, name=None):
+        self.enabled = enabled
+        self.name = name or sys.argv[0]
+        self.min_ms = 0.5
+        self.started = time.perf_counter()
+        self.last_mark = self.started
+        self.imports = []
+        self.steps = []
+        self.local = threading.local()
+        self.original_import = None
+        self.reported = False
+
+    def start(self):
+        if self.enabled and self.original_import is None:
+            self.original_import = builtins.__import__
+            builtins.__import__ = self.timed_import
+
+    def stop(self):
+        if self.original_import is not None:
+            builtins.__import__ = self.original_import
+            self.original_import = None
+
+    # only the first import of a module is timed, nested imports are indented under it
+    def timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level or name in sys.modules:
+            return self.original_import(name, globals, locals, fromlist, level)
+
+        depth = getattr(self.local, 'depth', 0)
+        entry = [name, depth, 0, threading.current_thread().name]
+        self.imports.append(entry)
+        self.local.depth = depth + 1
+        start = time.perf_counter()
+        try:
+            return self.original_import(name, globals, locals, fromlist, level)
+        finally:
+            entry[2] = time.perf_counter() - start
+            self.local.depth = depth
+
+    # time since the previous mark
+    def mark(self, step):
+        if not self.enabled or self.reported:
+            return
+        now = time.perf_counter()
+        self.steps.append((step, now - self.last_mark))
+        self.last_mark = now
+
+    def report(self, step='ready'):
+        if not self.enabled or self.reported:
+            return
+        self.mark(step)
+        self.reported = True
+        self.stop()
+
+        print("Startup profile of {}".format(self.name))
+        print("  imports (ms, cumulative)")
+        for name, depth, seconds, thread in self.imports:
+            if seconds * 1000 >= self.min_ms:
+                suffix = "" if thread == 'MainThread' else "  [{}]".format(thread)
+                print("  {:>9.2f}  {}{}{}".format(seconds * 1000, "  " * depth, name, suffix))
+        print("  steps (ms)")
+        for step, seconds in self.steps:
+            print("  {:>9.2f}  {}".format(seconds * 1000, step))
+        print("  {:>9.2f}  total".format((self.last_mark - self.started) * 1000))
+
+
+profile = None
+
+
+# the profile shared by all modules of the process, enabled by --profile-startup.
+# The flag is removed from sys.argv so the entry points parse their arguments as usual
+def startup_profile():
+    global profile
+    if profile is None:
+        enabled = profileFlag in sys.argv
+        if enabled:
+            sys.argv.remove(profileFlag)
+        profile = StartupProfile(enabled)
+        profile.start()
+
+    return profile